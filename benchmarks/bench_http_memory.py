@@ -0,0 +1,136 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of INSPIRE-MITMPROXY.
+# Copyright (C) 2018 CERN.
+#
+# INSPIRE is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# INSPIRE is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with INSPIRE. If not, see <http://www.gnu.org/licenses/>.
+#
+# In applying this license, CERN does not waive the privileges and immunities
+# granted to it by virtue of its status as an Intergovernmental Organization
+# or submit itself to any jurisdiction.
+
+"""Benchmark the memory held by cached requests and responses.
+
+Compares the wrappers of :mod:`inspire_mitmproxy.http` with plain objects storing the same
+fields in a per-instance ``__dict__`` and headers in a dict of lists, which is how they used to
+be stored. Each interaction is parsed from its own YAML document, as when loading scenarios from
+disk. Run with::
+
+    python benchmarks/bench_http_memory.py --interactions 20000
+"""
+
+from argparse import ArgumentParser
+from copy import copy
+from gc import collect
+from tracemalloc import get_traced_memory, start, stop
+
+from inspire_mitmproxy.http import MITMRequest, MITMResponse
+from inspire_mitmproxy.interaction import dump_yaml, load_yaml
+
+
+class DictHeaders:
+    def __init__(self, headers):
+        self.headers = {}
+        for header_name, header_value in headers.items():
+            self.headers[header_name.title()] = copy(header_value)
+
+
+class DictRequest:
+    def __init__(self, request):
+        self.url = request['url']
+        self.method = request['method']
+        self.headers = DictHeaders(request['headers'])
+        self.http_version = 'HTTP/1.1'
+        self.original_encoding = 'utf-8'
+        self.body = request['body'].encode('utf-8')
+
+
+class DictResponse:
+    def __init__(self, response):
+        self.status_code = response['status']['code']
+        self.status_message = response['status']['message']
+        self.headers = DictHeaders(response['headers'])
+        self.http_version = 'HTTP/1.1'
+        self.original_encoding = 'utf-8'
+        self.body_path = None
+        self.body = response['body'].encode('utf-8')
+
+
+def make_interaction_yaml(number: int) -> str:
+    return dump_yaml({
+        'request': {
+            'method': 'GET',
+            'url': f'https://inspirehep.net/api/literature/{number}',
+            'body': '',
+            'headers': {
+                'Host': ['inspirehep.net'],
+                'Accept': ['application/json'],
+                'Accept-Encoding': ['gzip, deflate'],
+                'Connection': ['keep-alive'],
+                'User-Agent': ['python-requests/2.18.4'],
+            },
+        },
+        'response': {
+            'status': {'code': 200, 'message': 'OK'},
+            'body': f'{{"id": {number}, "titles": [{{"title": "Record {number}"}}]}}',
+            'headers': {
+                'Content-Type': ['application/json'],
+                'Content-Length': ['52'],
+                'Date': ['Fri, 01 Jun 2018 12:00:00 GMT'],
+                'Server': ['nginx'],
+                'Vary': ['Accept-Encoding', 'Origin'],
+            },
+        },
+    })
+
+
+def load_slots(interaction_yaml: str):
+    interaction = load_yaml(interaction_yaml)
+    return (
+        MITMRequest.from_dict(interaction['request']),
+        MITMResponse.from_dict(interaction['response']),
+    )
+
+
+def load_dict_backed(interaction_yaml: str):
+    interaction = load_yaml(interaction_yaml)
+    return DictRequest(interaction['request']), DictResponse(interaction['response'])
+
+
+def measure(load, documents) -> int:
+    collect()
+    start()
+    loaded = [load(document) for document in documents]
+    collect()
+    current, _ = get_traced_memory()
+    stop()
+    del loaded
+    return current
+
+
+def main():
+    parser = ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--interactions', type=int, default=20000, help='interactions to hold')
+    args = parser.parse_args()
+
+    documents = [make_interaction_yaml(number) for number in range(args.interactions)]
+
+    for label, load in [('dict-backed', load_dict_backed), ('inspire_mitmproxy.http', load_slots)]:
+        size = measure(load, documents)
+        print(f'{label:<24} {size / 1024 / 1024:8.1f} MB  '
+              f'{size / args.interactions:8.0f} B/interaction')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,92 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of INSPIRE-MITMPROXY.
+# Copyright (C) 2018 CERN.
+#
+# INSPIRE is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# INSPIRE is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with INSPIRE. If not, see <http://www.gnu.org/licenses/>.
+#
+# In applying this license, CERN does not waive the privileges and immunities
+# granted to it by virtue of its status as an Intergovernmental Organization
+# or submit itself to any jurisdiction.
+
+
+"""Benchmark the latency of requests to the Management Service API.
+
+Sends requests to the most used endpoints of the Management Service, the same way the
+dispatcher does, and reports latency percentiles for each of them. Run with::
+
+    python benchmarks/bench_management_api.py --requests 2000
+"""
+
+from argparse import ArgumentParser
+from statistics import median
+from time import perf_counter
+from typing import Optional
+
+from inspire_mitmproxy.dispatcher import Dispatcher
+from inspire_mitmproxy.http import MITMHeaders, MITMRequest
+
+
+ENDPOINTS = [
+    ('GET', '/version', None),
+    ('GET', '/config', None),
+    ('PUT', '/config', '{"active_scenario": "default"}'),
+    ('GET', '/services', None),
+    ('GET', '/callbacks', None),
+]
+
+
+def make_request(method: str, path: str, body: Optional[str] = None) -> MITMRequest:
+    return MITMRequest(
+        method=method,
+        url='http://mitm-manager.local' + path,
+        body=body,
+        headers=MITMHeaders({
+            'Host': ['mitm-manager.local'],
+            'Accept': ['application/json'],
+        }),
+    )
+
+
+def measure(dispatcher: Dispatcher, request: MITMRequest, number: int) -> list:
+    timings = []
+    for _ in range(number):
+        start = perf_counter()
+        dispatcher.process_request(request)
+        timings.append(perf_counter() - start)
+
+    return sorted(timings)
+
+
+def main():
+    parser = ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--requests', type=int, default=2000, help='requests per endpoint')
+    args = parser.parse_args()
+
+    start = perf_counter()
+    dispatcher = Dispatcher()
+    print(f'startup: {(perf_counter() - start) * 1000:.1f} ms')
+    print(f'{"endpoint":<18} {"median":>10} {"p99":>10} {"max":>10}')
+
+    for method, path, body in ENDPOINTS:
+        timings = measure(dispatcher, make_request(method, path, body), args.requests)
+        p99 = timings[int(len(timings) * 0.99)]
+        print(
+            f'{method + " " + path:<18} '
+            f'{median(timings) * 1e6:8.1f} us {p99 * 1e6:8.1f} us {timings[-1] * 1e6:8.1f} us'
+        )
+
+
+if __name__ == '__main__':
+    main()
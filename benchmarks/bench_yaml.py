@@ -0,0 +1,128 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of INSPIRE-MITMPROXY.
+# Copyright (C) 2018 CERN.
+#
+# INSPIRE is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# INSPIRE is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with INSPIRE. If not, see <http://www.gnu.org/licenses/>.
+#
+# In applying this license, CERN does not waive the privileges and immunities
+# granted to it by virtue of its status as an Intergovernmental Organization
+# or submit itself to any jurisdiction.
+
+
+"""Benchmark loading and dumping of interactions with large bodies.
+
+Compares the pure-Python PyYAML loader and dumper with the ones used by
+:mod:`inspire_mitmproxy.interaction` (libyaml based, when available), on an interaction with
+a recorded arXiv OAI-PMH response. Run with::
+
+    python benchmarks/bench_yaml.py --size-mb 5
+"""
+
+from argparse import ArgumentParser
+from timeit import repeat
+
+from yaml import SafeDumper, SafeLoader
+from yaml import __with_libyaml__ as WITH_LIBYAML
+from yaml import dump as yaml_dump
+from yaml import load as yaml_load
+
+from inspire_mitmproxy.http import MITMHeaders, MITMRequest, MITMResponse
+from inspire_mitmproxy.interaction import (
+    Interaction,
+    InteractionDumper,
+    InteractionLoader,
+    dump_yaml,
+    load_yaml
+)
+
+
+OAI_RECORD = '''
+  <record>
+    <header>
+      <identifier>oai:arXiv.org:{number:04d}.{number:05d}</identifier>
+      <datestamp>2018-06-01</datestamp>
+      <setSpec>physics:hep-th</setSpec>
+    </header>
+    <metadata>
+      <arXiv xmlns="http://arxiv.org/OAI/arXiv/">
+        <id>{number:04d}.{number:05d}</id>
+        <title>On the renormalization of theory number {number}</title>
+        <abstract>We study the &quot;model&quot; in d = 4 - 2&#949; dimensions and show
+        that the one-loop corrections cancel for all values of the coupling.</abstract>
+      </arXiv>
+    </metadata>
+  </record>'''
+
+
+def make_oai_pmh_body(size: int) -> str:
+    records = []
+    length = 0
+    number = 0
+
+    while length < size:
+        record = OAI_RECORD.format(number=number)
+        records.append(record)
+        length += len(record)
+        number += 1
+
+    return '<?xml version="1.0" encoding="UTF-8"?>\n<OAI-PMH><ListRecords>' \
+        + ''.join(records) + '\n</ListRecords></OAI-PMH>\n'
+
+
+def make_interaction(size: int) -> Interaction:
+    return Interaction(
+        name='interaction_0',
+        request=MITMRequest(
+            url='http://export.arxiv.org/oai2?verb=ListRecords&set=physics:hep-th',
+            headers=MITMHeaders({'Host': ['export.arxiv.org']}),
+        ),
+        response=MITMResponse(
+            body=make_oai_pmh_body(size),
+            headers=MITMHeaders({'Content-Type': ['text/xml; charset=utf-8']}),
+        ),
+    )
+
+
+def best_of(function, repetitions: int) -> float:
+    return min(repeat(function, number=1, repeat=repetitions))
+
+
+def main():
+    parser = ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--size-mb', type=float, default=5, help='size of the response body')
+    parser.add_argument('--repeat', type=int, default=3, help='repetitions, best one is kept')
+    args = parser.parse_args()
+
+    interaction_dict = make_interaction(int(args.size_mb * 1024 * 1024)).to_dict()
+    yaml_string = dump_yaml(interaction_dict)
+
+    print(f'libyaml available: {WITH_LIBYAML}')
+    print(f'interaction file size: {len(yaml_string) / 1024 / 1024:.1f} MB')
+    print(f'using {InteractionLoader.__bases__[0].__name__}, '
+          f'{InteractionDumper.__bases__[0].__name__}')
+
+    timings = [
+        ('load (pure python)', lambda: yaml_load(yaml_string, Loader=SafeLoader)),
+        ('load (interaction)', lambda: load_yaml(yaml_string)),
+        ('dump (pure python)', lambda: yaml_dump(interaction_dict, Dumper=SafeDumper)),
+        ('dump (interaction)', lambda: dump_yaml(interaction_dict)),
+    ]
+
+    for label, function in timings:
+        print(f'{label:<20} {best_of(function, args.repeat):8.3f} s')
+
+
+if __name__ == '__main__':
+    main()
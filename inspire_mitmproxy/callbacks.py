@@ -0,0 +1,490 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of INSPIRE-MITMPROXY.
+# Copyright (C) 2018 CERN.
+#
+# INSPIRE is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# INSPIRE is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with INSPIRE. If not, see <http://www.gnu.org/licenses/>.
+#
+# In applying this license, CERN does not waive the privileges and immunities
+# granted to it by virtue of its status as an Intergovernmental Organization
+# or submit itself to any jurisdiction.
+
+"""Engines running the callbacks of replayed interactions.
+
+Two engines are available, and the one in use is selected with the ``callback_engine`` key of
+the Management Service config:
+
+``threads`` (default)
+    Callbacks are run after a delay, on a bounded pool of worker threads. Pending callbacks wait
+    in a heap ordered by due time, which a single scheduler thread watches.
+
+``asyncio``
+    Callbacks are scheduled with ``call_later`` on an event loop running in its own thread, and
+    sent with :mod:`aiohttp`, so pending callbacks cost no threads. Without :mod:`aiohttp`
+    (``pip install inspire-mitmproxy[async]``), requests are sent from the default executor of
+    the loop.
+
+The engines are configured through environment variables:
+
+``MITM_PROXY_CALLBACK_WORKERS``
+    number of callbacks executed concurrently by the ``threads`` engine (default: 8)
+
+``MITM_PROXY_CALLBACK_MAX_PENDING``
+    number of callbacks which can be scheduled or running at the same time, further callbacks
+    are dropped and logged as errors (default: 1000)
+
+Callback requests are sent through pools of keep-alive sessions, one pool for each host,
+configured through:
+
+``MITM_PROXY_CALLBACK_POOL_SIZE``
+    number of idle sessions, each with its connection, kept open to each host (default: same as
+    the number of workers)
+
+``MITM_PROXY_CALLBACK_KEEP_ALIVE``
+    set to ``0`` to close the connection after each callback (default: 1)
+"""
+
+from abc import ABC, abstractmethod
+from asyncio import AbstractEventLoop, new_event_loop, set_event_loop
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from heapq import heappop, heappush
+from http.cookiejar import DefaultCookiePolicy
+from itertools import count
+from logging import getLogger
+from os import environ
+from os.path import expandvars
+from pprint import pformat
+from threading import Condition, Lock, Thread
+from time import monotonic
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple, Union
+from urllib.parse import urlsplit
+
+from requests import Response, Session
+from requests.adapters import HTTPAdapter
+
+from .http import MITMRequest, response_to_string
+
+
+try:
+    import aiohttp
+except ImportError:
+    aiohttp = None
+
+
+logger = getLogger(__name__)
+
+DEFAULT_WORKERS = 8
+DEFAULT_MAX_PENDING = 1000
+DEFAULT_CALLBACK_ENGINE = 'threads'
+
+
+def callback_request_params(request: MITMRequest) -> Dict[str, Any]:
+    """Parameters of the callback request, with environment variables expanded."""
+    return dict(
+        method=request.method,
+        url=expandvars(request.url),
+        data=request.body,
+        headers={
+            key: expandvars(request.headers[key])
+            for key in request.headers.keys()
+        },
+        timeout=10,
+    )
+
+
+def send_callback(request: MITMRequest):
+    request_params = callback_request_params(request)
+    logger.warning("Executing callback:\n%s", pformat(request_params))
+
+    response = get_session_pool().request(**request_params)
+    if not response.ok:
+        logger.error("Error executing callback:\n%s", response_to_string(response))
+
+
+async def send_callback_with_aiohttp(session: 'aiohttp.ClientSession', request: MITMRequest):
+    request_params = callback_request_params(request)
+    logger.warning("Executing callback:\n%s", pformat(request_params))
+
+    request_params['timeout'] = aiohttp.ClientTimeout(total=request_params['timeout'])
+    async with session.request(**request_params) as response:
+        if response.status >= 400:
+            logger.error(
+                "Error executing callback:\n%s %s %s\n%s",
+                request_params['method'],
+                request_params['url'],
+                response.status,
+                await response.text(),
+            )
+
+
+class CallbackEngine(ABC):
+    """Base for engines, keeping count of the callbacks."""
+    name = ''
+
+    def __init__(self, max_pending: int = DEFAULT_MAX_PENDING) -> None:
+        self.max_pending = max_pending
+
+        self._stats_lock = Lock()
+        self._pending = 0
+        self._completed = 0
+        self._failed = 0
+        self._rejected = 0
+
+    @abstractmethod
+    def schedule_callback(self, delay: Union[int, float], request: MITMRequest) -> bool:
+        """Send the callback request after ``delay`` seconds.
+
+        Returns whether the callback was scheduled: if ``max_pending`` callbacks are already
+        pending, it is dropped.
+        """
+
+    def _reserve(self, callback: Any) -> bool:
+        with self._stats_lock:
+            if self._pending >= self.max_pending:
+                self._rejected += 1
+                logger.error(
+                    'Dropping callback %r: %d callbacks already pending',
+                    callback,
+                    self._pending,
+                )
+                return False
+            self._pending += 1
+            return True
+
+    def _release(self, failed: bool):
+        with self._stats_lock:
+            self._pending -= 1
+            if failed:
+                self._failed += 1
+            else:
+                self._completed += 1
+
+    def stats(self) -> Dict[str, Any]:
+        with self._stats_lock:
+            return {
+                'engine': self.name,
+                'max_pending': self.max_pending,
+                'pending': self._pending,
+                'completed': self._completed,
+                'failed': self._failed,
+                'rejected': self._rejected,
+            }
+
+
+class CallbackScheduler(CallbackEngine):
+    name = 'threads'
+
+    def __init__(self, workers: int = DEFAULT_WORKERS, max_pending: int = DEFAULT_MAX_PENDING) \
+            -> None:
+        super(CallbackScheduler, self).__init__(max_pending=max_pending)
+        self.workers = workers
+
+        self._condition = Condition()
+        self._heap: List[Tuple[float, int, Callable, tuple]] = []
+        self._sequence = count()
+        self._executor = ThreadPoolExecutor(
+            max_workers=workers,
+            thread_name_prefix='inspire-mitmproxy-callback',
+        )
+        self._thread: Optional[Thread] = None
+
+    def schedule(self, delay: Union[int, float], function: Callable, *args: Any) -> bool:
+        """Run ``function(*args)`` after ``delay`` seconds.
+
+        Returns whether the callback was scheduled: if ``max_pending`` callbacks are already
+        pending, it is dropped.
+        """
+        if not self._reserve(function):
+            return False
+
+        with self._condition:
+            if self._thread is None:
+                self._thread = Thread(
+                    target=self._dispatch_due_callbacks,
+                    name='inspire-mitmproxy-callback-scheduler',
+                    daemon=True,
+                )
+                self._thread.start()
+
+            heappush(self._heap, (monotonic() + delay, next(self._sequence), function, args))
+            self._condition.notify()
+
+        return True
+
+    def schedule_callback(self, delay: Union[int, float], request: MITMRequest) -> bool:
+        return self.schedule(delay, send_callback, request)
+
+    def _dispatch_due_callbacks(self):
+        with self._condition:
+            while True:
+                if not self._heap:
+                    self._condition.wait()
+                    continue
+
+                time_left = self._heap[0][0] - monotonic()
+                if time_left > 0:
+                    self._condition.wait(time_left)
+                    continue
+
+                _, _, function, args = heappop(self._heap)
+                self._executor.submit(self._run, function, args)
+
+    def _run(self, function: Callable, args: tuple):
+        try:
+            function(*args)
+        except Exception:
+            logger.exception('Error executing callback %r', function)
+            self._release(failed=True)
+        else:
+            self._release(failed=False)
+
+    def stats(self) -> Dict[str, Any]:
+        stats = super(CallbackScheduler, self).stats()
+        stats['workers'] = self.workers
+        return stats
+
+
+class AsyncCallbackEngine(CallbackEngine):
+    name = 'asyncio'
+
+    def __init__(self, pool_size: int = DEFAULT_WORKERS, max_pending: int = DEFAULT_MAX_PENDING) \
+            -> None:
+        super(AsyncCallbackEngine, self).__init__(max_pending=max_pending)
+        self.pool_size = pool_size
+
+        self._loop: Optional[AbstractEventLoop] = None
+        self._loop_lock = Lock()
+        self._http_session: Optional['aiohttp.ClientSession'] = None
+
+    @property
+    def loop(self) -> AbstractEventLoop:
+        """The event loop of the engine, started on first use."""
+        with self._loop_lock:
+            if self._loop is None:
+                self._loop = new_event_loop()
+                Thread(
+                    target=self._run_loop,
+                    name='inspire-mitmproxy-callback-loop',
+                    daemon=True,
+                ).start()
+
+            return self._loop
+
+    def _run_loop(self):
+        set_event_loop(self._loop)
+        self._loop.run_forever()
+
+    def schedule_callback(self, delay: Union[int, float], request: MITMRequest) -> bool:
+        if not self._reserve(request):
+            return False
+
+        loop = self.loop
+        loop.call_soon_threadsafe(loop.call_later, delay, self._start, request)
+        return True
+
+    def _start(self, request: MITMRequest):
+        self.loop.create_task(self._send(request))
+
+    async def _send(self, request: MITMRequest):
+        try:
+            if aiohttp is None:
+                await self.loop.run_in_executor(None, send_callback, request)
+            else:
+                await send_callback_with_aiohttp(self._get_http_session(), request)
+        except Exception:
+            logger.exception('Error executing callback %r', request)
+            self._release(failed=True)
+        else:
+            self._release(failed=False)
+
+    def _get_http_session(self) -> 'aiohttp.ClientSession':
+        if self._http_session is None:
+            self._http_session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit_per_host=self.pool_size),
+                cookie_jar=aiohttp.DummyCookieJar(),
+            )
+
+        return self._http_session
+
+
+class SessionPool:
+    """Keep-alive sessions sending callbacks, pooled by scheme and host.
+
+    :class:`requests.Session` is not guaranteed to be thread-safe, so a session only sends one
+    callback at a time: callbacks take an idle session of their host (or a new one), and give it
+    back once done. Up to ``pool_size`` idle sessions, with their connection, are kept per host.
+    Sessions do not store cookies, so that callbacks stay independent from each other.
+    """
+    def __init__(self, pool_size: int = DEFAULT_WORKERS, keep_alive: bool = True) -> None:
+        self.pool_size = pool_size
+        self.keep_alive = keep_alive
+
+        self._lock = Lock()
+        self._idle_sessions: Dict[str, List[Session]] = {}
+        self._requests: Dict[str, int] = {}
+
+    @contextmanager
+    def session(self, url: str) -> Iterator[Session]:
+        """Session for the scheme and host of the URL, used by nobody else until released."""
+        parsed_url = urlsplit(url)
+        key = f'{parsed_url.scheme}://{parsed_url.netloc}'
+
+        with self._lock:
+            self._requests[key] = self._requests.get(key, 0) + 1
+            idle_sessions = self._idle_sessions.setdefault(key, [])
+            session = idle_sessions.pop() if idle_sessions else self._create_session()
+
+        try:
+            yield session
+        finally:
+            with self._lock:
+                idle_sessions = self._idle_sessions[key]
+                keep = len(idle_sessions) < self.pool_size
+                if keep:
+                    idle_sessions.append(session)
+
+            if not keep:
+                session.close()
+
+    def _create_session(self) -> Session:
+        session = Session()
+        session.cookies.set_policy(DefaultCookiePolicy(allowed_domains=[]))
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=1)
+        session.mount('http://', adapter)
+        session.mount('https://', adapter)
+        if not self.keep_alive:
+            session.headers['Connection'] = 'close'
+
+        return session
+
+    def request(self, method: str, url: str, **kwargs: Any) -> Response:
+        with self.session(url) as session:
+            return session.request(method=method, url=url, **kwargs)
+
+    @staticmethod
+    def _count_connections(adapter: HTTPAdapter) -> int:
+        pools = adapter.poolmanager.pools
+        return sum(
+            getattr(pools.get(pool_key), 'num_connections', 0)
+            for pool_key in pools.keys()
+        )
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            hosts = {
+                key: {
+                    'requests': self._requests[key],
+                    'connections': sum(
+                        self._count_connections(adapter)
+                        for session in idle_sessions
+                        for adapter in set(session.adapters.values())
+                        if isinstance(adapter, HTTPAdapter)
+                    ),
+                }
+                for key, idle_sessions in self._idle_sessions.items()
+            }
+
+        return {
+            'pool_size': self.pool_size,
+            'keep_alive': self.keep_alive,
+            'hosts': hosts,
+        }
+
+
+def _get_pool_size() -> int:
+    return int(environ.get(
+        'MITM_PROXY_CALLBACK_POOL_SIZE',
+        environ.get('MITM_PROXY_CALLBACK_WORKERS', DEFAULT_WORKERS),
+    ))
+
+
+def _get_max_pending() -> int:
+    return int(environ.get('MITM_PROXY_CALLBACK_MAX_PENDING', DEFAULT_MAX_PENDING))
+
+
+_scheduler: Optional[CallbackScheduler] = None
+_scheduler_lock = Lock()
+
+
+def get_callback_scheduler() -> CallbackScheduler:
+    """The ``threads`` engine, configured from the environment."""
+    global _scheduler
+
+    with _scheduler_lock:
+        if _scheduler is None:
+            _scheduler = CallbackScheduler(
+                workers=int(environ.get('MITM_PROXY_CALLBACK_WORKERS', DEFAULT_WORKERS)),
+                max_pending=_get_max_pending(),
+            )
+
+        return _scheduler
+
+
+_async_engine: Optional[AsyncCallbackEngine] = None
+_async_engine_lock = Lock()
+
+
+def get_async_callback_engine() -> AsyncCallbackEngine:
+    """The ``asyncio`` engine, configured from the environment."""
+    global _async_engine
+
+    with _async_engine_lock:
+        if _async_engine is None:
+            _async_engine = AsyncCallbackEngine(
+                pool_size=_get_pool_size(),
+                max_pending=_get_max_pending(),
+            )
+
+        return _async_engine
+
+
+CALLBACK_ENGINES: Dict[str, Callable[[], CallbackEngine]] = {
+    'threads': get_callback_scheduler,
+    'asyncio': get_async_callback_engine,
+}
+
+_engine_name = DEFAULT_CALLBACK_ENGINE
+
+
+def set_callback_engine(name: str):
+    """Select the engine running new callbacks, pending ones are run by the previous engine."""
+    global _engine_name
+
+    if name not in CALLBACK_ENGINES:
+        raise ValueError(f'Unknown callback engine {name!r}, use one of {sorted(CALLBACK_ENGINES)}')
+
+    _engine_name = name
+
+
+def get_callback_engine() -> CallbackEngine:
+    return CALLBACK_ENGINES[_engine_name]()
+
+
+_session_pool: Optional[SessionPool] = None
+_session_pool_lock = Lock()
+
+
+def get_session_pool() -> SessionPool:
+    """The sessions used to send callbacks of interactions, configured from the environment."""
+    global _session_pool
+
+    with _session_pool_lock:
+        if _session_pool is None:
+            _session_pool = SessionPool(
+                pool_size=_get_pool_size(),
+                keep_alive=environ.get('MITM_PROXY_CALLBACK_KEEP_ALIVE', '1') != '0',
+            )
+
+        return _session_pool
@@ -23,16 +23,20 @@
 """Dispatcher forwards requests to Services."""
 
 from logging import getLogger
-from typing import List, Optional
+from os import environ
+from pathlib import Path
+from typing import List, MutableMapping, Optional
+from weakref import WeakKeyDictionary
 
 from mitmproxy.http import HTTPFlow, HTTPResponse
 
 from .errors import DoNotIntercept, NoServicesForRequest
-from .http import MITMRequest, MITMResponse
+from .http import LazyMITMRequest, LazyMITMResponse, MITMRequest, MITMResponse
 from .service_list import ServiceList
 from .services.base_service import BaseService
 from .services.management_service import ManagementService
 from .services.whitelist_service import WhitelistService
+from .watcher import DEFAULT_POLL_INTERVAL, ScenariosWatcher, start_watcher
 
 
 logger = getLogger(__name__)
@@ -63,11 +67,39 @@ class Dispatcher:
         mgmt_service = ManagementService(self.services)
         self.services.prepend(mgmt_service)
 
-    def find_service_for_request(self, request: MITMRequest) -> BaseService:
+        # Requests converted in `request`, to be reused in `response`. Not stored in the
+        # flow.metadata, as mitmproxy only allows primitive values there.
+        self.requests_by_flow: MutableMapping[HTTPFlow, MITMRequest] = WeakKeyDictionary()
+
+        self.watcher = self.start_watcher()
+
+    def start_watcher(self) -> Optional[ScenariosWatcher]:
+        """Watch the scenarios for changes, if enabled (see :mod:`inspire_mitmproxy.watcher`)."""
+        method = environ.get('MITM_PROXY_WATCH_SCENARIOS', '0')
+        if method == '0':
+            return None
+
+        path = Path(environ.get('SCENARIOS_PATH', './scenarios/'))
+        try:
+            return start_watcher(
+                path,
+                self.refresh_changed_path,
+                method=method,
+                interval=float(environ.get('MITM_PROXY_WATCH_INTERVAL', DEFAULT_POLL_INTERVAL)),
+            )
+        except OSError as e:
+            logger.warning('Not watching %s for changes: %s', path, e)
+            return None
+
+    def refresh_changed_path(self, path: Path):
         for service in self.services:
-            if service.handles_request(request):
-                return service
-        raise NoServicesForRequest(request)
+            service.refresh_changed_path(path)
+
+    def find_service_for_request(self, request: MITMRequest) -> BaseService:
+        service = self.services.find_service_for_request(request)
+        if service is None:
+            raise NoServicesForRequest(request)
+        return service
 
     def process_request(self, request: MITMRequest) -> MITMResponse:
         """Perform operations and give response."""
@@ -82,12 +114,13 @@ class Dispatcher:
     def request(self, flow: HTTPFlow):
         """MITMProxy addon event interface for outgoing request."""
         try:
-            request = MITMRequest.from_mitmproxy(flow.request)
+            request = LazyMITMRequest(flow.request)
+            self.requests_by_flow[flow] = request
             response = self.process_request(request).to_mitmproxy()
             flow.response = response
         except DoNotIntercept as e:
             # Let the request pass through, by not interrupting the flow, but log it
-            logger.warning(str(e))
+            logger.warning('%s', e)
         except Exception as e:
             flow.response = HTTPResponse.make(
                 status_code=getattr(e, 'http_status_code', 500),
@@ -96,9 +129,13 @@ class Dispatcher:
             )
 
     def response(self, flow: HTTPFlow):
+        """MITMProxy addon event interface for incoming response."""
+        request = self.requests_by_flow.pop(flow, None)
+
         if self.is_flow_passed_through(flow):
-            request = MITMRequest.from_mitmproxy(flow.request)
-            response = MITMResponse.from_mitmproxy(flow.response)
+            if request is None:
+                request = LazyMITMRequest(flow.request)
+            response = LazyMITMResponse(flow.response)
             self.process_response(request, response)
 
     @staticmethod
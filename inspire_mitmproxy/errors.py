@@ -27,9 +27,22 @@ from typing import Optional
 from .http import MITMRequest
 
 
+def _restore_error(error_class, args, state):
+    """Rebuild an unpickled error, without calling its ``__init__``."""
+    error = error_class.__new__(error_class)
+    error.args = args
+    error.__dict__.update(state)
+    return error
+
+
 class MITMProxyHTTPError(Exception):
     http_status_code = 500
 
+    def __reduce__(self):
+        # Errors take other arguments than their message, so that they cannot be rebuilt through
+        # __init__ when unpickled (e.g. when raised in a worker process).
+        return _restore_error, (self.__class__, self.args, self.__dict__)
+
 
 class NoServicesForRequest(MITMProxyHTTPError):
     def __init__(self, request: MITMRequest) -> None:
@@ -61,8 +74,13 @@ class InvalidRequest(MITMProxyHTTPError):
 
 class DoNotIntercept(Exception):
     def __init__(self, service_name: str, request: MITMRequest) -> None:
-        message = f"Allow request {request} in {service_name} to pass through to the outside"
-        super().__init__(message)
+        # Raised for every request passed through: the message is only built when needed
+        self.service_name = service_name
+        self.request = request
+        super().__init__(service_name, request)
+
+    def __str__(self) -> str:
+        return f"Allow request {self.request} in {self.service_name} to pass through to the outside"
 
 
 class NoMatchingRecording(MITMProxyHTTPError):
@@ -82,6 +100,14 @@ class ScenarioNotInService(MITMProxyHTTPError):
         super().__init__(message)
 
 
+class InvalidMatchRule(MITMProxyHTTPError):
+    def __init__(self, interaction_name: str, field: str, regex: str, reason: str) -> None:
+        self.http_status_code = 500
+        message = f"Invalid regex {regex!r} for field {field} in interaction " \
+            f"{interaction_name}: {reason}"
+        super().__init__(message)
+
+
 class InvalidServiceType(MITMProxyHTTPError):
     def __init__(self, service_type: str) -> None:
         self.http_status_code = 400
@@ -0,0 +1,116 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of INSPIRE-MITMPROXY.
+# Copyright (C) 2018 CERN.
+#
+# INSPIRE is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# INSPIRE is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with INSPIRE. If not, see <http://www.gnu.org/licenses/>.
+#
+# In applying this license, CERN does not waive the privileges and immunities
+# granted to it by virtue of its status as an Intergovernmental Organization
+# or submit itself to any jurisdiction.
+
+
+"""Lookup of hosts in a set of host names and wildcard patterns."""
+
+from typing import Dict, Generic, List, Optional, TypeVar
+
+
+T = TypeVar('T')
+
+
+WILDCARD_LABEL = '*'
+WILDCARD_PREFIX = WILDCARD_LABEL + '.'
+
+
+def check_host_pattern(pattern: str):
+    """Raise :exc:`ValueError` unless the pattern is a host name, ``*``, or ``*.`` a host name."""
+    if pattern == WILDCARD_LABEL:
+        return
+
+    name = pattern[len(WILDCARD_PREFIX):] if pattern.startswith(WILDCARD_PREFIX) else pattern
+    if not name or WILDCARD_LABEL in name:
+        raise ValueError(f'Invalid host pattern {pattern!r}: only "*." can start a wildcard')
+
+
+def host_matches_pattern(host: str, pattern: str) -> bool:
+    """Does the host match the pattern?
+
+    Patterns are either host names, or wildcards like ``*.cern.ch``, which match any subdomain
+    of ``cern.ch`` (``inspirevm13.cern.ch``, ``a.b.cern.ch``), but not ``cern.ch`` itself, or
+    ``*`` matching any host. Other patterns with ``*`` raise :exc:`ValueError`.
+    """
+    check_host_pattern(pattern)
+    host, pattern = host.lower(), pattern.lower()
+
+    if pattern == WILDCARD_LABEL:
+        return True
+    if pattern.startswith(WILDCARD_PREFIX):
+        return host.endswith(pattern[len(WILDCARD_LABEL):])
+
+    return host == pattern
+
+
+class HostTrieNode(Generic[T]):
+    def __init__(self) -> None:
+        self.children: Dict[str, 'HostTrieNode[T]'] = {}
+        self.value: Optional[T] = None
+        self.wildcard_value: Optional[T] = None
+
+
+class HostTrie(Generic[T]):
+    """Values stored by host name or wildcard pattern, in a trie of reversed domain labels.
+
+    ``rt.inspirehep.net`` is stored under ``net`` -> ``inspirehep`` -> ``rt``, and
+    ``*.inspirehep.net`` as the wildcard value of ``net`` -> ``inspirehep``. Finding the values
+    for a host costs one dictionary lookup per label of the host, however many patterns there
+    are. When the same pattern is added more than once, the first value is kept.
+    """
+    def __init__(self) -> None:
+        self.root: HostTrieNode[T] = HostTrieNode()
+
+    def add(self, pattern: str, value: T):
+        """Store the value for the pattern, see :func:`check_host_pattern` for valid ones."""
+        check_host_pattern(pattern)
+        labels = pattern.lower().split('.')
+        is_wildcard = labels[0] == WILDCARD_LABEL
+        if is_wildcard:
+            labels = labels[1:]
+
+        node = self.root
+        for label in reversed(labels):
+            node = node.children.setdefault(label, HostTrieNode())
+
+        if is_wildcard and node.wildcard_value is None:
+            node.wildcard_value = value
+        elif not is_wildcard and node.value is None:
+            node.value = value
+
+    def find(self, host: str) -> List[T]:
+        """Values of all the patterns matching the host, most generic first."""
+        found: List[T] = []
+        node = self.root
+
+        for label in reversed(host.lower().split('.')):
+            if node.wildcard_value is not None:
+                found.append(node.wildcard_value)
+
+            next_node = node.children.get(label)
+            if next_node is None:
+                return found
+            node = next_node
+
+        if node.value is not None:
+            found.append(node.value)
+
+        return found
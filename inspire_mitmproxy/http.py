@@ -23,9 +23,13 @@
 """Wrappers for HTTP objects."""
 
 from cgi import parse_header
-from copy import copy, deepcopy
+from functools import lru_cache
+from mmap import ACCESS_READ, mmap
+from pathlib import Path
 from socket import getservbyname
-from typing import Any, Dict, KeysView, List, Optional, Union
+from sys import intern
+from types import MappingProxyType
+from typing import Any, Callable, Dict, List, Mapping, Optional, Sequence, Tuple, Union, cast
 from urllib.parse import urlparse
 
 import requests
@@ -36,13 +40,32 @@ from mitmproxy.net.http.status_codes import RESPONSES
 
 def encoding_by_header(headers: 'MITMHeaders') -> str:
     """Extract charset param from Content-Type or Accept headers"""
-    try:
-        content_type = headers['Content-Type']
-        _, params = parse_header(content_type)
-        return params['charset']
-    except KeyError:
+    content_type = headers.get('content-type')
+    if content_type is None:
         return 'utf-8'
 
+    _, params = parse_header(content_type)
+    return params.get('charset', 'utf-8')
+
+
+def map_body_file(path: Path) -> Union[bytes, memoryview]:
+    """Memory-map a body stored in a file, so that it is not copied into memory.
+
+    The file is mapped read-only, so the pages are shared with the page cache.
+    """
+    with path.open('rb') as body_file:
+        if path.stat().st_size == 0:
+            return b''
+
+        return memoryview(mmap(body_file.fileno(), 0, access=ACCESS_READ))
+
+
+def shallow_copy(obj: Any) -> Any:
+    """Copy the attributes of an object, without calling its constructor."""
+    copied = obj.__class__.__new__(obj.__class__)
+    copied.__dict__.update(obj.__dict__)
+    return copied
+
 
 def response_to_string(res: requests.Response) -> str:
     """
@@ -75,12 +98,42 @@ reason = %s
         res.text)
 
 
+HeaderFields = Tuple[Tuple[bytes, bytes], ...]
+
+
+@lru_cache(maxsize=1024)
+def normalize_header_name(header_name: str) -> str:
+    """Key of the header in :class:`MITMHeaders`: header names are case-insensitive."""
+    return intern(header_name.lower())
+
+
 class MITMHeaders:
-    def __init__(self, headers: Dict[str, List[str]]) -> None:
-        self.headers: Dict[str, List[str]] = {}
+    """Headers of a request or response, with possibly multiple values per name.
+
+    Headers are looked up case-insensitively, by their lowercase name, and keep the case and
+    order in which they were first given (in :attr:`names`, in the same order as
+    :attr:`headers`). Values of names differing only in case are merged.
+
+    Values are kept in tuples and names are interned, as the same few header names are repeated
+    across all the interactions held in memory. The headers are not modified once built, so their
+    encoded form is computed only once.
+    """
+    __slots__ = ('headers', 'names', '_encoded_fields')
+
+    def __init__(self, headers: Mapping[str, Sequence[str]]) -> None:
+        self.headers: Dict[str, Tuple[str, ...]] = {}
+        names = []
+
         for header_name, header_value in headers.items():
-            header_name = header_name.title()
-            self.headers[header_name] = copy(header_value)
+            key = normalize_header_name(header_name)
+            if key in self.headers:
+                self.headers[key] += tuple(header_value)
+            else:
+                self.headers[key] = tuple(header_value)
+                names.append(intern(header_name))
+
+        self.names: Tuple[str, ...] = tuple(names)
+        self._encoded_fields: Optional[HeaderFields] = None
 
     @classmethod
     def from_dict(cls, headers_dict: Dict[str, List[str]]) -> 'MITMHeaders':
@@ -101,36 +154,70 @@ class MITMHeaders:
         return cls(headers=header_dict)
 
     def to_dict(self) -> Dict[str, List[str]]:
-        return deepcopy(self.headers)
-
-    def to_mitmproxy(self) -> Headers:
-        fields = []
+        return {
+            header_name: list(values)
+            for header_name, values in zip(self.names, self.headers.values())
+        }
 
-        for key, values in self.headers.items():
-            for value in values:
-                fields.append(
-                    (key.encode('ascii'), value.encode('ascii'))
-                )
+    def view(self) -> Mapping[str, Tuple[str, ...]]:
+        """Read-only view of the values by lowercase header name, without copying them."""
+        return MappingProxyType(self.headers)
 
-        return Headers(fields=fields)
+    @property
+    def encoded_fields(self) -> HeaderFields:
+        """Header fields encoded as in :attr:`mitmproxy.net.http.headers.Headers.fields`."""
+        if self._encoded_fields is None:
+            self._encoded_fields = tuple(
+                (header_name.encode('ascii'), value.encode('ascii'))
+                for header_name, values in zip(self.names, self.headers.values())
+                for value in values
+            )
 
-    def keys(self) -> KeysView[str]:
-        return self.headers.keys()
+        return self._encoded_fields
 
-    def __getitem__(self, item: str) -> str:
-        try:
-            return self.headers[item.title()][0]
-        except IndexError:
-            raise KeyError(item.title())
+    def to_mitmproxy(self) -> Headers:
+        """Build the mitmproxy headers, sharing the encoded fields.
+
+        The fields are an immutable tuple, which mitmproxy replaces instead of modifying, so they
+        can be shared between all the mitmproxy headers built from these. They are known to be
+        valid, so the constructor (which checks them) is skipped.
+        """
+        headers = Headers.__new__(Headers)
+        headers.fields = self.encoded_fields
+        return headers
+
+    def keys(self) -> Tuple[str, ...]:
+        """Header names, as first given."""
+        return self.names
+
+    def get(self, header_name: str, default: Optional[str] = None) -> Optional[str]:
+        """First value of the header, or ``default`` if there is none."""
+        values = self.headers.get(normalize_header_name(header_name))
+        return values[0] if values else default
+
+    def getall(self, header_name: str) -> Tuple[str, ...]:
+        """All the values of the header, in order."""
+        return self.headers.get(normalize_header_name(header_name), ())
+
+    def __getitem__(self, header_name: str) -> str:
+        values = self.headers.get(normalize_header_name(header_name))
+        if not values:
+            raise KeyError(header_name)
+        return values[0]
+
+    def __contains__(self, header_name: str) -> bool:
+        return bool(self.headers.get(normalize_header_name(header_name)))
 
     def __eq__(self, other) -> bool:
         return self.headers == other.headers
 
     def __repr__(self):
-        return f'MITMHeaders(headers={self.headers!r})'
+        return f'MITMHeaders(headers={self.to_dict()!r})'
 
 
 class MITMRequest:
+    __slots__ = ('url', 'method', 'body', 'headers', 'original_encoding', 'http_version')
+
     def __init__(
         self,
         url: str,
@@ -155,27 +242,27 @@ class MITMRequest:
 
     @classmethod
     def from_mitmproxy(cls, request: HTTPRequest) -> 'MITMRequest':
-        encoding = encoding_by_header(MITMHeaders.from_mitmproxy(request.headers))
+        headers = MITMHeaders.from_mitmproxy(request.headers)
 
         return cls(
             url=request.url,
             method=request.method,
             body=request.raw_content,
-            headers=MITMHeaders.from_mitmproxy(request.headers),
-            original_encoding=encoding,
+            headers=headers,
+            original_encoding=encoding_by_header(headers),
             http_version=request.http_version,
         )
 
     @classmethod
     def from_dict(cls, request: Dict[str, Any]) -> 'MITMRequest':
-        encoding = encoding_by_header(MITMHeaders.from_dict(request['headers']))
+        headers = MITMHeaders.from_dict(request['headers'])
 
         return cls(
             url=request['url'],
             method=request['method'],
             body=request['body'],
-            headers=MITMHeaders.from_dict(request['headers']),
-            original_encoding=encoding,
+            headers=headers,
+            original_encoding=encoding_by_header(headers),
         )
 
     def to_mitmproxy(self) -> HTTPRequest:
@@ -206,6 +293,10 @@ class MITMRequest:
             'headers': self.headers.to_dict(),
         }
 
+    def get_header(self, header_name: str) -> Optional[str]:
+        """First value of the header, or ``None`` if there is none."""
+        return self.headers.get(header_name)
+
     def __eq__(self, other) -> bool:
         return (
             self.url == other.url
@@ -221,13 +312,29 @@ class MITMRequest:
     def __getitem__(self, field: str):
         return getattr(self, field)
 
+    def detach(self) -> 'MITMRequest':
+        """The request with all its fields read, not tied to a live mitmproxy request."""
+        return self
+
 
 class MITMResponse:
+    __slots__ = (
+        'status_code',
+        'status_message',
+        '_body',
+        'headers',
+        'original_encoding',
+        'http_version',
+        'body_file',
+        'body_path',
+        '_mitmproxy_template',
+    )
+
     def __init__(
         self,
         status_code: int = 200,
         status_message: Optional[str] = None,
-        body: Optional[Union[str, bytes]] = None,
+        body: Optional[Union[str, bytes, memoryview]] = None,
         headers: Optional[MITMHeaders] = None,
         original_encoding: Optional[str] = None,
         http_version: Optional[str] = None,
@@ -237,60 +344,148 @@ class MITMResponse:
         self.headers = headers or MITMHeaders({})
         self.http_version = http_version or 'HTTP/1.1'
         self.original_encoding = original_encoding or encoding_by_header(self.headers)
+        self.body_file: Optional[str] = None
+        self.body_path: Optional[Path] = None
+        self._mitmproxy_template: Optional[HTTPResponse] = None
 
+        self._body: Union[bytes, memoryview]
         if isinstance(body, str):
-            self.body = body.encode(self.original_encoding)
-        elif isinstance(body, bytes):
-            self.body = body
+            self._body = body.encode(self.original_encoding)
+        elif isinstance(body, (bytes, memoryview)):
+            self._body = body
         else:
-            self.body = b''
+            self._body = b''
+
+    @property
+    def body(self) -> bytes:
+        """The body. Memory-mapped bodies are copied into memory on each access."""
+        return bytes(self._body)
+
+    @body.setter
+    def body(self, body: bytes) -> None:
+        self._body = body
 
     @classmethod
     def from_mitmproxy(cls, response: HTTPResponse) -> 'MITMResponse':
-        encoding = encoding_by_header(MITMHeaders.from_mitmproxy(response.headers))
+        headers = MITMHeaders.from_mitmproxy(response.headers)
 
         return cls(
             status_code=response.status_code,
             status_message=response.reason,
             body=response.raw_content,
-            headers=MITMHeaders.from_mitmproxy(response.headers),
-            original_encoding=encoding,
+            headers=headers,
+            original_encoding=encoding_by_header(headers),
             http_version=response.http_version,
         )
 
     @classmethod
-    def from_dict(cls, response: Dict[str, Any]) -> 'MITMResponse':
-        return cls(
+    def from_dict(cls, response: Dict[str, Any], base_dir: Optional[Path] = None) \
+            -> 'MITMResponse':
+        """Build the response from its serialised form.
+
+        Instead of ``body``, the dictionary can have a ``body_file``: the name of a file, relative
+        to ``base_dir``, which holds the body. Such bodies are memory-mapped.
+        """
+        if 'body_file' not in response:
+            return cls(
+                status_code=response['status']['code'],
+                status_message=response['status']['message'],
+                body=response['body'],
+                headers=MITMHeaders.from_dict(response['headers']),
+            )
+
+        mitm_response = cls(
             status_code=response['status']['code'],
             status_message=response['status']['message'],
-            body=response['body'],
             headers=MITMHeaders.from_dict(response['headers']),
         )
+        mitm_response.body_file = response['body_file']
+        mitm_response.load_body_file(base_dir or Path('.'))
+        return mitm_response
 
-    def to_mitmproxy(self) -> HTTPResponse:
-        return HTTPResponse(
-            http_version='HTTP/1.1',
-            status_code=self.status_code,
-            reason=self.status_message,
-            headers=self.headers.to_mitmproxy(),
-            content=self.body,
-        )
-
-    def to_dict(self) -> Dict[str, Any]:
-        try:
-            serialised_body: Union[str, bytes] = self.body.decode(self.original_encoding)
-        except UnicodeDecodeError:
-            serialised_body = self.body
+    def load_body_file(self, base_dir: Path) -> None:
+        """Memory-map the body from :attr:`body_file`, relative to ``base_dir``."""
+        body_path = base_dir.resolve() / cast(str, self.body_file)
+        self._body = map_body_file(body_path)
+        self.body_path = body_path
 
-        return {
+    def to_mitmproxy(self) -> HTTPResponse:
+        """Build the mitmproxy response.
+
+        The first call builds a template, of which every call returns a copy with its own headers,
+        sharing the body and the encoded header fields. Responses are therefore not expected to
+        change once they were replayed. mitmproxy expects the content in bytes, so memory-mapped
+        bodies are copied into memory once, when the response is first replayed.
+        """
+        template = self._mitmproxy_template
+        if template is None:
+            template = self._mitmproxy_template = HTTPResponse(
+                http_version='HTTP/1.1',
+                status_code=self.status_code,
+                reason=self.status_message,
+                headers=self.headers.to_mitmproxy(),
+                content=self.body,
+            )
+
+        response = shallow_copy(template)
+        response.data = shallow_copy(template.data)
+        response.data.headers = self.headers.to_mitmproxy()
+        return response
+
+    def to_dict(self, body_file: Optional[str] = None) -> Dict[str, Any]:
+        """Serialise the response.
+
+        If ``body_file`` is given, it is referenced instead of the body, which the caller is
+        responsible for writing there.
+        """
+        serialised_response: Dict[str, Any] = {
             'status': {
                 'code': self.status_code,
                 'message': self.status_message,
             },
-            'body': serialised_body,
             'headers': self.headers.to_dict(),
         }
 
+        if body_file is not None:
+            serialised_response['body_file'] = body_file
+            return serialised_response
+
+        body = self.body
+        try:
+            serialised_response['body'] = body.decode(self.original_encoding)
+        except UnicodeDecodeError:
+            serialised_response['body'] = body
+
+        return serialised_response
+
+    def detach(self) -> 'MITMResponse':
+        """The response with all its fields read, not tied to a live mitmproxy response."""
+        return self
+
+    def __getstate__(self) -> Dict[str, Any]:
+        """State to pickle. Bodies read from a :attr:`body_file` are left out.
+
+        The directory of the body file is not pickled either, so that pickles stay valid when the
+        scenarios are moved: the unpickled response has no body until :meth:`load_body_file` is
+        called with the directory of its interaction.
+        """
+        excluded = {'_mitmproxy_template'}
+        if self.body_file is not None:
+            excluded.update(('_body', 'body_path'))
+
+        return {
+            field: getattr(self, field)
+            for field in MITMResponse.__slots__
+            if field not in excluded
+        }
+
+    def __setstate__(self, state: Dict[str, Any]):
+        for field, value in state.items():
+            setattr(self, field, value)
+        self._mitmproxy_template = None
+        if self.body_file is not None:
+            self.body_path = None
+
     def __eq__(self, other) -> bool:
         return (
             self.status_code == other.status_code
@@ -301,3 +496,104 @@ class MITMResponse:
     def __repr__(self):
         return f'MITMResponse({self.status_code!r}, {self.status_message!r}, ' \
             f'headers={self.headers!r}, body={self.body!r})'
+
+
+def lazy_field(name: str, load: Callable[[Any], Any]) -> property:
+    """Field of a lazy wrapper, loaded from the wrapped message on first access."""
+    def getter(self):
+        try:
+            return self._fields[name]
+        except KeyError:
+            value = self._fields[name] = load(self)
+            return value
+
+    def setter(self, value):
+        self._fields[name] = value
+
+    return property(getter, setter)
+
+
+def _load_mitmproxy_headers(lazy_message) -> MITMHeaders:
+    return MITMHeaders.from_mitmproxy(lazy_message._message.headers)
+
+
+def _load_encoding(lazy_message) -> str:
+    return encoding_by_header(lazy_message.headers)
+
+
+class LazyMITMRequest(MITMRequest):
+    """:class:`MITMRequest` reading the fields of a mitmproxy request only when accessed.
+
+    Used for live requests, most of which are only routed by their host, and passed through.
+    """
+    __slots__ = ('_message', '_fields')
+
+    def __init__(self, request: HTTPRequest) -> None:
+        self._message = request
+        self._fields: Dict[str, Any] = {}
+
+    def detach(self) -> MITMRequest:
+        return MITMRequest(
+            url=self.url,
+            method=self.method,
+            body=self.body,
+            headers=self.headers,
+            original_encoding=self.original_encoding,
+            http_version=self.http_version,
+        )
+
+    def get_header(self, header_name: str) -> Optional[str]:
+        """Read from the mitmproxy request, so that routing does not convert all the headers."""
+        if 'headers' in self._fields:
+            return self.headers.get(header_name)
+
+        values = self._message.headers.get_all(header_name)
+        return values[0] if values else None
+
+    def __repr__(self):
+        # Logged for every request passed through, which should not need converted headers
+        headers = self._fields.get('headers', self._message.headers)
+        return f'MITMRequest({self.url!r}, {self.method!r}, ' \
+            f'headers={headers!r}, body={self.body!r})'
+
+    url = lazy_field('url', lambda self: self._message.url)
+    method = lazy_field('method', lambda self: self._message.method)
+    body = lazy_field('body', lambda self: self._message.raw_content or b'')
+    headers = lazy_field('headers', _load_mitmproxy_headers)
+    original_encoding = lazy_field('original_encoding', _load_encoding)
+    http_version = lazy_field('http_version', lambda self: self._message.http_version)
+
+
+class LazyMITMResponse(MITMResponse):
+    """:class:`MITMResponse` reading the fields of a mitmproxy response only when accessed.
+
+    Used for live responses, which are only needed when recording.
+    """
+    __slots__ = ('_message', '_fields')
+
+    def __init__(self, response: HTTPResponse) -> None:
+        self._message = response
+        self._fields: Dict[str, Any] = {}
+        self._mitmproxy_template = None
+
+    def detach(self) -> MITMResponse:
+        return MITMResponse(
+            status_code=self.status_code,
+            status_message=self.status_message,
+            body=self.body,
+            headers=self.headers,
+            original_encoding=self.original_encoding,
+            http_version=self.http_version,
+        )
+
+    status_code = lazy_field('status_code', lambda self: self._message.status_code)
+    status_message = lazy_field(
+        'status_message',
+        lambda self: self._message.reason or RESPONSES[self.status_code],
+    )
+    body = lazy_field('body', lambda self: self._message.raw_content or b'')
+    headers = lazy_field('headers', _load_mitmproxy_headers)
+    original_encoding = lazy_field('original_encoding', _load_encoding)
+    http_version = lazy_field('http_version', lambda self: self._message.http_version)
+    body_file = lazy_field('body_file', lambda self: None)
+    body_path = lazy_field('body_path', lambda self: None)
@@ -38,23 +38,55 @@ are named in sequence of `interaction_0.yaml`, `interaction_1.yaml`, and so on.
 """
 from functools import singledispatch
 from logging import getLogger
-from os.path import expandvars
+from os import environ
 from pathlib import Path
-from pprint import pformat
-from re import compile
-from threading import Timer
-from typing import Any, Dict, List, Optional, Pattern, Union
+from re import compile, error
+from typing import Any, Dict, Iterable, List, Optional, Pattern, Union
 
-import requests
 from yaml import dump as yaml_dump
 from yaml import load as yaml_load
 
-from .http import MITMRequest, MITMResponse, response_to_string
+from .callbacks import get_callback_engine
+from .errors import InvalidMatchRule
+from .http import MITMRequest, MITMResponse
+
+
+try:
+    from yaml import CSafeDumper as SafeDumper
+    from yaml import CSafeLoader as SafeLoader
+except ImportError:  # PyYAML built without libyaml
+    from yaml import SafeDumper, SafeLoader  # type: ignore
 
 
 logger = getLogger(__name__)
 
 
+class InteractionLoader(SafeLoader):
+    """Safe YAML loader, which also reads the ``!!python/unicode`` strings of old recordings."""
+
+
+InteractionLoader.add_constructor(
+    'tag:yaml.org,2002:python/unicode',
+    InteractionLoader.construct_yaml_str,
+)
+InteractionLoader.add_constructor(
+    'tag:yaml.org,2002:python/str',
+    InteractionLoader.construct_yaml_str,
+)
+
+
+class InteractionDumper(SafeDumper):
+    """Safe YAML dumper, using libyaml if available."""
+
+
+def load_yaml(yaml_string: str) -> Any:
+    return yaml_load(yaml_string, Loader=InteractionLoader)
+
+
+def dump_yaml(data: Any) -> str:
+    return yaml_dump(data, Dumper=InteractionDumper)
+
+
 @singledispatch
 def try_to_stringify(bytes_or_string: Union[str, bytes], encoding: Optional[str]):
     raise Exception("Unable to stringify %r" % bytes_or_string)
@@ -78,6 +110,8 @@ class Interaction:
     DEFAULT_REGEX_MATCH_FIELDS: Dict[str, Pattern[str]] = {}
     DEFAULT_CALLBACK_DELAY = 0.5
 
+    DEFAULT_BODY_FILE_THRESHOLD = 1024 * 1024
+
     DEFAULT_NAME_PATTERN = 'interaction_{}'
     DEFAULT_NAME_MATCH_REGEX = compile(r'^interaction_(\d+)$')
 
@@ -93,28 +127,31 @@ class Interaction:
         self.name = name
         self.request = request
         self.response = response
-        self.match = match or {}
+        self.match = match
         self.callbacks = callbacks or []
         self.max_replays = max_replays if max_replays is not None else -1
 
     @classmethod
     def from_file(cls, interaction_file: Optional[Path]) -> 'Interaction':
         interaction_string = interaction_file.read_text()  # type: ignore
-        interaction_dict = yaml_load(interaction_string)
+        interaction_dict = load_yaml(interaction_string)
 
         return cls(
             name=interaction_file.stem,  # type: ignore
             request=MITMRequest.from_dict(interaction_dict['request']),
-            response=MITMResponse.from_dict(interaction_dict['response']),
+            response=MITMResponse.from_dict(
+                interaction_dict['response'],
+                base_dir=interaction_file.parent,  # type: ignore
+            ),
             match=interaction_dict.get('match'),
             callbacks=interaction_dict.get('callbacks'),
             max_replays=interaction_dict.get('max_replays')
         )
 
-    def to_dict(self) -> dict:
+    def to_dict(self, body_file: Optional[str] = None) -> dict:
         serialized_interaction: Dict[str, Any] = {
             'request': self.request.to_dict(),
-            'response': self.response.to_dict(),
+            'response': self.response.to_dict(body_file=body_file),
             'match': self.match,
             'callbacks': self.callbacks,
             'max_replays': self.max_replays,
@@ -133,17 +170,34 @@ class Interaction:
         except KeyError:
             return []
 
+    @property
+    def match(self) -> dict:
+        return self._match
+
+    @match.setter
+    def match(self, match: Optional[dict]):
+        self._match = match or {}
+        self._regex_match_fields = self._compile_regex_match_fields()
+
     @property
     def regex_match_fields(self) -> Dict[str, Pattern[str]]:
         """Fields specified (as key in the dictionary) match on the regex defined in value."""
+        return self._regex_match_fields
+
+    def _compile_regex_match_fields(self) -> Dict[str, Pattern[str]]:
         if not self.match:
             return self.DEFAULT_REGEX_MATCH_FIELDS
 
-        try:
-            regexes = self.match['regex']
-            return {field: compile(regex) for field, regex in regexes.items()}
-        except KeyError:
-            return {}
+        regexes = self.match.get('regex', {})
+        compiled_regexes = {}
+
+        for field, regex in regexes.items():
+            try:
+                compiled_regexes[field] = compile(regex)
+            except (error, TypeError) as e:
+                raise InvalidMatchRule(self.name, field, regex, str(e))
+
+        return compiled_regexes
 
     def _matches_by_exact_rules(self, request: MITMRequest) -> bool:
         for match_on in self.exact_match_fields:
@@ -173,25 +227,8 @@ class Interaction:
 
     @staticmethod
     def execute_callback(request: MITMRequest, delay: Union[int, float]):
-        def execute_request(_request: MITMRequest):
-            request_params = dict(
-                method=request.method,
-                url=expandvars(request.url),
-                data=request.body,
-                headers={
-                    key: expandvars(request.headers[key])
-                    for key in request.headers.keys()
-                },
-                timeout=10,
-            )
-            logger.warning("Executing callback:\n%s", pformat(request_params))
-
-            response = requests.request(**request_params)
-            if not response.ok:
-                logger.error("Error executing callback:\n%s", response_to_string(response))
-
-        timer = Timer(delay, execute_request, args=[request])
-        timer.start()
+        """Send the request after the delay (see :mod:`inspire_mitmproxy.callbacks`)."""
+        get_callback_engine().schedule_callback(delay, request)
 
     def execute_callbacks(self):
         for callback in self.callbacks:
@@ -202,21 +239,34 @@ class Interaction:
             )
 
     @classmethod
-    def get_next_sequence_number_in_dir(cls, directory: Path) -> int:
-        def _next_sequence_number_after_file(path):
-            if not path.is_file() or path.suffix != '.yaml':
-                return 0
+    def get_next_sequence_number_in_dir(
+        cls,
+        directory: Path,
+        pending_names: Iterable[str] = (),
+    ) -> int:
+        """Next sequence number after the interactions in the directory, if it exists.
 
-            seq_number_match = cls.DEFAULT_NAME_MATCH_REGEX.match(path.stem)
+        ``pending_names`` are the names of interactions to be saved in the directory, but which
+        may not be on disk yet.
+        """
+        def _next_sequence_number_after_name(name):
+            seq_number_match = cls.DEFAULT_NAME_MATCH_REGEX.match(name)
             if not seq_number_match:
                 return 0
 
             cur_seq_number = int(seq_number_match.group(1))
             return cur_seq_number + 1
 
+        names = list(pending_names)
+        if directory.is_dir():
+            names.extend(
+                path.stem for path in directory.iterdir()
+                if path.is_file() and path.suffix == '.yaml'
+            )
+
         next_seq_number = 0
-        for interaction_path in directory.iterdir():
-            candidate_next_seq_number = _next_sequence_number_after_file(interaction_path)
+        for name in names:
+            candidate_next_seq_number = _next_sequence_number_after_name(name)
             next_seq_number = max(next_seq_number, candidate_next_seq_number)
 
         return next_seq_number
@@ -226,15 +276,16 @@ class Interaction:
         cls,
         directory: Path,
         request: MITMRequest,
-        response: MITMResponse
+        response: MITMResponse,
+        pending_names: Iterable[str] = (),
     ) -> 'Interaction':
         """Create a new interaction with a name taking from next available in directory."""
-        sequence_number = cls.get_next_sequence_number_in_dir(directory)
+        sequence_number = cls.get_next_sequence_number_in_dir(directory, pending_names)
         new_name = cls.DEFAULT_NAME_PATTERN.format(sequence_number)
         return Interaction(name=new_name, request=request, response=response)
 
-    def save_in_dir(self, directory: Path):
-        """Save the interaction to a file.
+    def save_in_dir(self, directory: Path) -> List[Path]:
+        """Save the interaction to a file, return the paths of the files written.
 
         Structure of interactions:
 
@@ -254,6 +305,8 @@ class Interaction:
               status:
                 code: 200                           # integer
                 message: OK                         # string
+              # body_file: interaction_0.body       # instead of body: file with the body,
+                                                    # relative to this one, memory-mapped on load
             match:
               exact:
               - method                              # array of one of the keys in request
@@ -266,9 +319,26 @@ class Interaction:
                                                     # using python-requests, which does not support
                                                     # multiple header values, only first value of
                                                     # each header will be used)
+
+        Response bodies of at least ``MITM_PROXY_BODY_FILE_THRESHOLD`` bytes (by default
+        :attr:`DEFAULT_BODY_FILE_THRESHOLD`) are saved in a separate ``<name>.body`` file.
         """
+        written = []
+        body_file = None
+        body_file_threshold = int(
+            environ.get('MITM_PROXY_BODY_FILE_THRESHOLD', self.DEFAULT_BODY_FILE_THRESHOLD)
+        )
+        body = self.response.body
+        if len(body) >= body_file_threshold:
+            body_file = f'{self.name}.body'
+            (directory / body_file).write_bytes(body)
+            written.append(directory / body_file)
+
         output_path = directory / f'{self.name}.yaml'
-        output_path.write_text(yaml_dump(self.to_dict()))
+        output_path.write_text(dump_yaml(self.to_dict(body_file=body_file)))
+        written.append(output_path)
+
+        return written
 
     def __repr__(self):
         return f'Interaction(name={self.name!r}, request={self.request!r}, ' \
@@ -0,0 +1,88 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of INSPIRE-MITMPROXY.
+# Copyright (C) 2018 CERN.
+#
+# INSPIRE is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# INSPIRE is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with INSPIRE. If not, see <http://www.gnu.org/licenses/>.
+#
+# In applying this license, CERN does not waive the privileges and immunities
+# granted to it by virtue of its status as an Intergovernmental Organization
+# or submit itself to any jurisdiction.
+
+
+"""Index of interactions, used to find the ones which may match a request without a full scan."""
+
+from heapq import merge
+from operator import itemgetter
+from typing import Dict, Iterator, List, Tuple
+
+from .http import MITMRequest
+from .interaction import Interaction
+
+
+IndexedInteraction = Tuple[int, Interaction]
+
+
+class InteractionIndex:
+    """Interactions grouped by the values they match exactly on.
+
+    Interactions which only have ``exact`` rules (which is the case by default) are kept in hash
+    tables, one per set of exact match fields, keyed by the tuple of values of those fields.
+    Interactions with ``regex`` rules, or whose exact match values cannot be hashed (e.g.
+    headers) or do not exist, are always considered candidates. Candidates are yielded in the
+    original order of the interactions, so that the first matching one is still the one replayed.
+    """
+    def __init__(self, interactions: List[Interaction]) -> None:
+        self.exact_tables: Dict[Tuple[str, ...], Dict[tuple, List[IndexedInteraction]]] = {}
+        self.always_candidates: List[IndexedInteraction] = []
+
+        for position, interaction in enumerate(interactions):
+            self._add(position, interaction)
+
+    def _add(self, position: int, interaction: Interaction):
+        if interaction.regex_match_fields:
+            self.always_candidates.append((position, interaction))
+            return
+
+        fields = tuple(interaction.exact_match_fields)
+
+        try:
+            key = tuple(interaction.request[field] for field in fields)
+            hash(key)
+        except (AttributeError, TypeError):
+            # Unknown fields only fail the requests reaching the interaction, when matching it
+            self.always_candidates.append((position, interaction))
+            return
+
+        self.exact_tables.setdefault(fields, {}).setdefault(key, []).append(
+            (position, interaction)
+        )
+
+    def candidates(self, request: MITMRequest) -> Iterator[Interaction]:
+        """Interactions which may match the request, in their original order.
+
+        Candidates still have to be checked with
+        :meth:`~inspire_mitmproxy.interaction.Interaction.matches_request`.
+        """
+        candidate_lists = [self.always_candidates]
+
+        for fields, table in self.exact_tables.items():
+            key = tuple(request[field] for field in fields)
+            try:
+                candidate_lists.append(table[key])
+            except (KeyError, TypeError):
+                continue
+
+        for _, interaction in merge(*candidate_lists, key=itemgetter(0)):
+            yield interaction
@@ -0,0 +1,156 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of INSPIRE-MITMPROXY.
+# Copyright (C) 2018 CERN.
+#
+# INSPIRE is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# INSPIRE is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with INSPIRE. If not, see <http://www.gnu.org/licenses/>.
+#
+# In applying this license, CERN does not waive the privileges and immunities
+# granted to it by virtue of its status as an Intergovernmental Organization
+# or submit itself to any jurisdiction.
+
+
+"""Parsing of interaction files in parallel.
+
+Scenarios are made of many independent interaction files, which are parsed in a pool of
+threads (or processes) when there are enough of them. The loader used by services is configured
+through environment variables:
+
+``MITM_PROXY_LOADER_WORKERS``
+    number of workers parsing files, ``1`` to parse them in the proxy process one after the other
+    (default: ``1``)
+
+``MITM_PROXY_LOADER_POOL``
+    ``thread`` (default) or ``process``. Processes are forked from the running proxy, so they are
+    better kept for preloading (see
+    :meth:`~inspire_mitmproxy.services.management_service.ManagementService.preload_scenarios`).
+"""
+
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from logging import getLogger
+from os import environ
+from pathlib import Path
+from threading import Lock
+from typing import Dict, Iterable, Optional, Tuple
+
+from .interaction import Interaction
+
+
+logger = getLogger(__name__)
+
+PARALLEL_MIN_FILES = 16
+
+ParsedFiles = Dict[str, Tuple[int, Interaction]]
+
+
+def read_interaction_file(path: Path) -> Tuple[int, Interaction]:
+    """Parse the interaction, with the mtime of its file from before parsing."""
+    mtime = path.stat().st_mtime_ns
+    return mtime, Interaction.from_file(interaction_file=path)
+
+
+def load_body_file(path: Path, result: Tuple[int, Interaction]) -> Tuple[int, Interaction]:
+    """Map the body file of an interaction from a worker process, which does not pickle it."""
+    response = result[1].response
+    if response.body_file is not None:
+        response.load_body_file(path.parent)
+    return result
+
+
+class ParallelLoader:
+    def __init__(
+        self,
+        workers: int = 1,
+        use_processes: bool = True,
+        min_files: int = PARALLEL_MIN_FILES,
+    ) -> None:
+        self.workers = workers
+        self.use_processes = use_processes
+        self.min_files = min_files
+
+        self._executor: Optional[Executor] = None
+        self._executor_lock = Lock()
+
+    @property
+    def executor(self) -> Executor:
+        """The pool of workers, started on first use."""
+        with self._executor_lock:
+            if self._executor is None:
+                if self.use_processes:
+                    self._executor = ProcessPoolExecutor(max_workers=self.workers)
+                else:
+                    self._executor = ThreadPoolExecutor(max_workers=self.workers)
+
+            return self._executor
+
+    def load(self, paths: Iterable[Path]) -> ParsedFiles:
+        """Parse the interaction files, keyed by file name in sorted order, with their mtimes.
+
+        Files are parsed in parallel only if there are at least ``min_files`` of them. If the
+        pool of processes breaks (e.g. a worker was killed), it is replaced for the next loads, and
+        the files are parsed again in this process.
+        """
+        sorted_paths = sorted(paths)
+
+        if self.workers > 1 and len(sorted_paths) >= self.min_files:
+            executor = self.executor
+            try:
+                results = executor.map(
+                    read_interaction_file,
+                    sorted_paths,
+                    chunksize=max(1, len(sorted_paths) // (self.workers * 4)),
+                )
+                if self.use_processes:
+                    results = map(load_body_file, sorted_paths, results)
+                return self._parse(sorted_paths, results)
+            except BrokenProcessPool:
+                logger.warning('Pool of interaction parsers broke, parsing in process')
+                self._discard_executor(executor)
+
+        return self._parse(sorted_paths, map(read_interaction_file, sorted_paths))
+
+    @staticmethod
+    def _parse(sorted_paths, results) -> ParsedFiles:
+        return {path.name: result for path, result in zip(sorted_paths, results)}
+
+    def _discard_executor(self, executor: Executor):
+        with self._executor_lock:
+            if self._executor is executor:
+                self._executor = None
+        executor.shutdown(wait=False)
+
+    def shutdown(self):
+        with self._executor_lock:
+            if self._executor is not None:
+                self._executor.shutdown()
+                self._executor = None
+
+
+_loader: Optional[ParallelLoader] = None
+_loader_lock = Lock()
+
+
+def get_parallel_loader() -> ParallelLoader:
+    """The loader used by services, configured from the environment."""
+    global _loader
+
+    with _loader_lock:
+        if _loader is None:
+            _loader = ParallelLoader(
+                workers=int(environ.get('MITM_PROXY_LOADER_WORKERS', 1)),
+                use_processes=environ.get('MITM_PROXY_LOADER_POOL', 'thread') == 'process',
+            )
+
+        return _loader
@@ -0,0 +1,192 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of INSPIRE-MITMPROXY.
+# Copyright (C) 2018 CERN.
+#
+# INSPIRE is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# INSPIRE is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with INSPIRE. If not, see <http://www.gnu.org/licenses/>.
+#
+# In applying this license, CERN does not waive the privileges and immunities
+# granted to it by virtue of its status as an Intergovernmental Organization
+# or submit itself to any jurisdiction.
+
+
+"""Background writer of recorded interactions.
+
+Recorded interactions are queued, and saved by a background thread so that live responses are
+not delayed by disk writes. The writer saves the queued interactions in batches of up to
+``MITM_PROXY_RECORDING_BATCH`` (default: 100), and fsyncs the files written and their
+directories once per batch, unless ``MITM_PROXY_RECORDING_FSYNC`` is ``0``.
+
+Recordings can only be read back reliably from disk after :meth:`RecordingWriter.flush`, exposed
+by the Management Service as `/record/flush`.
+"""
+
+from collections import deque
+from logging import getLogger
+from os import O_RDONLY, close, environ, fsync
+from os import open as open_descriptor
+from pathlib import Path
+from threading import Condition, Lock, Thread
+from typing import Callable, Deque, List, Optional, Set, Tuple
+
+from .interaction import Interaction
+
+
+logger = getLogger(__name__)
+
+DEFAULT_BATCH_SIZE = 100
+
+PendingWrite = Tuple[Path, Interaction, Optional[Callable[[], None]]]
+
+
+def fsync_path(path: Path):
+    """Flush the file, or the entries of the directory, to disk."""
+    descriptor = open_descriptor(str(path), O_RDONLY)
+    try:
+        fsync(descriptor)
+    finally:
+        close(descriptor)
+
+
+class RecordingWriter:
+    def __init__(self, batch_size: int = DEFAULT_BATCH_SIZE, fsync: bool = True) -> None:
+        self.batch_size = batch_size
+        self.fsync = fsync
+
+        self._condition = Condition()
+        self._queue: Deque[PendingWrite] = deque()
+        self._batch: List[PendingWrite] = []
+        self._thread: Optional[Thread] = None
+        self._failed = 0
+
+    def save(
+        self,
+        interaction: Interaction,
+        directory: Path,
+        on_saved: Optional[Callable[[], None]] = None,
+    ):
+        """Queue the interaction to be saved in the directory, created if needed.
+
+        ``on_saved`` is called from the writer thread once the interaction is on disk.
+        """
+        with self._condition:
+            if self._thread is None:
+                self._thread = Thread(
+                    target=self._write_batches,
+                    name='inspire-mitmproxy-recording-writer',
+                    daemon=True,
+                )
+                self._thread.start()
+
+            self._queue.append((directory, interaction, on_saved))
+            self._condition.notify_all()
+
+    @property
+    def pending(self) -> int:
+        """Number of interactions queued or being written."""
+        with self._condition:
+            return len(self._queue) + len(self._batch)
+
+    @property
+    def failed(self) -> int:
+        """Number of interactions which could not be saved, since the writer was started."""
+        with self._condition:
+            return self._failed
+
+    def pending_names(self, directory: Path) -> List[str]:
+        """Names of the interactions queued or being written to the directory."""
+        with self._condition:
+            return [
+                interaction.name
+                for pending_directory, interaction, _ in (*self._batch, *self._queue)
+                if pending_directory == directory
+            ]
+
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        """Wait until all queued interactions are saved, return whether they are."""
+        with self._condition:
+            return self._condition.wait_for(
+                lambda: not self._queue and not self._batch,
+                timeout=timeout,
+            )
+
+    def _write_batches(self):
+        while True:
+            with self._condition:
+                self._condition.wait_for(lambda: self._queue)
+                batch = self._batch = [
+                    self._queue.popleft()
+                    for _ in range(min(self.batch_size, len(self._queue)))
+                ]
+
+            saved, failed = self._write_batch(batch)
+
+            for on_saved in saved:
+                try:
+                    on_saved()
+                except Exception:
+                    logger.exception('Error after saving recorded interactions')
+
+            with self._condition:
+                self._batch = []
+                self._failed += failed
+                self._condition.notify_all()
+
+    def _write_batch(self, batch: List[PendingWrite]) -> Tuple[List[Callable[[], None]], int]:
+        """Write the batch, return the callbacks of the interactions saved and the failure count."""
+        saved = []
+        failed = 0
+        to_sync: List[Path] = []
+        directories_to_sync: Set[Path] = set()
+
+        for directory, interaction, on_saved in batch:
+            try:
+                created = [path for path in (directory, *directory.parents) if not path.is_dir()]
+                directory.mkdir(parents=True, exist_ok=True)
+                directories_to_sync.update(path.parent for path in created)
+                to_sync.extend(interaction.save_in_dir(directory))
+                directories_to_sync.add(directory)
+            except Exception:
+                logger.exception('Error saving %s in %s', interaction.name, directory)
+                failed += 1
+            else:
+                if on_saved is not None:
+                    saved.append(on_saved)
+
+        if self.fsync:
+            for path in [*to_sync, *sorted(directories_to_sync)]:
+                try:
+                    fsync_path(path)
+                except OSError:
+                    logger.exception('Error syncing %s to disk', path)
+
+        return saved, failed
+
+
+_writer: Optional[RecordingWriter] = None
+_writer_lock = Lock()
+
+
+def get_recording_writer() -> RecordingWriter:
+    """The writer used by services, configured from the environment."""
+    global _writer
+
+    with _writer_lock:
+        if _writer is None:
+            _writer = RecordingWriter(
+                batch_size=int(environ.get('MITM_PROXY_RECORDING_BATCH', DEFAULT_BATCH_SIZE)),
+                fsync=environ.get('MITM_PROXY_RECORDING_FSYNC', '1') != '0',
+            )
+
+        return _writer
@@ -0,0 +1,158 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of INSPIRE-MITMPROXY.
+# Copyright (C) 2018 CERN.
+#
+# INSPIRE is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# INSPIRE is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with INSPIRE. If not, see <http://www.gnu.org/licenses/>.
+#
+# In applying this license, CERN does not waive the privileges and immunities
+# granted to it by virtue of its status as an Intergovernmental Organization
+# or submit itself to any jurisdiction.
+
+
+"""Scenario bundles: all interactions of a scenario, parsed, in a single binary file.
+
+A bundle lives next to the service directories of the scenario it was built from::
+
+    scenarios/<scenario_name>/scenario.bundle
+
+It starts with :data:`BUNDLE_MAGIC` and the :data:`BUNDLE_FORMAT_VERSION` it was built with,
+followed by the length of the index, the pickled index and one pickled blob per service. The
+index maps service names to the offset and length of their blob, so that a service only
+unpickles its own interactions. Each blob holds the parsed interactions of the service together
+with the mtimes of the files they were parsed from: the interactions are used only as long as
+the files did not change after the bundle was built. Bodies stored in separate files are not
+bundled: responses keep the name of their body file, which is mapped again from the service
+directory when the bundle is loaded, so bundles stay valid when the scenarios are moved.
+
+The blobs are pickles of the classes of :mod:`inspire_mitmproxy.http` and
+:mod:`inspire_mitmproxy.interaction`, so :data:`BUNDLE_FORMAT_VERSION` has to be bumped whenever
+their attributes change. Bundles of any other version are ignored, and should be built again.
+
+Bundles are trusted: unpickling runs arbitrary code, unlike the safe YAML loader used for
+interaction files. Anyone who can write a bundle in the scenarios directory can run code in the
+proxy, so the scenarios directory must only be writable by trusted users.
+
+Bundles are built with ``scripts/bundle_scenarios.py``.
+"""
+
+from logging import getLogger
+from pathlib import Path
+from pickle import HIGHEST_PROTOCOL, UnpicklingError
+from pickle import dumps as pickle_dumps
+from pickle import loads as pickle_loads
+from struct import Struct
+from typing import Dict, Optional, Tuple
+
+from .interaction import Interaction
+from .parallel_loader import get_parallel_loader
+
+
+logger = getLogger(__name__)
+
+BUNDLE_FILE_NAME = 'scenario.bundle'
+BUNDLE_MAGIC = b'INSPIRE-MITMPROXY-BUNDLE-'
+BUNDLE_FORMAT_VERSION = 4
+BUNDLE_HEADER = BUNDLE_MAGIC + b'%d\n' % BUNDLE_FORMAT_VERSION
+INDEX_LENGTH = Struct('>Q')
+
+BundledFiles = Dict[str, Tuple[int, Interaction]]
+
+
+def read_interaction_files(service_dir: Path) -> BundledFiles:
+    """Parse all interactions in the directory, keyed by file name, with their mtimes."""
+    return get_parallel_loader().load(
+        interaction_path for interaction_path in service_dir.iterdir()
+        if interaction_path.is_file() and interaction_path.suffix == '.yaml'
+    )
+
+
+def build_bundle(scenario_dir: Path) -> Path:
+    """Build the bundle of a scenario, replacing the existing one."""
+    index: Dict[str, Tuple[int, int]] = {}
+    blobs = []
+    offset = 0
+
+    for service_dir in sorted(scenario_dir.iterdir()):
+        if not service_dir.is_dir():
+            continue
+
+        blob = pickle_dumps(read_interaction_files(service_dir), protocol=HIGHEST_PROTOCOL)
+        index[service_dir.name] = (offset, len(blob))
+        blobs.append(blob)
+        offset += len(blob)
+
+    index_blob = pickle_dumps(index, protocol=HIGHEST_PROTOCOL)
+
+    bundle_path = scenario_dir / BUNDLE_FILE_NAME
+    temporary_path = scenario_dir / f'.{BUNDLE_FILE_NAME}.tmp'
+    with temporary_path.open('wb') as bundle:
+        bundle.write(BUNDLE_HEADER)
+        bundle.write(INDEX_LENGTH.pack(len(index_blob)))
+        bundle.write(index_blob)
+        for blob in blobs:
+            bundle.write(blob)
+    temporary_path.replace(bundle_path)
+
+    return bundle_path
+
+
+def load_bundled_service(scenario_dir: Path, service_name: str) -> Optional[BundledFiles]:
+    """Read the interactions of the service from the bundle of the scenario, if there is one."""
+    bundle_path = scenario_dir / BUNDLE_FILE_NAME
+
+    try:
+        with bundle_path.open('rb') as bundle:
+            header = bundle.readline(len(BUNDLE_HEADER) + 16)
+            if not header.startswith(BUNDLE_MAGIC):
+                logger.warning('Ignoring %s: not a scenario bundle', bundle_path)
+                return None
+            if header != BUNDLE_HEADER:
+                logger.warning(
+                    'Ignoring %s: built with format %s, expected %d, build it again',
+                    bundle_path,
+                    header[len(BUNDLE_MAGIC):].strip().decode('ascii', 'replace'),
+                    BUNDLE_FORMAT_VERSION,
+                )
+                return None
+
+            index_length, = INDEX_LENGTH.unpack(bundle.read(INDEX_LENGTH.size))
+            index = pickle_loads(bundle.read(index_length))
+            blobs_start = bundle.tell()
+
+            try:
+                offset, length = index[service_name]
+            except KeyError:
+                return None
+
+            bundle.seek(blobs_start + offset)
+            bundled_files = pickle_loads(bundle.read(length))
+    except FileNotFoundError:
+        return None
+    except (AttributeError, EOFError, ImportError, UnpicklingError) as e:
+        logger.warning('Ignoring %s: %s', bundle_path, e)
+        return None
+
+    service_dir = scenario_dir / service_name
+    try:
+        for _, interaction in bundled_files.values():
+            if interaction.response.body_file is not None:
+                interaction.response.load_body_file(service_dir)
+    except OSError as e:
+        logger.warning(
+            'Ignoring %s for %s: cannot map a body file: %s', bundle_path, service_name, e,
+        )
+        return None
+
+    return bundled_files
@@ -0,0 +1,194 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of INSPIRE-MITMPROXY.
+# Copyright (C) 2018 CERN.
+#
+# INSPIRE is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# INSPIRE is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with INSPIRE. If not, see <http://www.gnu.org/licenses/>.
+#
+# In applying this license, CERN does not waive the privileges and immunities
+# granted to it by virtue of its status as an Intergovernmental Organization
+# or submit itself to any jurisdiction.
+
+
+"""Index of the recorded scenarios, kept up to date by checking mtimes of directories.
+
+The index mirrors the ``SCENARIOS_PATH/<scenario>/<service>/<interaction>.yaml`` tree. Listing a
+directory changes only its own mtime, so on refresh a directory is listed again only if its mtime
+changed, and files are never stat-ed. Directories modified less than ``RACY_WINDOW_NS`` ago are
+listed again on every refresh, as further changes within the timestamp granularity of the
+filesystem would go unnoticed.
+"""
+
+from bisect import bisect_left
+from itertools import takewhile
+from os import scandir, stat
+from pathlib import Path
+from threading import Lock
+from time import time
+from typing import Dict, List, Optional
+
+
+RACY_WINDOW_NS = 2 * 10**9
+
+
+class IndexedDir:
+    """Mtime of a directory at the time it was listed, ``None`` if it has to be listed again."""
+    def __init__(self) -> None:
+        self.mtime: Optional[int] = None
+
+    def is_stale(self, path: Path) -> bool:
+        """Stat the directory and return whether it has changed since it was listed.
+
+        Marks the directory as listed, so it has to be actually listed if ``True`` is returned.
+        """
+        mtime = stat(path).st_mtime_ns
+        is_stale = mtime != self.mtime
+        self.mtime = mtime if mtime < time() * 10**9 - RACY_WINDOW_NS else None
+        return is_stale
+
+
+class IndexedService(IndexedDir):
+    def __init__(self) -> None:
+        super(IndexedService, self).__init__()
+        self.files: List[str] = []
+
+
+class IndexedScenario(IndexedDir):
+    def __init__(self) -> None:
+        super(IndexedScenario, self).__init__()
+        self.services: Dict[str, IndexedService] = {}
+
+
+class ScenarioIndex(IndexedDir):
+    def __init__(self, path: Path) -> None:
+        super(ScenarioIndex, self).__init__()
+        self.path = path
+        self.scenarios: Dict[str, IndexedScenario] = {}
+        self.names: List[str] = []
+        self._lock = Lock()
+
+    def refresh(self):
+        """List again the directories which changed since the last refresh."""
+        with self._lock:
+            try:
+                if self.is_stale(self.path):
+                    self.names = sorted(
+                        entry.name for entry in scandir(self.path) if entry.is_dir()
+                    )
+                    self.scenarios = {
+                        name: self.scenarios.get(name) or IndexedScenario()
+                        for name in self.names
+                    }
+            except FileNotFoundError:
+                self.mtime = None
+                self.names = []
+                self.scenarios = {}
+
+            for name, scenario in self.scenarios.items():
+                self._refresh_scenario(self.path / name, scenario)
+
+    def refresh_service(self, scenario_name: str, service_name: str):
+        """List again the interactions of the service, e.g. after recording one."""
+        with self._lock:
+            scenario = self.scenarios.get(scenario_name)
+            if scenario is None:
+                return
+
+            service = scenario.services.setdefault(service_name, IndexedService())
+            service.mtime = None
+            self._refresh_service(self.path / scenario_name / service_name, service)
+
+    def _refresh_scenario(self, path: Path, scenario: IndexedScenario):
+        try:
+            if scenario.is_stale(path):
+                scenario.services = {
+                    entry.name: scenario.services.get(entry.name) or IndexedService()
+                    for entry in scandir(path) if entry.is_dir()
+                }
+        except FileNotFoundError:
+            scenario.mtime = None
+            scenario.services = {}
+
+        for name, service in scenario.services.items():
+            self._refresh_service(path / name, service)
+
+    @staticmethod
+    def _refresh_service(path: Path, service: IndexedService):
+        try:
+            if service.is_stale(path):
+                service.files = sorted(
+                    entry.name for entry in scandir(path)
+                    if entry.name.endswith('.yaml') and entry.is_file()
+                )
+        except FileNotFoundError:
+            service.mtime = None
+            service.files = []
+
+    def get_scenarios(
+        self,
+        prefix: Optional[str] = None,
+        service: Optional[str] = None,
+        offset: int = 0,
+        limit: Optional[int] = None,
+    ) -> Dict[str, Dict[str, Dict[str, List[str]]]]:
+        """Scenarios sorted by name, with the interaction files of each of their services.
+
+        Only scenarios with names starting with ``prefix``, and having recorded interactions
+        for ``service`` (only these are then listed) are returned, skipping the first ``offset``
+        ones and returning at most ``limit``.
+        """
+        with self._lock:
+            names = self.names
+            if prefix:
+                start = bisect_left(names, prefix)
+                names = list(takewhile(lambda name: name.startswith(prefix), names[start:]))
+            if service:
+                names = [name for name in names if service in self.scenarios[name].services]
+
+            end = None if limit is None else offset + limit
+
+            return {
+                name: {
+                    'responses': {
+                        service_name: list(indexed_service.files)
+                        for service_name, indexed_service
+                        in self.scenarios[name].services.items()
+                        if not service or service_name == service
+                    }
+                }
+                for name in names[offset:end]
+            }
+
+
+_indexes: Dict[Path, ScenarioIndex] = {}
+_indexes_lock = Lock()
+
+
+def get_scenario_index(path: Path) -> ScenarioIndex:
+    """The index for the scenarios directory, shared by all users of the same path."""
+    with _indexes_lock:
+        try:
+            return _indexes[path]
+        except KeyError:
+            index = _indexes[path] = ScenarioIndex(path)
+            return index
+
+
+def refresh_indexed_service(path: Path, scenario_name: str, service_name: str):
+    """Update the index of the scenarios directory, if any, after recording to a service."""
+    with _indexes_lock:
+        index = _indexes.get(path)
+
+    if index is not None:
+        index.refresh_service(scenario_name, service_name)
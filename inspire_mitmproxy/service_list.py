@@ -22,10 +22,12 @@
 
 """Priority-ordered list of services for the proxy."""
 
-from typing import Any, Dict, List
+from typing import Any, Dict, List, Optional, Tuple
 
 from .errors import InvalidServiceParams, InvalidServiceType
-from .services.base_service import BaseService
+from .host_trie import HostTrie
+from .http import MITMRequest
+from .services.base_service import BaseService, get_request_host
 from .services.whitelist_service import WhitelistService
 
 
@@ -38,15 +40,49 @@ SERVICE_TYPENAME_TO_CLASS_MAP = {
 class ServiceList:
     def __init__(self, service_list: List[BaseService]) -> None:
         self._service_list = service_list
+        self._build_routing_table()
 
     def replace_from_descrition(self, service_list: List[Dict[str, Any]]):
         self._service_list = [
             self._instantiate_service_from_dict(description)
             for description in service_list
         ]
+        self._build_routing_table()
 
     def prepend(self, *args: BaseService):
         self._service_list = list(args) + self._service_list
+        self._build_routing_table()
+
+    def _build_routing_table(self):
+        """Map hosts and host patterns to the first service (by priority) listening on them.
+
+        Services with their own :meth:`~BaseService.handles_request` are kept apart with their
+        priority, as the host is not enough to know whether they handle a request.
+        """
+        self._services_by_host: HostTrie[Tuple[int, BaseService]] = HostTrie()
+        self._services_by_request: List[Tuple[int, BaseService]] = []
+
+        for priority, service in enumerate(self._service_list):
+            if type(service).handles_request is not BaseService.handles_request:
+                self._services_by_request.append((priority, service))
+                continue
+
+            for host in service.hosts_list:
+                self._services_by_host.add(host, (priority, service))
+
+    def find_service_for_request(self, request: MITMRequest) -> Optional[BaseService]:
+        """First service in the list which handles the request, if any."""
+        host = get_request_host(request)
+        routed = min(self._services_by_host.find(host), default=None) if host else None
+        routed_priority = routed[0] if routed else len(self._service_list)
+
+        for priority, service in self._services_by_request:
+            if priority > routed_priority:
+                break
+            if service.handles_request(request):
+                return service
+
+        return routed[1] if routed else None
 
     def _instantiate_service_from_dict(self, description: Dict[str, Any]) -> BaseService:
         service_typename = description.pop('type', 'BaseService')
@@ -22,47 +22,158 @@
 
 """Base for fake services."""
 
+from functools import partial
+from logging import getLogger
 from os import environ
 from pathlib import Path
-from typing import Any, Dict, List
+from threading import Lock, RLock
+from typing import Any, Callable, Dict, List, Optional, Tuple, cast
 from urllib.parse import splitport  # type: ignore
 from urllib.parse import urlparse
 
 from ..errors import DoNotIntercept, NoMatchingRecording, ScenarioNotInService
+from ..host_trie import check_host_pattern, host_matches_pattern
 from ..http import MITMRequest, MITMResponse
 from ..interaction import Interaction
+from ..interaction_index import InteractionIndex
+from ..parallel_loader import ParallelLoader, get_parallel_loader
+from ..recording_writer import get_recording_writer
+from ..scenario_bundle import load_bundled_service
+from ..scenario_index import refresh_indexed_service
+from ..watcher import is_watched
+
+
+logger = getLogger(__name__)
+
+
+def get_request_host(request: MITMRequest) -> Optional[str]:
+    """Host the request is for: from the Host header, or from the URL if there is none."""
+    host = request.get_header('host')
+    if host is None:
+        return urlparse(request.url).hostname
+
+    return splitport(host)[0]
+
+
+class CachedScenario:
+    """Interactions parsed from a scenario directory, with the mtimes they were read at.
+
+    ``dir_mtime`` is the mtime of the directory at the time of the last refresh, ``None`` if the
+    entry has to be refreshed on next access. ``files`` maps file names to their mtime and parsed
+    interaction, so that a refresh only has to re-parse the files which have changed.
+    """
+    def __init__(self) -> None:
+        self.dir_mtime: Optional[int] = None
+        self.files: Dict[str, Tuple[int, Interaction]] = {}
+        self.interactions: List[Interaction] = []
+        self._index: Optional[InteractionIndex] = None
+
+    def update(self, files: Dict[str, Tuple[int, Interaction]]):
+        self.files = files
+        self.interactions = [interaction for _, interaction in files.values()]
+        self._index = None
+
+    @property
+    def index(self) -> InteractionIndex:
+        """Index of the interactions, built on first use after each update."""
+        index = self._index
+        if index is None:
+            interactions = self.interactions
+            index = InteractionIndex(interactions)
+            # Do not keep the index if interactions changed meanwhile from a watcher thread
+            if self.interactions is interactions:
+                self._index = index
+        return index
+
+
+class SequenceCounter:
+    """Next sequence numbers for the names of recorded interactions, for each directory.
+
+    The number for a directory is computed once by ``seed``, then incremented in memory, under a
+    lock so that concurrent recordings never get the same number.
+    """
+    def __init__(self) -> None:
+        self._lock = Lock()
+        self._next_numbers: Dict[Path, int] = {}
+
+    def take(self, directory: Path, seed: Callable[[], int]) -> int:
+        with self._lock:
+            number = self._next_numbers.get(directory)
+            if number is None:
+                number = seed()
+            self._next_numbers[directory] = number + 1
+            return number
+
+    def reset(self):
+        """Forget the numbers, to seed them again, e.g. after recordings were deleted."""
+        with self._lock:
+            self._next_numbers.clear()
 
 
 class BaseService:
-    """Mocked service base."""
+    """Mocked service base.
+
+    ``hosts_list`` holds the host names the service listens on. Wildcard patterns like
+    ``*.cern.ch`` can be used to listen on all subdomains, other patterns raise
+    :exc:`ValueError`.
+    """
     def __init__(self, name: str, hosts_list: List[str]) -> None:
+        for pattern in hosts_list:
+            check_host_pattern(pattern)
+
         self.name = name
         self.active_scenario: str = 'default'
         self.interactions_replayed: Dict[str, Dict[str, Dict[str, Any]]] = {}
+        self.replays_lock = RLock()
         self.is_recording = False
         self.hosts_list = hosts_list
+        self.interactions_cache: Dict[Path, CachedScenario] = {}
+        self.sequence_counter = SequenceCounter()
 
     def set_active_scenario(self, active_scenario: str):
         self.active_scenario = active_scenario
-        self.interactions_replayed[self.active_scenario] = {}
+        with self.replays_lock:
+            self.interactions_replayed[self.active_scenario] = {}
+        self.invalidate_interactions_cache()
+        self.sequence_counter.reset()
 
     def handles_request(self, request: MITMRequest) -> bool:
-        """Can this service handle the request?"""
-        try:
-            host = splitport(request.headers['Host'])[0]
-        except (TypeError, KeyError):
-            host = urlparse(request.url).hostname
+        """Can this service handle the request?
+
+        Services overriding this method are not routed by host in
+        :class:`~inspire_mitmproxy.service_list.ServiceList`, but asked for each request.
+        """
+        host = get_request_host(request)
+        if not host:
+            return False
 
-        return host in self.hosts_list
+        return any(host_matches_pattern(host, pattern) for pattern in self.hosts_list)
 
     def should_replay(self, interaction: Interaction) -> bool:
         if interaction.max_replays < 0:
             return True
         return interaction.max_replays > self.get_interaction_replays_count(interaction.name)
 
+    def reserve_replay(self, interaction: Interaction) -> bool:
+        """Count a replay of the interaction if it has any left, as one atomic step.
+
+        Interactions that already used up their `max_replays` are rejected
+        without taking the lock, and unlimited ones skip the check.
+        """
+        limited = interaction.max_replays >= 0
+        if limited and not self.should_replay(interaction):
+            return False
+
+        with self.replays_lock:
+            if limited and not self.should_replay(interaction):
+                return False
+            self.increment_interaction_count(interaction.name)
+            return True
+
     def _get_matching_interaction(self, request):
-        for interaction in self.get_interactions_for_active_scenario():
-            if interaction.matches_request(request) and self.should_replay(interaction):
+        index = self.get_cached_active_scenario().index
+        for interaction in index.candidates(request):
+            if interaction.matches_request(request) and self.reserve_replay(interaction):
                 return interaction
 
     def _raise_do_not_intercept_if_recording(self, request):
@@ -86,7 +197,6 @@ class BaseService:
 
         response = matched_interaction.response
         matched_interaction.execute_callbacks()
-        self.increment_interaction_count(matched_interaction.name)
         return response
 
     def process_response(self, request: MITMRequest, response: MITMResponse):
@@ -94,25 +204,42 @@ class BaseService:
         if not self.is_recording:
             return
 
-        current_scenario_dir = self.get_path_for_active_scenario_dir(create=True)
-        interaction = Interaction.next_in_dir(
-            directory=current_scenario_dir,
+        # The flow can still change once the hook returned, before the interaction is written
+        request, response = request.detach(), response.detach()
+
+        current_scenario_dir = self.get_path_for_active_scenario_dir()
+        writer = get_recording_writer()
+        sequence_number = self.sequence_counter.take(
+            current_scenario_dir,
+            seed=lambda: Interaction.get_next_sequence_number_in_dir(
+                current_scenario_dir,
+                pending_names=writer.pending_names(current_scenario_dir),
+            ),
+        )
+        interaction = Interaction(
+            name=Interaction.DEFAULT_NAME_PATTERN.format(sequence_number),
             request=request,
             response=response,
         )
-        interaction.save_in_dir(current_scenario_dir)
+        on_saved = partial(self._on_interaction_saved, current_scenario_dir, self.active_scenario)
+        writer.save(interaction, current_scenario_dir, on_saved=on_saved)
+
+    def _on_interaction_saved(self, scenario_path: Path, scenario: str):
+        self.invalidate_interactions_cache(scenario_path)
+        refresh_indexed_service(scenario_path.parent.parent, scenario, self.name)
 
     def increment_interaction_count(self, interaction_name: str):
-        try:
-            self.interactions_replayed[self.active_scenario][interaction_name]['num_calls'] += 1
-        except KeyError:
-            self.interactions_replayed.setdefault(
-                self.active_scenario,
-                {},
-            ).setdefault(
-                interaction_name,
-                {'num_calls': 1},
-            )
+        with self.replays_lock:
+            try:
+                self.interactions_replayed[self.active_scenario][interaction_name]['num_calls'] += 1
+            except KeyError:
+                self.interactions_replayed.setdefault(
+                    self.active_scenario,
+                    {},
+                ).setdefault(
+                    interaction_name,
+                    {'num_calls': 1},
+                )
 
     def get_interaction_replays_count(self, interaction_name: str) -> int:
         try:
@@ -120,30 +247,186 @@ class BaseService:
         except KeyError:
             return 0
 
+    def get_replays_counts(self, scenario: str) -> Dict[str, Dict[str, Any]]:
+        """Snapshot of the replay counters of a scenario, safe to serialize."""
+        with self.replays_lock:
+            return {
+                name: dict(counter)
+                for name, counter in self.interactions_replayed.get(scenario, {}).items()
+            }
+
     def get_path_for_active_scenario_dir(self, create=False) -> Path:
+        return self.get_path_for_scenario_dir(self.active_scenario, create=create)
+
+    def get_path_for_scenario_dir(self, scenario: str, create=False) -> Path:
         scenarios_path = Path(environ.get('SCENARIOS_PATH', './scenarios/'))
-        interactions_dir = scenarios_path / self.active_scenario / self.name
+        interactions_dir = scenarios_path / scenario / self.name
 
         if create:
             interactions_dir.mkdir(parents=True, exist_ok=True)
 
         return interactions_dir
 
+    def invalidate_interactions_cache(self, scenario_path: Optional[Path] = None):
+        """Force the cached interactions to be checked against the disk on next access.
+
+        Invalidates the given scenario, or all of them if none is given. Only the files which
+        have changed since they were read are parsed again.
+        """
+        if scenario_path is None:
+            cached_scenarios = list(self.interactions_cache.values())
+        elif scenario_path in self.interactions_cache:
+            cached_scenarios = [self.interactions_cache[scenario_path]]
+        else:
+            cached_scenarios = []
+
+        for cached in cached_scenarios:
+            cached.dir_mtime = None
+
     def get_interactions_in_scenario(self, scenario_path: Path) -> List[Interaction]:
-        return [
-            Interaction.from_file(interaction_file=interaction_path)
-            for interaction_path in sorted(scenario_path.iterdir())
-            if interaction_path.is_file() and interaction_path.suffix == '.yaml'
-        ]
+        """Get interactions of the scenario, parsing the files only if they changed.
+
+        If a watcher covers the scenario (see :mod:`inspire_mitmproxy.watcher`), this is a lookup
+        in :attr:`interactions_cache` once the scenario is cached, as the watcher reports the
+        changes. Otherwise each call stats the scenario directory and every cached interaction
+        file, which costs one ``stat`` per interaction. If the mtime of the directory or of any
+        file changed, the directory is listed again and the files whose mtime changed are parsed.
+        """
+        return self.get_cached_scenario(scenario_path).interactions
+
+    def get_cached_scenario(
+        self,
+        scenario_path: Path,
+        loader: Optional[ParallelLoader] = None,
+    ) -> CachedScenario:
+        """Get the cached scenario, refreshing it if needed.
+
+        On first access the cache is seeded from the scenario bundle, if one was built (see
+        :mod:`inspire_mitmproxy.scenario_bundle`), so that only the files changed since then
+        need to be parsed. These are parsed with the ``loader``, by default the one returned by
+        :func:`~inspire_mitmproxy.parallel_loader.get_parallel_loader`.
+
+        Unless a watcher reports the changes (see :mod:`inspire_mitmproxy.watcher`), the mtimes
+        of the directory and of the cached files are checked on each access, so that files
+        edited in place are picked up too.
+        """
+        cached = self.interactions_cache.get(scenario_path)
+
+        if cached is None:
+            cached = self.interactions_cache[scenario_path] = CachedScenario()
+            cached.files = load_bundled_service(scenario_path.parent, scenario_path.name) or {}
+
+        if cached.dir_mtime is not None and is_watched(scenario_path):
+            return cached
+
+        dir_mtime = scenario_path.stat().st_mtime_ns
+
+        if cached.dir_mtime != dir_mtime or self._cached_files_changed(scenario_path, cached):
+            self._refresh_cached_scenario(scenario_path, cached, loader=loader)
+            cached.dir_mtime = dir_mtime
+
+        return cached
+
+    @staticmethod
+    def _cached_files_changed(scenario_path: Path, cached: CachedScenario) -> bool:
+        for file_name, (mtime, _) in cached.files.items():
+            try:
+                if (scenario_path / file_name).stat().st_mtime_ns != mtime:
+                    return True
+            except FileNotFoundError:
+                return True
+
+        return False
+
+    def refresh_changed_path(self, path: Path):
+        """Refresh the cache after a change on disk reported by a watcher.
+
+        Only the interaction in the changed file is parsed again. Changed directories invalidate
+        the cached scenarios in them.
+        """
+        cached = self.interactions_cache.get(path.parent)
+        if cached is None or path.suffix != '.yaml':
+            for scenario_path, cached_scenario in self.interactions_cache.items():
+                if scenario_path == path or path in scenario_path.parents:
+                    cached_scenario.dir_mtime = None
+            return
+
+        if cached.dir_mtime is None:
+            return
+
+        files = dict(cached.files)
+        try:
+            mtime = path.stat().st_mtime_ns
+            if path.name in files and files[path.name][0] == mtime:
+                return
+            files[path.name] = (mtime, Interaction.from_file(interaction_file=path))
+        except FileNotFoundError:
+            files.pop(path.name, None)
+        except Exception:
+            logger.exception('Error reloading %s, scenario will be read again', path)
+            cached.dir_mtime = None
+            return
+
+        cached.update(dict(sorted(files.items())))
+
+    @staticmethod
+    def _refresh_cached_scenario(
+        scenario_path: Path,
+        cached: CachedScenario,
+        loader: Optional[ParallelLoader] = None,
+    ):
+        files: Dict[str, Optional[Tuple[int, Interaction]]] = {}
+        changed_paths = []
+
+        for interaction_path in sorted(scenario_path.iterdir()):
+            if not interaction_path.is_file() or interaction_path.suffix != '.yaml':
+                continue
+
+            mtime = interaction_path.stat().st_mtime_ns
+            cached_file = cached.files.get(interaction_path.name)
+
+            if cached_file and cached_file[0] == mtime:
+                files[interaction_path.name] = cached_file
+            else:
+                files[interaction_path.name] = None
+                changed_paths.append(interaction_path)
+
+        if changed_paths:
+            files.update((loader or get_parallel_loader()).load(changed_paths))
+
+        unchanged = cached.interactions and len(files) == len(cached.files) and all(
+            cached.files.get(name) is cached_file for name, cached_file in files.items()
+        )
+        if not unchanged:
+            cached.update(cast(Dict[str, Tuple[int, Interaction]], files))
+
+    def preload_scenario(self, scenario: str, loader: Optional[ParallelLoader] = None) \
+            -> Optional[int]:
+        """Parse and index the interactions of the scenario ahead of its first use.
+
+        Files are parsed with the given loader, or the default one (see
+        :mod:`inspire_mitmproxy.parallel_loader`). Returns the number of interactions, ``None`` if
+        the service has no recordings in the scenario.
+        """
+        scenario_path = self.get_path_for_scenario_dir(scenario)
+        if not scenario_path.is_dir():
+            return None
+
+        cached = self.get_cached_scenario(scenario_path, loader=loader)
+        cached.index  # built on first use, build it now
+        return len(cached.interactions)
 
     def get_interactions_for_active_scenario(self) -> List[Interaction]:
         """Get a list of scenarios"""
+        return self.get_cached_active_scenario().interactions
+
+    def get_cached_active_scenario(self) -> CachedScenario:
         scenario_dir = self.get_path_for_active_scenario_dir(create=False)
 
         if not scenario_dir.exists():
             raise ScenarioNotInService(self.name, self.active_scenario)
 
-        return self.get_interactions_in_scenario(scenario_dir)
+        return self.get_cached_scenario(scenario_dir)
 
     def __eq__(self, other) -> bool:
         return (
@@ -25,20 +25,44 @@
 from json import JSONDecodeError
 from json import dumps as json_dumps
 from json import loads as json_loads
-from os import environ
+from logging import getLogger
+from os import environ, sysconf
 from pathlib import Path
-from re import compile
-from typing import Dict, List, Match, Optional, Union, cast
-from urllib.parse import urlparse
+from re import compile, split
+from time import perf_counter
+from typing import Any, Dict, List, Match, Optional, Union, cast
+from urllib.parse import parse_qs, urlparse
 
 from autosemver.packaging import get_current_version
 
+from ..callbacks import (
+    CALLBACK_ENGINES,
+    DEFAULT_CALLBACK_ENGINE,
+    get_callback_engine,
+    get_session_pool,
+    set_callback_engine
+)
 from ..errors import InvalidRequest, RequestNotHandledInService, ServiceNotFound
 from ..http import MITMHeaders, MITMRequest, MITMResponse
+from ..parallel_loader import ParallelLoader
+from ..recording_writer import get_recording_writer
+from ..scenario_index import get_scenario_index
 from ..service_list import ServiceList
 from ..services.base_service import BaseService
 
 
+logger = getLogger(__name__)
+
+
+def get_memory_usage() -> int:
+    """Resident memory of the process in bytes, 0 if it cannot be read."""
+    try:
+        with open('/proc/self/statm') as statm:
+            return int(statm.read().split()[1]) * sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError):
+        return 0
+
+
 class ManagementService(BaseService):
     INTERACTIONS_ENDPOINT = compile(r'/service/(\w+)/interactions')
 
@@ -49,12 +73,25 @@ class ManagementService(BaseService):
         )
 
         self.services = services
+        self.version = get_current_version(project_name='inspire_mitmproxy')
         self.config = {
             'active_scenario': 'default',
         }
         self.is_recording = False
         self.propagate_option_changes()
 
+        preload = environ.get('SCENARIOS_PRELOAD')
+        if preload:
+            report = self.preload_scenarios(
+                scenarios=None if preload == '*' else split(r'[\s,]+', preload.strip()),
+                processes=int(environ.get('SCENARIOS_PRELOAD_PROCESSES', 0)),
+            )
+            logger.info(
+                'Preloaded %d scenarios in %.2f s',
+                len(report['scenarios']),
+                report['seconds'],
+            )
+
     def get_active_scenario(self):
         return self.config.get('active_scenario', 'default')
 
@@ -72,7 +109,12 @@ class ManagementService(BaseService):
             service_name = match.group(1)
             return self.build_response(200, self.get_service_interactions(service_name))
         elif path == '/scenarios' and method == 'GET':
-            return self.build_response(200, self.get_scenarios())
+            return self.build_response(
+                200,
+                self.get_scenarios(**self.parse_scenarios_query(request)),
+            )
+        elif path == '/scenarios/preload' and method == 'POST':
+            return self.build_response(201, self.post_preload(request))
         elif path == '/config' and method == 'GET':
             return self.build_response(200, self.get_config())
         elif path == '/config' and method == 'PUT':
@@ -83,6 +125,12 @@ class ManagementService(BaseService):
             return self.build_response(204, self.set_recording(request))
         elif path == '/record' and method == 'POST':
             return self.build_response(201, self.set_recording(request))
+        elif path == '/record/flush' and method == 'POST':
+            return self.build_response(201, self.flush_recordings())
+        elif path == '/version' and method == 'GET':
+            return self.build_response(200, self.get_version())
+        elif path == '/callbacks' and method == 'GET':
+            return self.build_response(200, self.get_callbacks())
 
         raise RequestNotHandledInService(self.name, request)
 
@@ -102,22 +150,103 @@ class ManagementService(BaseService):
         except (JSONDecodeError, KeyError, ValueError):
             raise InvalidRequest(self.name, request)
 
-    def get_scenarios(self) -> dict:
-        path = Path(environ.get('SCENARIOS_PATH', './scenarios/'))
-        response: Dict[str, Dict[str, Dict[str, List[str]]]] = {
-            scenario.name: {
-                'responses': {
-                    service.name: [
-                        response_file.name for response_file in sorted(service.iterdir())
-                        if response_file.is_file() and response_file.suffix == '.yaml'
-                    ]
-                    for service in scenario.iterdir() if service.is_dir()
-                }
+    def get_scenarios(
+        self,
+        prefix: Optional[str] = None,
+        service: Optional[str] = None,
+        offset: int = 0,
+        limit: Optional[int] = None,
+    ) -> dict:
+        """See :meth:`~inspire_mitmproxy.scenario_index.ScenarioIndex.get_scenarios`."""
+        index = get_scenario_index(Path(environ.get('SCENARIOS_PATH', './scenarios/')))
+        index.refresh()
+        return index.get_scenarios(prefix=prefix, service=service, offset=offset, limit=limit)
+
+    def parse_scenarios_query(self, request: MITMRequest) -> dict:
+        query = parse_qs(urlparse(request.url).query)
+        try:
+            params: Dict[str, Any] = {
+                name: query[name][0] for name in ('prefix', 'service') if name in query
             }
-            for scenario in path.iterdir() if scenario.is_dir()
+            for name in ('offset', 'limit'):
+                if name in query:
+                    params[name] = int(query[name][0])
+                    if params[name] < 0:
+                        raise ValueError(name)
+        except ValueError:
+            raise InvalidRequest(self.name, request)
+
+        return params
+
+    def post_preload(self, request: MITMRequest) -> dict:
+        try:
+            options = json_loads(request.body or '{}')
+            scenarios = options.get('scenarios')
+            processes = int(options.get('processes', 0))
+            if scenarios is not None and (
+                not isinstance(scenarios, list) or
+                not all(isinstance(scenario, str) for scenario in scenarios)
+            ):
+                raise ValueError(scenarios)
+        except (JSONDecodeError, AttributeError, TypeError, ValueError):
+            raise InvalidRequest(self.name, request)
+
+        return self.preload_scenarios(scenarios=scenarios, processes=processes)
+
+    def preload_scenarios(self, scenarios: Optional[List[str]] = None, processes: int = 0) \
+            -> dict:
+        """Parse and index the scenarios (all of them by default) for all services.
+
+        With ``processes``, the interaction files are parsed in a pool of that many processes,
+        otherwise with the default loader of the services. Returns for each scenario the number
+        of interactions of each service, and the time and memory its loading took. Scenarios
+        which fail to load do not stop the others from being loaded, and have an ``error``
+        instead of their interactions.
+        """
+        if scenarios is None:
+            index = get_scenario_index(Path(environ.get('SCENARIOS_PATH', './scenarios/')))
+            index.refresh()
+            scenarios = list(index.names)
+
+        loader = ParallelLoader(workers=processes) if processes > 0 else None
+        start, memory_start = perf_counter(), get_memory_usage()
+        report: Dict[str, Any] = {}
+
+        try:
+            for scenario in scenarios:
+                scenario_start, scenario_memory_start = perf_counter(), get_memory_usage()
+                scenario_report: Dict[str, Any]
+                try:
+                    scenario_report = {'interactions': self._preload_scenario(scenario, loader)}
+                except Exception as e:
+                    logger.exception('Error preloading scenario %s', scenario)
+                    scenario_report = {'error': f'{e.__class__.__name__}: {e}'}
+
+                scenario_report['seconds'] = perf_counter() - scenario_start
+                scenario_report['memory'] = get_memory_usage() - scenario_memory_start
+                report[scenario] = scenario_report
+        finally:
+            if loader is not None:
+                loader.shutdown()
+
+        return {
+            'scenarios': report,
+            'seconds': perf_counter() - start,
+            'memory': get_memory_usage() - memory_start,
         }
 
-        return response
+    def _preload_scenario(self, scenario: str, loader: Optional[ParallelLoader]) \
+            -> Dict[str, int]:
+        interactions = {}
+        for service in self.services:
+            if service is self:
+                continue
+
+            num_interactions = service.preload_scenario(scenario, loader=loader)
+            if num_interactions is not None:
+                interactions[service.name] = num_interactions
+
+        return interactions
 
     def get_config(self) -> dict:
         return self.config
@@ -125,16 +254,29 @@ class ManagementService(BaseService):
     def put_config(self, request: MITMRequest):
         try:
             config_update = json_loads(request.body)
+            self.check_config(config_update)
             self.config.update(config_update)
             self.propagate_option_changes()
         except (JSONDecodeError, ValueError):
             raise InvalidRequest(self.name, request)
 
+    @staticmethod
+    def check_config(config: Any):
+        """Raise :exc:`ValueError` on invalid values, before any of them is applied."""
+        if not isinstance(config, dict):
+            raise ValueError('Config must be a JSON object')
+
+        callback_engine = config.get('callback_engine', DEFAULT_CALLBACK_ENGINE)
+        if callback_engine not in CALLBACK_ENGINES:
+            raise ValueError(f'Unknown callback engine: {callback_engine!r}')
+
     def post_config(self, request: MITMRequest):
         try:
-            self.config = json_loads(request.body)
+            new_config = json_loads(request.body)
+            self.check_config(new_config)
+            self.config = new_config
             self.propagate_option_changes()
-        except JSONDecodeError:
+        except (JSONDecodeError, ValueError):
             raise InvalidRequest(self.name, request)
 
     def set_recording(self, request: MITMRequest):
@@ -148,6 +290,28 @@ class ManagementService(BaseService):
         except (JSONDecodeError, KeyError, TypeError):
             raise InvalidRequest(self.name, request)
 
+    def get_version(self) -> dict:
+        return {
+            'version': self.version,
+        }
+
+    def get_callbacks(self) -> dict:
+        callbacks = get_callback_engine().stats()
+        callbacks['sessions'] = get_session_pool().stats()
+        return callbacks
+
+    def flush_recordings(self) -> dict:
+        """Wait for recorded interactions to be on disk.
+
+        ``failed`` counts the interactions which could not be saved since the proxy started.
+        """
+        writer = get_recording_writer()
+        writer.flush()
+        return {
+            'pending': writer.pending,
+            'failed': writer.failed,
+        }
+
     def build_response(self, code: int, json_message: Optional[Union[dict, list]]) -> MITMResponse:
         try:
             body = json_dumps(json_message, indent=2)
@@ -159,21 +323,20 @@ class ManagementService(BaseService):
             body=body,
             headers=MITMHeaders({
                 'Content-Type': ['application/json; encoding=UTF-8'],
-                'Server': [
-                    'inspire-mitmproxy/' + get_current_version(project_name='inspire_mitmproxy')
-                ]
+                'Server': ['inspire-mitmproxy/' + self.version]
             }),
         )
 
     def get_service_interactions(self, service_name) -> dict:
         for service in self.services:
             if service.name == service_name:
-                return service.interactions_replayed.get(self.get_active_scenario(), {})
+                return service.get_replays_counts(self.get_active_scenario())
 
         raise ServiceNotFound(service_name)
 
     def propagate_option_changes(self):
         """On change of config, propagate relevant information to services."""
+        set_callback_engine(self.config.get('callback_engine', DEFAULT_CALLBACK_ENGINE))
         for service in self.services:
             service.set_active_scenario(self.get_active_scenario())
             service.is_recording = self.is_recording
@@ -0,0 +1,292 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of INSPIRE-MITMPROXY.
+# Copyright (C) 2018 CERN.
+#
+# INSPIRE is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# INSPIRE is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with INSPIRE. If not, see <http://www.gnu.org/licenses/>.
+#
+# In applying this license, CERN does not waive the privileges and immunities
+# granted to it by virtue of its status as an Intergovernmental Organization
+# or submit itself to any jurisdiction.
+
+
+"""Watchers reporting changes to the files of recorded scenarios.
+
+With a watcher running, services do not check the scenario directories for changes on each
+request: the watcher reports changed files, and only these are parsed again. Watching is enabled
+with the environment variable ``MITM_PROXY_WATCH_SCENARIOS``:
+
+``inotify``
+    use inotify (Linux only)
+
+``poll``
+    scan the scenarios directory every ``MITM_PROXY_WATCH_INTERVAL`` seconds (default: 1)
+
+``1``
+    use inotify if available, polling otherwise
+"""
+
+from abc import ABC, abstractmethod
+from ctypes import CDLL, get_errno
+from ctypes.util import find_library
+from logging import getLogger
+from os import close, fsencode, read, scandir, strerror
+from pathlib import Path
+from select import select
+from struct import Struct
+from threading import Event, Lock, Thread
+from typing import Callable, Dict, Iterable, List, Optional, Set, Tuple
+
+
+logger = getLogger(__name__)
+
+DEFAULT_POLL_INTERVAL = 1.0
+
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ONLYDIR = 0x01000000
+IN_ISDIR = 0x40000000
+IN_CLOEXEC = 0o2000000
+
+WATCH_MASK = IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE \
+    | IN_DELETE_SELF | IN_MOVE_SELF | IN_ONLYDIR
+
+INOTIFY_EVENT = Struct('iIII')
+
+
+class ScenariosWatcher(ABC):
+    """Calls ``on_change`` from a background thread with the paths changed under ``path``.
+
+    Paths are of files written, created, moved or deleted, and of directories created, moved or
+    deleted, in which case their contents have to be considered changed.
+    """
+    def __init__(self, path: Path, on_change: Callable[[Path], None]) -> None:
+        self.path = path
+        self.on_change = on_change
+        self._stopped = Event()
+        self._thread: Optional[Thread] = None
+
+    def start(self):
+        self._thread = Thread(
+            target=self._watch,
+            name=f'inspire-mitmproxy-{type(self).__name__}',
+            daemon=True,
+        )
+        self._thread.start()
+        with _watchers_lock:
+            _watchers.append(self)
+
+    def stop(self):
+        with _watchers_lock:
+            if self in _watchers:
+                _watchers.remove(self)
+        self._stopped.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def covers(self, path: Path) -> bool:
+        return path == self.path or self.path in path.parents
+
+    @abstractmethod
+    def _watch(self):
+        """Report the changes with :meth:`_report` until stopped."""
+
+    def _report(self, path: Path):
+        try:
+            self.on_change(path)
+        except Exception:
+            logger.exception('Error refreshing %s', path)
+
+
+class PollingWatcher(ScenariosWatcher):
+    def __init__(
+        self,
+        path: Path,
+        on_change: Callable[[Path], None],
+        interval: float = DEFAULT_POLL_INTERVAL,
+    ) -> None:
+        super(PollingWatcher, self).__init__(path, on_change)
+        self.interval = interval
+        self._snapshot = self._scan()
+
+    def _scan(self) -> Dict[Path, Optional[int]]:
+        """Mtimes of all files under the path, ``None`` for directories."""
+        snapshot: Dict[Path, Optional[int]] = {}
+        directories = [self.path]
+
+        while directories:
+            directory = directories.pop()
+            try:
+                for entry in scandir(directory):
+                    path = directory / entry.name
+                    if entry.is_dir():
+                        snapshot[path] = None
+                        directories.append(path)
+                    elif entry.is_file():
+                        snapshot[path] = entry.stat().st_mtime_ns
+            except (FileNotFoundError, NotADirectoryError):
+                pass
+
+        return snapshot
+
+    def _watch(self):
+        while not self._stopped.wait(self.interval):
+            snapshot = self._scan()
+            changed = {
+                path for path in snapshot.keys() | self._snapshot.keys()
+                if snapshot.get(path, -1) != self._snapshot.get(path, -1)
+            }
+            self._snapshot = snapshot
+
+            for path in sorted(changed):
+                self._report(path)
+
+
+class InotifyWatcher(ScenariosWatcher):
+    def __init__(self, path: Path, on_change: Callable[[Path], None]) -> None:
+        super(InotifyWatcher, self).__init__(path, on_change)
+        self._libc = get_libc()
+        self._fd = self._libc.inotify_init1(IN_CLOEXEC)
+        if self._fd < 0:
+            raise OSError(get_errno(), strerror(get_errno()))
+
+        self._directories: Dict[int, Path] = {}
+        self._add_watches(path)
+        if not self._directories:
+            close(self._fd)
+            raise FileNotFoundError(f'Cannot watch {path}')
+
+    def _add_watches(self, path: Path) -> Iterable[Path]:
+        """Watch the directory and its subdirectories, returning the files found in them."""
+        wd = self._libc.inotify_add_watch(self._fd, fsencode(str(path)), WATCH_MASK)
+        if wd < 0:
+            return []
+        self._directories[wd] = path
+
+        found: List[Path] = []
+        try:
+            for entry in scandir(path):
+                entry_path = path / entry.name
+                if entry.is_dir():
+                    found.append(entry_path)
+                    found.extend(self._add_watches(entry_path))
+                else:
+                    found.append(entry_path)
+        except (FileNotFoundError, NotADirectoryError):
+            pass
+
+        return found
+
+    def _read_events(self) -> Iterable[Tuple[int, int, bytes]]:
+        buffer = read(self._fd, 64 * 1024)
+        offset = 0
+
+        while offset < len(buffer):
+            wd, mask, _, length = INOTIFY_EVENT.unpack_from(buffer, offset)
+            offset += INOTIFY_EVENT.size
+            name = buffer[offset:offset + length].rstrip(b'\0')
+            offset += length
+            yield wd, mask, name
+
+    def _watch(self):
+        try:
+            while not self._stopped.is_set():
+                if not select([self._fd], [], [], 0.5)[0]:
+                    continue
+
+                changed: Set[Path] = set()
+                for wd, mask, name in self._read_events():
+                    changed.update(self._handle_event(wd, mask, name))
+
+                for path in sorted(changed):
+                    self._report(path)
+        finally:
+            close(self._fd)
+
+    def _handle_event(self, wd: int, mask: int, name: bytes) -> Iterable[Path]:
+        if mask & IN_Q_OVERFLOW:
+            logger.warning('Too many changes under %s, refreshing everything', self.path)
+            return [self.path]
+
+        directory = self._directories.get(wd)
+        if mask & IN_IGNORED:
+            self._directories.pop(wd, None)
+            return []
+        if directory is None:
+            return []
+        if mask & (IN_DELETE_SELF | IN_MOVE_SELF):
+            return [directory]
+
+        path = directory / name.decode(errors='surrogateescape')
+        if mask & IN_ISDIR and mask & (IN_CREATE | IN_MOVED_TO):
+            return [path, *self._add_watches(path)]
+        if mask & IN_ISDIR or not mask & IN_CREATE:
+            return [path]
+
+        # Created files are reported when closed after writing
+        return []
+
+
+_libc: Optional[CDLL] = None
+
+
+def get_libc() -> CDLL:
+    global _libc
+
+    if _libc is None:
+        _libc = CDLL(find_library('c') or 'libc.so.6', use_errno=True)
+
+    return _libc
+
+
+def inotify_available() -> bool:
+    try:
+        return hasattr(get_libc(), 'inotify_init1')
+    except OSError:
+        return False
+
+
+_watchers: List[ScenariosWatcher] = []
+_watchers_lock = Lock()
+
+
+def is_watched(path: Path) -> bool:
+    """Whether changes under the path are reported by a running watcher."""
+    return any(watcher.covers(path) for watcher in _watchers)
+
+
+def start_watcher(
+    path: Path,
+    on_change: Callable[[Path], None],
+    method: str = '1',
+    interval: float = DEFAULT_POLL_INTERVAL,
+) -> ScenariosWatcher:
+    """Start watching with the given method (see module documentation)."""
+    watcher: ScenariosWatcher
+    if method == 'inotify' or (method == '1' and inotify_available()):
+        watcher = InotifyWatcher(path, on_change)
+    elif method in ('1', 'poll'):
+        watcher = PollingWatcher(path, on_change, interval=interval)
+    else:
+        raise ValueError(f'Unknown watch method {method!r}, use one of inotify, poll, 1')
+
+    watcher.start()
+    return watcher
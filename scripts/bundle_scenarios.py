@@ -0,0 +1,51 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# This file is part of INSPIRE-MITMPROXY.
+# Copyright (C) 2018 CERN.
+#
+# INSPIRE is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# INSPIRE is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with INSPIRE. If not, see <http://www.gnu.org/licenses/>.
+#
+# In applying this license, CERN does not waive the privileges and immunities
+# granted to it by virtue of its status as an Intergovernmental Organization
+
+"""Tool to compile scenarios into binary bundles, which load without parsing any YAML.
+
+Usage: bundle_scenarios.py [--help] SCENARIOS_DIR [SCENARIO_1 ...]
+
+This will build SCENARIOS_DIR/<scenario>/scenario.bundle for each of the given scenarios, or
+for all of the scenarios in SCENARIOS_DIR if none is given. Bundles have to be rebuilt after
+the interactions are changed: interactions edited after the bundle was built are parsed from
+their YAML files again.
+"""
+
+import sys
+from pathlib import Path
+
+from inspire_mitmproxy.scenario_bundle import build_bundle
+
+
+if len(sys.argv) < 2 or sys.argv[1] == '--help':
+    print(__doc__)
+    exit(1)
+
+scenarios_dir = Path(sys.argv[1])
+
+if len(sys.argv) > 2:
+    scenario_dirs = [scenarios_dir / scenario for scenario in sys.argv[2:]]
+else:
+    scenario_dirs = sorted(path for path in scenarios_dir.iterdir() if path.is_dir())
+
+for scenario_dir in scenario_dirs:
+    print(f'Creating {build_bundle(scenario_dir)}')
@@ -56,7 +56,12 @@ docs_require: List[str] = [
     'sphinx_rtd_theme',
 ]
 
+async_require = [
+    'aiohttp~=3.0,>=3.3.0',
+]
+
 extras_require = {
+    'async': async_require,
     'docs': docs_require,
     'tests': tests_require,
 }
@@ -25,8 +25,10 @@
 from distutils.dir_util import copy_tree
 from json import loads as json_loads
 from os import environ
+from pathlib import Path
 from time import sleep
 
+from mitmproxy.test import tflow
 from mock import patch
 from pytest import fixture, raises
 from yaml import load as yaml_load
@@ -34,6 +36,7 @@ from yaml import load as yaml_load
 from inspire_mitmproxy.dispatcher import Dispatcher
 from inspire_mitmproxy.errors import DoNotIntercept, ScenarioNotInService, ServiceNotFound
 from inspire_mitmproxy.http import MITMHeaders, MITMRequest, MITMResponse
+from inspire_mitmproxy.interaction import Interaction
 from inspire_mitmproxy.services.base_service import BaseService
 
 
@@ -105,7 +108,7 @@ def test_base_service_process_request_test_scenario_replays_ok(dispatcher):
     response_set_config = dispatcher.process_request(request_set_config)
     assert response_set_config.status_code == 201
 
-    with patch('requests.request') as request:
+    with patch('requests.Session.request') as request:
         response_service_1 = dispatcher.process_request(request_service_1)
         assert response_service_1.body == b'test_scenario_replays_ok/TestServiceA/0'
 
@@ -236,7 +239,7 @@ def test_get_service_interactions(dispatcher: Dispatcher):
     response_set_config = dispatcher.process_request(request_set_config)
     assert response_set_config.status_code == 201
 
-    with patch('requests.request') as request:
+    with patch('requests.Session.request') as request:
         response_service_a_1 = dispatcher.process_request(request_service_a)
         assert response_service_a_1.status_code == 200
 
@@ -336,6 +339,15 @@ def test_base_service_process_response_record_create_interaction_dir_if_does_not
         })
     )
 
+    request_flush_recordings = MITMRequest(
+        method='POST',
+        url='http://mitm-manager.local/record/flush',
+        headers=MITMHeaders({
+            'Host': ['mitm-manager.local'],
+            'Accept': ['application/json'],
+        })
+    )
+
     request_to_be_recorded = MITMRequest(
         method='GET',
         url='https://host_a.local/recordme',
@@ -361,6 +373,9 @@ def test_base_service_process_response_record_create_interaction_dir_if_does_not
 
     dispatcher.process_response(request_to_be_recorded, response_to_be_recorded)
 
+    response_flush_recordings = dispatcher.process_request(request_flush_recordings)
+    assert response_flush_recordings.status_code == 201
+
     service_interactions_dir = temporary_scenarios_dir.join('test_scenario_record_creates_dir')
     assert service_interactions_dir.exists()
     assert len(service_interactions_dir.listdir()) == 1
@@ -421,6 +436,15 @@ def test_base_service_process_response_record_when_empty_interactions_dir_exists
         })
     )
 
+    request_flush_recordings = MITMRequest(
+        method='POST',
+        url='http://mitm-manager.local/record/flush',
+        headers=MITMHeaders({
+            'Host': ['mitm-manager.local'],
+            'Accept': ['application/json'],
+        })
+    )
+
     request_to_be_recorded = MITMRequest(
         method='GET',
         url='https://host_a.local/recordme',
@@ -446,6 +470,9 @@ def test_base_service_process_response_record_when_empty_interactions_dir_exists
 
     dispatcher.process_response(request_to_be_recorded, response_to_be_recorded)
 
+    response_flush_recordings = dispatcher.process_request(request_flush_recordings)
+    assert response_flush_recordings.status_code == 201
+
     service_interactions_dir = temporary_scenarios_dir.join('test_scenario_record_dir_exists')
     assert service_interactions_dir.exists()
     assert len(service_interactions_dir.listdir()) == 1
@@ -513,6 +540,15 @@ def test_base_service_process_response_record_when_dir_exists_and_has_some_inter
         })
     )
 
+    request_flush_recordings = MITMRequest(
+        method='POST',
+        url='http://mitm-manager.local/record/flush',
+        headers=MITMHeaders({
+            'Host': ['mitm-manager.local'],
+            'Accept': ['application/json'],
+        })
+    )
+
     request_to_be_recorded = MITMRequest(
         method='GET',
         url='https://host_a.local/recordme',
@@ -541,6 +577,9 @@ def test_base_service_process_response_record_when_dir_exists_and_has_some_inter
 
     dispatcher.process_response(request_to_be_recorded, response_to_be_recorded)
 
+    response_flush_recordings = dispatcher.process_request(request_flush_recordings)
+    assert response_flush_recordings.status_code == 201
+
     service_interactions_dir = temporary_scenarios_dir.join('test_scenario_record_not_empty')
     assert service_interactions_dir.exists()
     assert len(service_interactions_dir.listdir()) == 1
@@ -549,3 +588,45 @@ def test_base_service_process_response_record_when_dir_exists_and_has_some_inter
     out_file = service_interactions_dir.join('TestServiceA').join('interaction_1.yaml').read()
     result_recording = yaml_load(out_file)
     assert expected_recording == result_recording
+
+
+def test_base_service_replays_body_file_through_dispatcher(tmpdir):
+    scenarios_dir = tmpdir.mkdir('scenarios')
+    service_dir = scenarios_dir.mkdir('test_scenario_body_file').mkdir('TestServiceA')
+    flow = tflow.tflow()
+    flow.request.host = 'host_a.local'
+
+    interaction = Interaction(
+        name='interaction_0',
+        request=MITMRequest.from_mitmproxy(flow.request),
+        response=MITMResponse(
+            body=b'%PDF-1.4' + b'\x00' * 100,
+            headers=MITMHeaders({'Content-Type': ['application/pdf']}),
+        ),
+    )
+    with patch.dict(environ, {'MITM_PROXY_BODY_FILE_THRESHOLD': '100'}):
+        interaction.save_in_dir(Path(service_dir.strpath))
+
+    request_set_config = MITMRequest(
+        method='POST',
+        url='http://mitm-manager.local/config',
+        body='{"active_scenario": "test_scenario_body_file"}',
+        headers=MITMHeaders({
+            'Host': ['mitm-manager.local'],
+            'Accept': ['application/json'],
+        })
+    )
+
+    with patch.dict(environ, {'SCENARIOS_PATH': scenarios_dir.strpath}):
+        dispatcher = Dispatcher(
+            service_list=[BaseService(name='TestServiceA', hosts_list=['host_a.local'])],
+        )
+        response_set_config = dispatcher.process_request(request_set_config)
+        assert response_set_config.status_code == 201
+
+        dispatcher.request(flow)
+
+    assert service_dir.join('interaction_0.body').check(file=1)
+    assert flow.response.status_code == 200
+    assert isinstance(flow.response.raw_content, bytes)
+    assert flow.response.raw_content == interaction.response.body
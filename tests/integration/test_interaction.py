@@ -38,7 +38,7 @@ def interaction_callback(request):
 
 
 def test_interaction_execute_callbacks(interaction_callback: Interaction):
-    with patch('requests.request') as request:
+    with patch('requests.Session.request') as request:
         interaction_callback.execute_callbacks()
 
         sleep(1)
@@ -22,16 +22,26 @@
 
 """Test BaseService"""
 
-from os import chdir, environ, getcwd
+from os import chdir, environ, getcwd, utime
 from pathlib import Path
+from sys import getswitchinterval, setswitchinterval
+from threading import Thread
 from typing import Optional
 
-from mock import patch
+from mock import Mock, patch
 from pytest import fixture, mark, raises
 
 from inspire_mitmproxy.errors import NoMatchingRecording, ScenarioNotInService
-from inspire_mitmproxy.http import MITMHeaders, MITMRequest, MITMResponse
-from inspire_mitmproxy.services.base_service import BaseService
+from inspire_mitmproxy.http import (
+    LazyMITMRequest,
+    LazyMITMResponse,
+    MITMHeaders,
+    MITMRequest,
+    MITMResponse
+)
+from inspire_mitmproxy.interaction import Interaction
+from inspire_mitmproxy.recording_writer import RecordingWriter
+from inspire_mitmproxy.services.base_service import BaseService, SequenceCounter
 
 
 @fixture(scope='function')
@@ -101,6 +111,26 @@ def test_base_service_handles_request(service: BaseService, request_: dict, hand
     assert service.handles_request(request_) == handled
 
 
+@mark.parametrize(
+    'host, handled',
+    [
+        ('sub.wildcard.local', True),
+        ('deep.sub.wildcard.local', True),
+        ('wildcard.local', False),
+    ],
+)
+def test_base_service_handles_request_wildcard(host: str, handled: bool):
+    service = BaseService(name='TestService', hosts_list=['*.wildcard.local'])
+    request = MITMRequest(url=f'http://{host}/api', headers=MITMHeaders({'Host': [host]}))
+
+    assert service.handles_request(request) == handled
+
+
+def test_base_service_rejects_invalid_host_patterns():
+    with raises(ValueError):
+        BaseService(name='TestService', hosts_list=['host_a.local', '*cern.ch'])
+
+
 def test_base_service_get_interactions_for_active_scenario(service: BaseService, scenarios_dir):
     expected_request_1 = MITMRequest(
         headers=MITMHeaders({
@@ -447,3 +477,247 @@ def test_should_always_replay(service: BaseService, scenarios_dir):
     for i in range(10):
         assert service.should_replay(interaction)
         service.process_request(request_1)
+
+
+@fixture
+def temporary_scenario_dir(request, tmpdir) -> Path:
+    fixtures_dir = request.fspath.join('../fixtures/scenarios/test_scenario/TestService')
+    scenario_dir = tmpdir.join('scenarios').join('test_scenario').join('TestService')
+    fixtures_dir.copy(scenario_dir)
+    return Path(scenario_dir.strpath)
+
+
+def test_get_interactions_in_scenario_uses_cache(
+    service: BaseService,
+    temporary_scenario_dir: Path,
+):
+    first_result = service.get_interactions_in_scenario(temporary_scenario_dir)
+
+    with patch('inspire_mitmproxy.interaction.Interaction.from_file') as from_file:
+        second_result = service.get_interactions_in_scenario(temporary_scenario_dir)
+
+        from_file.assert_not_called()
+
+    assert len(second_result) == 2
+    assert first_result[0] is second_result[0]
+    assert first_result[1] is second_result[1]
+
+
+def test_get_interactions_in_scenario_reparses_only_changed_files(
+    service: BaseService,
+    temporary_scenario_dir: Path,
+):
+    first_result = service.get_interactions_in_scenario(temporary_scenario_dir)
+
+    changed_file = temporary_scenario_dir / 'interaction_1.yaml'
+    changed_file.write_text(changed_file.read_text().replace('response2', 'changed'))
+    stat = changed_file.stat()
+    utime(str(changed_file), ns=(stat.st_atime_ns, stat.st_mtime_ns + 1000000000))
+    # Edited in place, so the mtime of the directory did not change
+
+    second_result = service.get_interactions_in_scenario(temporary_scenario_dir)
+
+    assert first_result[0] is second_result[0]
+    assert second_result[1].request.body == b'{"value": "changed"}'
+
+
+def test_get_interactions_in_scenario_picks_up_new_files(
+    service: BaseService,
+    temporary_scenario_dir: Path,
+):
+    service.get_interactions_in_scenario(temporary_scenario_dir)
+
+    (temporary_scenario_dir / 'interaction_2.yaml').write_text(
+        (temporary_scenario_dir / 'interaction_0.yaml').read_text()
+    )
+    stat = temporary_scenario_dir.stat()
+    utime(str(temporary_scenario_dir), ns=(stat.st_atime_ns, stat.st_mtime_ns + 1000000000))
+
+    result = service.get_interactions_in_scenario(temporary_scenario_dir)
+
+    assert [interaction.name for interaction in result] == [
+        'interaction_0',
+        'interaction_1',
+        'interaction_2',
+    ]
+
+
+def test_get_interactions_in_scenario_does_not_stat_when_watched(
+    service: BaseService,
+    temporary_scenario_dir: Path,
+):
+    service.get_interactions_in_scenario(temporary_scenario_dir)
+
+    (temporary_scenario_dir / 'interaction_2.yaml').write_text(
+        (temporary_scenario_dir / 'interaction_0.yaml').read_text()
+    )
+    stat = temporary_scenario_dir.stat()
+    utime(str(temporary_scenario_dir), ns=(stat.st_atime_ns, stat.st_mtime_ns + 1000000000))
+
+    with patch('inspire_mitmproxy.services.base_service.is_watched', return_value=True):
+        result = service.get_interactions_in_scenario(temporary_scenario_dir)
+
+    assert len(result) == 2
+
+
+def test_refresh_changed_path_reparses_only_changed_file(
+    service: BaseService,
+    temporary_scenario_dir: Path,
+):
+    first_result = service.get_interactions_in_scenario(temporary_scenario_dir)
+
+    changed_file = temporary_scenario_dir / 'interaction_1.yaml'
+    changed_file.write_text(changed_file.read_text().replace('response2', 'changed'))
+    service.refresh_changed_path(changed_file)
+
+    with patch('inspire_mitmproxy.services.base_service.is_watched', return_value=True):
+        second_result = service.get_interactions_in_scenario(temporary_scenario_dir)
+
+    assert first_result[0] is second_result[0]
+    assert second_result[1].request.body == b'{"value": "changed"}'
+
+
+def test_refresh_changed_path_removes_deleted_file(
+    service: BaseService,
+    temporary_scenario_dir: Path,
+):
+    service.get_interactions_in_scenario(temporary_scenario_dir)
+
+    deleted_file = temporary_scenario_dir / 'interaction_0.yaml'
+    deleted_file.unlink()
+    service.refresh_changed_path(deleted_file)
+
+    with patch('inspire_mitmproxy.services.base_service.is_watched', return_value=True):
+        result = service.get_interactions_in_scenario(temporary_scenario_dir)
+
+    assert [interaction.name for interaction in result] == ['interaction_1']
+
+
+def test_refresh_changed_path_invalid_file_invalidates_scenario(
+    service: BaseService,
+    temporary_scenario_dir: Path,
+):
+    service.get_interactions_in_scenario(temporary_scenario_dir)
+
+    changed_file = temporary_scenario_dir / 'interaction_1.yaml'
+    changed_file.write_text('request: [')
+    service.refresh_changed_path(changed_file)
+
+    assert service.interactions_cache[temporary_scenario_dir].dir_mtime is None
+
+
+def test_refresh_changed_path_directory_invalidates_scenarios_in_it(
+    service: BaseService,
+    temporary_scenario_dir: Path,
+):
+    service.get_interactions_in_scenario(temporary_scenario_dir)
+
+    service.refresh_changed_path(temporary_scenario_dir.parent)
+
+    assert service.interactions_cache[temporary_scenario_dir].dir_mtime is None
+
+
+def test_sequence_counter_seeds_once_per_directory():
+    counter = SequenceCounter()
+    seed = Mock(return_value=3)
+
+    assert counter.take(Path('/scenarios/a'), seed) == 3
+    assert counter.take(Path('/scenarios/a'), seed) == 4
+    assert counter.take(Path('/scenarios/b'), lambda: 0) == 0
+    assert counter.take(Path('/scenarios/a'), seed) == 5
+
+    seed.assert_called_once_with()
+
+    counter.reset()
+
+    assert counter.take(Path('/scenarios/a'), seed) == 3
+
+
+def test_process_response_concurrent_recordings_get_unique_names(tmpdir):
+    service = BaseService(name='TestService', hosts_list=['host_a.local'])
+    service.set_active_scenario('test_scenario')
+    service.is_recording = True
+    writer = RecordingWriter(fsync=False)
+    service_dir = Path(tmpdir.strpath) / 'test_scenario' / 'TestService'
+    service_dir.mkdir(parents=True)
+    (service_dir / 'interaction_4.yaml').touch()
+
+    def record(thread_number):
+        for number in range(25):
+            service.process_response(
+                MITMRequest(url=f'http://host_a.local/{thread_number}/{number}'),
+                MITMResponse(status_code=200),
+            )
+
+    with patch.dict(environ, {'SCENARIOS_PATH': tmpdir.strpath}), \
+            patch('inspire_mitmproxy.services.base_service.get_recording_writer',
+                  return_value=writer):
+        threads = [Thread(target=record, args=(number,)) for number in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+    assert writer.flush(timeout=10)
+    assert sorted(path.name for path in service_dir.iterdir()) == sorted(
+        f'interaction_{number}.yaml' for number in range(4, 205)
+    )
+
+
+@mark.parametrize(
+    'max_replays,expected_reserved',
+    [
+        (50, 50),
+        (-1, 16 * 40),
+    ]
+)
+def test_reserve_replay_concurrent(max_replays, expected_reserved):
+    service = BaseService(name='TestService', hosts_list=['host_a.local'])
+    service.set_active_scenario('test_scenario')
+    interaction = Interaction(
+        name='interaction_0',
+        request=MITMRequest(url='http://host_a.local/api'),
+        response=MITMResponse(status_code=200),
+        max_replays=max_replays,
+    )
+    reserved = []
+
+    def replay():
+        for _ in range(40):
+            if service.reserve_replay(interaction):
+                reserved.append(1)
+
+    switch_interval = getswitchinterval()
+    setswitchinterval(1e-6)
+    try:
+        threads = [Thread(target=replay) for _ in range(16)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    finally:
+        setswitchinterval(switch_interval)
+
+    assert len(reserved) == expected_reserved
+    assert service.get_replays_counts('test_scenario') == {
+        'interaction_0': {'num_calls': expected_reserved},
+    }
+
+
+def test_process_response_detaches_live_messages(tmpdir):
+    service = BaseService(name='TestService', hosts_list=['host_a.local'])
+    service.set_active_scenario('test_scenario')
+    service.is_recording = True
+    writer = Mock(pending_names=Mock(return_value=[]))
+    request = LazyMITMRequest(MITMRequest(url='http://host_a.local/api').to_mitmproxy())
+    response = LazyMITMResponse(MITMResponse(status_code=200, body='live').to_mitmproxy())
+
+    with patch.dict(environ, {'SCENARIOS_PATH': tmpdir.strpath}), \
+            patch('inspire_mitmproxy.services.base_service.get_recording_writer',
+                  return_value=writer):
+        service.process_response(request, response)
+
+    interaction = writer.save.call_args[0][0]
+    assert type(interaction.request) is MITMRequest
+    assert type(interaction.response) is MITMResponse
+    assert interaction.response.body == b'live'
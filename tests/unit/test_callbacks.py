@@ -0,0 +1,290 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of INSPIRE-MITMPROXY.
+# Copyright (C) 2018 CERN.
+#
+# INSPIRE is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# INSPIRE is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with INSPIRE. If not, see <http://www.gnu.org/licenses/>.
+#
+# In applying this license, CERN does not waive the privileges and immunities
+# granted to it by virtue of its status as an Intergovernmental Organization
+# or submit itself to any jurisdiction.
+
+
+"""Tests for the CallbackScheduler"""
+
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from threading import Event, Lock, Thread
+from time import monotonic
+
+from mock import patch
+from pytest import fixture, raises
+
+from inspire_mitmproxy.callbacks import (
+    AsyncCallbackEngine,
+    CallbackScheduler,
+    SessionPool,
+    get_callback_engine,
+    get_callback_scheduler,
+    get_session_pool,
+    set_callback_engine
+)
+from inspire_mitmproxy.http import MITMRequest
+
+
+def wait_until(condition, timeout=5):
+    deadline = monotonic() + timeout
+    while not condition() and monotonic() < deadline:
+        Event().wait(0.01)
+
+    return condition()
+
+
+class OkHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        self.send_response(200)
+        self.send_header('Set-Cookie', 'session=secret; Path=/')
+        self.send_header('Content-Length', '2')
+        self.end_headers()
+        self.wfile.write(b'ok')
+
+    def log_message(self, *args):
+        pass
+
+
+@fixture
+def callback_server_url():
+    server = HTTPServer(('127.0.0.1', 0), OkHandler)
+    thread = Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+
+    yield f'http://127.0.0.1:{server.server_port}'
+
+    server.shutdown()
+    server.server_close()
+
+
+def test_callback_scheduler_runs_callbacks_in_due_order():
+    scheduler = CallbackScheduler(workers=1)
+    called = []
+
+    scheduler.schedule(0.2, called.append, 'second')
+    scheduler.schedule(0.1, called.append, 'first')
+
+    assert wait_until(lambda: len(called) == 2)
+    assert called == ['first', 'second']
+
+
+def test_callback_scheduler_limits_concurrency():
+    scheduler = CallbackScheduler(workers=2)
+    lock = Lock()
+    running = []
+    max_running = []
+    release = Event()
+
+    def callback():
+        with lock:
+            running.append(None)
+            max_running.append(len(running))
+        release.wait(5)
+        with lock:
+            running.pop()
+
+    for _ in range(6):
+        scheduler.schedule(0, callback)
+
+    assert wait_until(lambda: len(max_running) == 2)
+    release.set()
+    assert wait_until(lambda: scheduler.stats()['completed'] == 6)
+    assert max(max_running) == 2
+
+
+def test_callback_scheduler_drops_callbacks_over_max_pending():
+    scheduler = CallbackScheduler(workers=1, max_pending=2)
+    release = Event()
+
+    assert scheduler.schedule(0, release.wait, 5)
+    assert scheduler.schedule(0, release.wait, 5)
+    assert not scheduler.schedule(0, release.wait, 5)
+
+    assert scheduler.stats()['pending'] == 2
+    assert scheduler.stats()['rejected'] == 1
+
+    release.set()
+    assert wait_until(lambda: scheduler.stats()['pending'] == 0)
+    assert scheduler.schedule(0, release.wait, 5)
+
+
+def test_callback_scheduler_stats():
+    scheduler = CallbackScheduler(workers=3, max_pending=10)
+
+    def fail():
+        raise RuntimeError('failing callback')
+
+    scheduler.schedule(0, fail)
+    scheduler.schedule(0, lambda: None)
+
+    assert wait_until(lambda: scheduler.stats()['pending'] == 0)
+
+    expected = {
+        'engine': 'threads',
+        'workers': 3,
+        'max_pending': 10,
+        'pending': 0,
+        'completed': 1,
+        'failed': 1,
+        'rejected': 0,
+    }
+
+    assert scheduler.stats() == expected
+
+
+@patch.dict('os.environ', {
+    'MITM_PROXY_CALLBACK_WORKERS': '3',
+    'MITM_PROXY_CALLBACK_MAX_PENDING': '20',
+})
+@patch('inspire_mitmproxy.callbacks._scheduler', None)
+def test_get_callback_scheduler_reads_environment():
+    scheduler = get_callback_scheduler()
+
+    assert scheduler.workers == 3
+    assert scheduler.max_pending == 20
+    assert get_callback_scheduler() is scheduler
+
+
+@patch('inspire_mitmproxy.callbacks.aiohttp', None)
+@patch('inspire_mitmproxy.callbacks.send_callback')
+def test_async_callback_engine_sends_callbacks_in_due_order(send_callback):
+    engine = AsyncCallbackEngine()
+    first = MITMRequest(url='http://callback.local/first')
+    second = MITMRequest(url='http://callback.local/second')
+
+    engine.schedule_callback(0.2, second)
+    engine.schedule_callback(0.1, first)
+
+    assert wait_until(lambda: engine.stats()['completed'] == 2)
+    assert [args[0] for args, _ in send_callback.call_args_list] == [first, second]
+
+
+@patch('inspire_mitmproxy.callbacks.aiohttp', None)
+@patch('inspire_mitmproxy.callbacks.send_callback')
+def test_async_callback_engine_drops_callbacks_over_max_pending(send_callback):
+    engine = AsyncCallbackEngine(max_pending=2)
+    request = MITMRequest(url='http://callback.local')
+
+    assert engine.schedule_callback(60, request)
+    assert engine.schedule_callback(60, request)
+    assert not engine.schedule_callback(0, request)
+
+    expected = {
+        'engine': 'asyncio',
+        'max_pending': 2,
+        'pending': 2,
+        'completed': 0,
+        'failed': 0,
+        'rejected': 1,
+    }
+
+    assert engine.stats() == expected
+    send_callback.assert_not_called()
+
+
+@patch('inspire_mitmproxy.callbacks._engine_name', 'threads')
+def test_set_callback_engine():
+    set_callback_engine('asyncio')
+    assert isinstance(get_callback_engine(), AsyncCallbackEngine)
+
+    set_callback_engine('threads')
+    assert isinstance(get_callback_engine(), CallbackScheduler)
+
+    with raises(ValueError):
+        set_callback_engine('carrier pigeons')
+
+
+def test_session_pool_reuses_idle_sessions_by_host():
+    pool = SessionPool()
+
+    with pool.session('http://callback.local/api/one') as session:
+        pass
+
+    with pool.session('http://callback.local/api/two') as result:
+        assert result is session
+    with pool.session('https://callback.local/api/one') as result:
+        assert result is not session
+    with pool.session('http://other-callback.local/api/one') as result:
+        assert result is not session
+
+
+def test_session_pool_does_not_share_sessions_in_use():
+    pool = SessionPool(pool_size=1)
+
+    with pool.session('http://callback.local') as first:
+        with pool.session('http://callback.local') as second:
+            assert second is not first
+
+    # Only one idle session is kept: the first one given back
+    with pool.session('http://callback.local') as result:
+        assert result is second
+
+
+def test_session_pool_without_keep_alive():
+    pool = SessionPool(keep_alive=False)
+
+    with pool.session('http://callback.local') as session:
+        assert session.headers['Connection'] == 'close'
+
+
+def test_session_pool_ignores_cookies(callback_server_url):
+    pool = SessionPool()
+
+    response = pool.request('GET', callback_server_url + '/callback', timeout=10)
+
+    assert response.cookies['session'] == 'secret'
+    with pool.session(callback_server_url) as session:
+        assert len(session.cookies) == 0
+
+
+def test_session_pool_reuses_connections(callback_server_url):
+    pool = SessionPool(pool_size=2)
+
+    for _ in range(3):
+        response = pool.request('GET', callback_server_url + '/callback', timeout=10)
+        assert response.content == b'ok'
+
+    expected = {
+        'pool_size': 2,
+        'keep_alive': True,
+        'hosts': {
+            callback_server_url: {
+                'requests': 3,
+                'connections': 1,
+            },
+        },
+    }
+
+    assert pool.stats() == expected
+
+
+@patch.dict('os.environ', {
+    'MITM_PROXY_CALLBACK_POOL_SIZE': '4',
+    'MITM_PROXY_CALLBACK_KEEP_ALIVE': '0',
+})
+@patch('inspire_mitmproxy.callbacks._session_pool', None)
+def test_get_session_pool_reads_environment():
+    pool = get_session_pool()
+
+    assert pool.pool_size == 4
+    assert pool.keep_alive is False
+    assert get_session_pool() is pool
@@ -22,10 +22,12 @@
 
 import json
 
+from mitmproxy.test import tflow, tutils
+from mock import patch
 from pytest import fixture, mark, raises
 
 from inspire_mitmproxy.dispatcher import Dispatcher
-from inspire_mitmproxy.errors import NoServicesForRequest
+from inspire_mitmproxy.errors import DoNotIntercept, NoServicesForRequest
 from inspire_mitmproxy.http import MITMHeaders, MITMRequest, MITMResponse
 from inspire_mitmproxy.services.base_service import BaseService
 
@@ -40,6 +42,18 @@ class TestService(BaseService):
         )
 
 
+class PassThroughService(BaseService):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.processed_responses = []
+
+    def process_request(self, request: MITMRequest):
+        raise DoNotIntercept(self.name, request)
+
+    def process_response(self, request: MITMRequest, response: MITMResponse):
+        self.processed_responses.append((request, response))
+
+
 @fixture(scope='module')
 def dispatcher():
     return Dispatcher(
@@ -151,3 +165,50 @@ def test_dispatcher_default_services():
     json_response = json.loads(result.body)
 
     assert json_response == expected
+
+
+def test_dispatcher_response_reuses_request_converted_in_request():
+    service = PassThroughService(name='PassThroughService', hosts_list=['address'])
+    dispatcher = Dispatcher(service_list=[service])
+    flow = tflow.tflow()
+
+    dispatcher.request(flow)
+    flow.response = tutils.tresp()
+
+    with patch.object(Dispatcher, 'is_flow_passed_through', return_value=True), \
+            patch('inspire_mitmproxy.http.MITMRequest.from_mitmproxy') as from_mitmproxy:
+        dispatcher.response(flow)
+
+        from_mitmproxy.assert_not_called()
+
+    assert len(service.processed_responses) == 1
+    request, response = service.processed_responses[0]
+    assert request.url == flow.request.url
+    assert response.body == flow.response.raw_content
+    assert flow not in dispatcher.requests_by_flow
+
+
+def test_dispatcher_request_routes_without_converting_headers():
+    service = PassThroughService(name='PassThroughService', hosts_list=['address.local'])
+    dispatcher = Dispatcher(service_list=[service])
+    flow = tflow.tflow()
+    flow.request.headers['Host'] = 'address.local'
+
+    with patch('inspire_mitmproxy.http.MITMHeaders.from_mitmproxy') as from_mitmproxy:
+        dispatcher.request(flow)
+
+        from_mitmproxy.assert_not_called()
+
+    assert flow.response is None
+
+
+def test_dispatcher_response_converts_request_if_not_seen():
+    service = PassThroughService(name='PassThroughService', hosts_list=['address'])
+    dispatcher = Dispatcher(service_list=[service])
+    flow = tflow.tflow(resp=True)
+
+    with patch.object(Dispatcher, 'is_flow_passed_through', return_value=True):
+        dispatcher.response(flow)
+
+    assert len(service.processed_responses) == 1
+    assert service.processed_responses[0][0].url == flow.request.url
@@ -0,0 +1,89 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of INSPIRE-MITMPROXY.
+# Copyright (C) 2018 CERN.
+#
+# INSPIRE is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# INSPIRE is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with INSPIRE. If not, see <http://www.gnu.org/licenses/>.
+#
+# In applying this license, CERN does not waive the privileges and immunities
+# granted to it by virtue of its status as an Intergovernmental Organization
+# or submit itself to any jurisdiction.
+
+"""Tests for the HostTrie"""
+
+from pytest import fixture, mark, raises
+
+from inspire_mitmproxy.host_trie import HostTrie, host_matches_pattern
+
+
+@mark.parametrize(
+    'host, pattern, expected',
+    [
+        ('cern.ch', 'cern.ch', True),
+        ('CERN.ch', 'cern.CH', True),
+        ('inspirevm13.cern.ch', 'cern.ch', False),
+        ('inspirevm13.cern.ch', '*.cern.ch', True),
+        ('a.b.cern.ch', '*.cern.ch', True),
+        ('cern.ch', '*.cern.ch', False),
+        ('notcern.ch', '*.cern.ch', False),
+        ('anything.local', '*', True),
+    ]
+)
+def test_host_matches_pattern(host, pattern, expected):
+    assert host_matches_pattern(host, pattern) == expected
+
+
+@mark.parametrize('pattern', ['*cern.ch', 'inspirevm*.cern.ch', 'a.*.cern.ch', '*.', '*.*'])
+def test_invalid_host_patterns_are_rejected(pattern):
+    with raises(ValueError):
+        host_matches_pattern('evilcern.ch', pattern)
+    with raises(ValueError):
+        HostTrie().add(pattern, 'value')
+
+
+@fixture
+def host_trie():
+    trie = HostTrie()
+    trie.add('*.cern.ch', 'any cern')
+    trie.add('inspirevm13.cern.ch', 'inspirevm13')
+    trie.add('*.inspirevm13.cern.ch', 'below inspirevm13')
+    trie.add('arxiv.org', 'arxiv')
+    trie.add('arxiv.org', 'arxiv again')
+    trie.add('*.arxiv.org', 'any arxiv')
+    return trie
+
+
+@mark.parametrize(
+    'host, expected',
+    [
+        ('arxiv.org', ['arxiv']),
+        ('export.arxiv.org', ['any arxiv']),
+        ('ARXIV.org', ['arxiv']),
+        ('cern.ch', []),
+        ('home.cern.ch', ['any cern']),
+        ('inspirevm13.cern.ch', ['any cern', 'inspirevm13']),
+        ('a.inspirevm13.cern.ch', ['any cern', 'below inspirevm13']),
+        ('inspirehep.net', []),
+        ('org', []),
+    ]
+)
+def test_host_trie_find(host_trie, host, expected):
+    assert host_trie.find(host) == expected
+
+
+def test_host_trie_catch_all():
+    trie = HostTrie()
+    trie.add('*', 'everything')
+
+    assert trie.find('any.host.local') == ['everything']
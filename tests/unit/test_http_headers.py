@@ -21,6 +21,7 @@
 # or submit itself to any jurisdiction.
 
 from mitmproxy.net.http.headers import Headers
+from pytest import raises
 
 from inspire_mitmproxy.http import MITMHeaders
 
@@ -102,3 +103,80 @@ def test_headers_keys():
     result = TEST_HEADERS.keys()
 
     assert expected == list(result)
+
+
+def test_headers_to_dict_does_not_share_values():
+    result = TEST_HEADERS.to_dict()
+    result['X-Multiple-Values'].append('Value3')
+
+    assert TEST_HEADERS['X-Multiple-Values'] == 'Value1'
+    assert TEST_HEADERS.to_dict() == TEST_DICT_HEADERS
+
+
+def test_headers_have_no_instance_dict():
+    assert not hasattr(TEST_HEADERS, '__dict__')
+
+
+def test_headers_to_mitmproxy_encodes_once():
+    headers = MITMHeaders.from_dict(TEST_DICT_HEADERS)
+    first = headers.to_mitmproxy()
+    first['X-Multiple-Values'] = 'Changed'
+    second = headers.to_mitmproxy()
+
+    assert second == TEST_MITM_HEADERS
+    assert second.fields is headers.encoded_fields
+
+
+def test_headers_view_is_read_only():
+    view = TEST_HEADERS.view()
+
+    assert view['x-multiple-values'] == ('Value1', 'Value2')
+    with raises(TypeError):
+        view['x-multiple-values'] = ('Changed',)
+
+
+def test_headers_getitem_is_case_insensitive():
+    assert TEST_HEADERS['x-multiple-values'] == 'Value1'
+    assert TEST_HEADERS['X-MULTIPLE-VALUES'] == 'Value1'
+    assert 'content-type' in TEST_HEADERS
+    assert 'Content-Length' not in TEST_HEADERS
+
+
+def test_headers_getitem_missing():
+    with raises(KeyError):
+        TEST_HEADERS['Content-Length']
+
+
+def test_headers_get_and_getall():
+    assert TEST_HEADERS.get('content-type') == 'text/plain; charset=ASCII'
+    assert TEST_HEADERS.get('Content-Length') is None
+    assert TEST_HEADERS.get('Content-Length', '0') == '0'
+    assert TEST_HEADERS.getall('x-multiple-values') == ('Value1', 'Value2')
+    assert TEST_HEADERS.getall('Content-Length') == ()
+
+
+def test_headers_keep_case_of_names():
+    headers = MITMHeaders({'WWW-Authenticate': ['Basic'], 'Content-MD5': ['Q2hlY2s=']})
+
+    assert list(headers.keys()) == ['WWW-Authenticate', 'Content-MD5']
+    assert headers.to_dict() == {'WWW-Authenticate': ['Basic'], 'Content-MD5': ['Q2hlY2s=']}
+    assert headers.to_mitmproxy().fields == (
+        (b'WWW-Authenticate', b'Basic'),
+        (b'Content-MD5', b'Q2hlY2s='),
+    )
+
+
+def test_headers_from_mitmproxy_merges_names_differing_in_case():
+    headers = MITMHeaders.from_mitmproxy(Headers(fields=[
+        (b'Accept', b'text/html'),
+        (b'Host', b'example.com'),
+        (b'accept', b'application/xml'),
+    ]))
+
+    assert headers.getall('ACCEPT') == ('text/html', 'application/xml')
+    assert list(headers.keys()) == ['Accept', 'Host']
+
+
+def test_headers_equal_regardless_of_case():
+    assert MITMHeaders({'content-type': ['text/plain']}) == \
+        MITMHeaders({'Content-Type': ['text/plain']})
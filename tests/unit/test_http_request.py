@@ -21,8 +21,9 @@
 # or submit itself to any jurisdiction.
 
 from mitmproxy.http import HTTPRequest
+from mock import patch
 
-from inspire_mitmproxy.http import MITMHeaders, MITMRequest
+from inspire_mitmproxy.http import LazyMITMRequest, MITMHeaders, MITMRequest
 
 
 TEST_REQUEST = MITMRequest(
@@ -139,6 +140,16 @@ def test_request_from_mitmproxy():
     assert result == expected
 
 
+def test_request_from_mitmproxy_converts_headers_once():
+    with patch(
+        'inspire_mitmproxy.http.MITMHeaders.from_mitmproxy',
+        side_effect=MITMHeaders.from_mitmproxy,
+    ) as from_mitmproxy:
+        MITMRequest.from_mitmproxy(TEST_MITM_REQUEST)
+
+        from_mitmproxy.assert_called_once()
+
+
 def test_request_from_mitmproxy_gzip():
     result = MITMRequest.from_mitmproxy(TEST_MITM_REQUEST_GZIP)
     expected = TEST_REQUEST_GZIP
@@ -160,6 +171,16 @@ def test_request_from_dict_gzip():
     assert result == expected
 
 
+def test_request_from_dict_converts_headers_once():
+    with patch(
+        'inspire_mitmproxy.http.MITMHeaders.from_dict',
+        side_effect=MITMHeaders.from_dict,
+    ) as from_dict:
+        MITMRequest.from_dict(TEST_DICT_REQUEST)
+
+        from_dict.assert_called_once()
+
+
 def test_request_to_mitmproxy():
     result = TEST_REQUEST.to_mitmproxy()
     expected = TEST_MITM_REQUEST
@@ -190,3 +211,66 @@ def test_request_to_dict_gzip():
 
 def test_request_with_bytes_body():
     assert TEST_REQUEST == TEST_REQUEST_WITH_BYTES_BODY
+
+
+def test_lazy_request_equals_converted_request():
+    expected = MITMRequest.from_mitmproxy(TEST_MITM_REQUEST)
+    result = LazyMITMRequest(TEST_MITM_REQUEST)
+
+    assert expected == result
+    assert expected.original_encoding == result.original_encoding
+    assert expected.http_version == result.http_version
+    assert expected.to_dict() == result.to_dict()
+
+
+def test_lazy_request_converts_only_accessed_fields():
+    with patch(
+        'inspire_mitmproxy.http.MITMHeaders.from_mitmproxy',
+        side_effect=MITMHeaders.from_mitmproxy,
+    ) as from_mitmproxy:
+        request = LazyMITMRequest(TEST_MITM_REQUEST)
+        assert request.url == TEST_MITM_REQUEST.url
+
+        from_mitmproxy.assert_not_called()
+
+        assert request.headers == request.headers
+        from_mitmproxy.assert_called_once()
+
+
+def test_lazy_request_get_header_does_not_convert_headers():
+    with patch(
+        'inspire_mitmproxy.http.MITMHeaders.from_mitmproxy',
+        side_effect=MITMHeaders.from_mitmproxy,
+    ) as from_mitmproxy:
+        request = LazyMITMRequest(TEST_MITM_REQUEST)
+
+        assert request.get_header('user-agent') == 'python-requests/2.18.4'
+        assert request.get_header('Host') is None
+        from_mitmproxy.assert_not_called()
+
+
+def test_lazy_request_get_header_after_headers_overridden():
+    request = LazyMITMRequest(TEST_MITM_REQUEST)
+    request.headers = MITMHeaders({'Host': ['host_a.local']})
+
+    assert request.get_header('host') == 'host_a.local'
+
+
+def test_lazy_request_fields_can_be_overridden():
+    request = LazyMITMRequest(TEST_MITM_REQUEST)
+    request.body = b'changed'
+
+    assert request.body == b'changed'
+    assert TEST_MITM_REQUEST.raw_content != b'changed'
+
+
+def test_lazy_request_detach_is_not_affected_by_later_changes():
+    mitmproxy_request = TEST_MITM_REQUEST.copy()
+    expected = MITMRequest.from_mitmproxy(mitmproxy_request)
+    result = LazyMITMRequest(mitmproxy_request).detach()
+
+    mitmproxy_request.path = '/mutated'
+    mitmproxy_request.content = b'mutated'
+
+    assert type(result) is MITMRequest
+    assert result == expected
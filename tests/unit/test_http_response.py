@@ -20,10 +20,15 @@
 # granted to it by virtue of its status as an Intergovernmental Organization
 # or submit itself to any jurisdiction.
 
+from pathlib import Path
+from pickle import dumps as pickle_dumps
+from pickle import loads as pickle_loads
+
 from mitmproxy.http import HTTPResponse
 from mitmproxy.net.http.headers import Headers
+from mock import patch
 
-from inspire_mitmproxy.http import MITMHeaders, MITMResponse
+from inspire_mitmproxy.http import LazyMITMResponse, MITMHeaders, MITMResponse
 
 
 TEST_DICT_RESPONSE = {
@@ -144,6 +149,16 @@ def test_response_from_mitmproxy():
     assert result == expected
 
 
+def test_response_from_mitmproxy_converts_headers_once():
+    with patch(
+        'inspire_mitmproxy.http.MITMHeaders.from_mitmproxy',
+        side_effect=MITMHeaders.from_mitmproxy,
+    ) as from_mitmproxy:
+        MITMResponse.from_mitmproxy(TEST_MITM_RESPONSE)
+
+        from_mitmproxy.assert_called_once()
+
+
 def test_response_from_mitmproxy_gzip():
     result = MITMResponse.from_mitmproxy(TEST_MITM_RESPONSE_GZIP)
     expected = TEST_RESPONSE_GZIP
@@ -179,6 +194,17 @@ def test_response_to_mitmproxy_gzip():
     assert result == expected
 
 
+def test_response_to_mitmproxy_copies_are_independent():
+    response = MITMResponse.from_dict(TEST_DICT_RESPONSE)
+    first = response.to_mitmproxy()
+    first.headers['Content-Type'] = 'text/html'
+    first.status_code = 500
+    second = response.to_mitmproxy()
+
+    assert second == TEST_MITM_RESPONSE
+    assert second.raw_content is first.raw_content
+
+
 def test_response_to_dict():
     result = TEST_RESPONSE.to_dict()
     expected = TEST_DICT_RESPONSE
@@ -202,3 +228,99 @@ def test_dict_responses_from_bytes_and_str_equal():
 
 def test_responses_from_bytes_and_str_equal():
     assert TEST_RESPONSE == TEST_RESPONSE_WITH_BYTES_BODY
+
+
+def test_response_from_dict_body_file(tmpdir):
+    tmpdir.join('interaction_0.body').write_binary(b'%PDF-1.4 large body')
+    response_dict = {
+        'status': {
+            'code': 200,
+            'message': 'OK',
+        },
+        'body_file': 'interaction_0.body',
+        'headers': {
+            'Content-Type': ['application/pdf'],
+        },
+    }
+
+    result = MITMResponse.from_dict(response_dict, base_dir=Path(tmpdir.strpath))
+
+    assert result.body == b'%PDF-1.4 large body'
+    assert isinstance(result.body, bytes)
+    assert result.body_path == Path(tmpdir.join('interaction_0.body').strpath)
+    assert result.to_mitmproxy().raw_content == b'%PDF-1.4 large body'
+    assert isinstance(result.to_mitmproxy().raw_content, bytes)
+
+
+def test_response_to_dict_body_file():
+    expected = {
+        'status': {
+            'code': 200,
+            'message': 'OK',
+        },
+        'body_file': 'interaction_0.body',
+        'headers': {
+            'Content-Type': ['application/pdf'],
+        },
+    }
+
+    response = MITMResponse(
+        body=b'%PDF-1.4 large body',
+        headers=MITMHeaders({'Content-Type': ['application/pdf']}),
+    )
+    result = response.to_dict(body_file='interaction_0.body')
+
+    assert expected == result
+
+
+def test_response_body_file_pickle(tmpdir):
+    body_file = tmpdir.join('interaction_0.body')
+    body_file.write_binary(b'%PDF-1.4 large body')
+    response = MITMResponse.from_dict(
+        {
+            'status': {'code': 200, 'message': 'OK'},
+            'body_file': 'interaction_0.body',
+            'headers': {},
+        },
+        base_dir=Path(tmpdir.strpath),
+    )
+
+    pickled = pickle_dumps(response)
+    result = pickle_loads(pickled)
+
+    assert b'large body' not in pickled
+    assert result.body_file == 'interaction_0.body'
+    assert result.body_path is None
+
+    result.load_body_file(Path(tmpdir.strpath))
+
+    assert result.body_path == response.body_path
+    assert response == result
+
+
+def test_lazy_response_equals_converted_response():
+    expected = MITMResponse.from_mitmproxy(TEST_MITM_RESPONSE)
+    result = LazyMITMResponse(TEST_MITM_RESPONSE)
+
+    assert expected == result
+    assert expected.status_message == result.status_message
+    assert expected.to_dict() == result.to_dict()
+
+
+def test_lazy_response_converts_nothing_until_accessed():
+    with patch('inspire_mitmproxy.http.MITMHeaders.from_mitmproxy') as from_mitmproxy:
+        LazyMITMResponse(TEST_MITM_RESPONSE)
+
+        from_mitmproxy.assert_not_called()
+
+
+def test_lazy_response_detach_is_not_affected_by_later_changes():
+    mitmproxy_response = TEST_MITM_RESPONSE.copy()
+    expected = MITMResponse.from_mitmproxy(mitmproxy_response)
+    result = LazyMITMResponse(mitmproxy_response).detach()
+
+    mitmproxy_response.status_code = 500
+    mitmproxy_response.content = b'mutated'
+
+    assert type(result) is MITMResponse
+    assert result == expected
@@ -20,14 +20,18 @@
 # granted to it by virtue of its status as an Intergovernmental Organization
 # or submit itself to any jurisdiction.
 
+from os import environ
 from pathlib import Path
 from re import compile
 from typing import List
 
-from pytest import fixture, mark
+from mock import patch
+from pytest import fixture, mark, raises
+from yaml import YAMLError
 
+from inspire_mitmproxy.errors import InvalidMatchRule
 from inspire_mitmproxy.http import MITMHeaders, MITMRequest, MITMResponse
-from inspire_mitmproxy.interaction import Interaction
+from inspire_mitmproxy.interaction import Interaction, dump_yaml, load_yaml
 
 
 TEST_REQUEST_ALL_FIELDS = MITMRequest(
@@ -235,6 +239,106 @@ def test_interaction_matches_request_negative(
     assert not interaction_all_fields.matches_request(_request)
 
 
+def test_interaction_regex_match_fields_compiled_once(interaction_all_fields: Interaction):
+    first_result = interaction_all_fields.regex_match_fields
+    second_result = interaction_all_fields.regex_match_fields
+
+    assert first_result['body'] is second_result['body']
+    assert first_result['url'] is second_result['url']
+
+
+def test_interaction_regex_match_fields_recompiled_on_match_change(
+    interaction_all_fields: Interaction
+):
+    interaction_all_fields.match = {'regex': {'method': 'PUT|POST'}}
+
+    expected = {'method': compile('PUT|POST')}
+    result = interaction_all_fields.regex_match_fields
+
+    assert expected == result
+
+
+def test_interaction_invalid_regex_raises_on_load():
+    with raises(InvalidMatchRule) as excinfo:
+        Interaction(
+            name='broken_regex',
+            request=TEST_REQUEST,
+            response=TEST_RESPONSE,
+            match={'regex': {'url': 'https://test.local/(unbalanced'}},
+        )
+
+    assert 'broken_regex' in str(excinfo.value)
+    assert 'url' in str(excinfo.value)
+
+
+def test_load_yaml_reads_python_unicode_tag():
+    expected = {'body': 'some text'}
+    result = load_yaml("body: !!python/unicode 'some text'")
+
+    assert expected == result
+
+
+def test_load_yaml_refuses_python_objects():
+    with raises(YAMLError):
+        load_yaml("body: !!python/object/apply:os.system ['true']")
+
+
+def test_dump_yaml_roundtrip_binary_body(tmpdir):
+    interaction = Interaction(
+        name='binary',
+        request=TEST_REQUEST,
+        response=MITMResponse(
+            body=b'\x89PNG\r\n\x1a\n\x00\xff',
+            headers=MITMHeaders({'Content-Type': ['image/png']}),
+        ),
+    )
+    interaction.save_in_dir(Path(tmpdir.strpath))
+
+    result = Interaction.from_file(Path(tmpdir.join('binary.yaml').strpath))
+
+    assert '!!binary' in dump_yaml(interaction.to_dict())
+    assert interaction.response == result.response
+
+
+def test_save_in_dir_large_body_in_body_file(tmpdir):
+    interaction = Interaction(
+        name='interaction_0',
+        request=TEST_REQUEST,
+        response=MITMResponse(
+            body=b'%PDF-1.4' + b'\x00' * 100,
+            headers=MITMHeaders({'Content-Type': ['application/pdf']}),
+        ),
+    )
+
+    with patch.dict(environ, {'MITM_PROXY_BODY_FILE_THRESHOLD': '100'}):
+        interaction.save_in_dir(Path(tmpdir.strpath))
+
+    assert sorted(tmpdir.listdir()) == [
+        tmpdir.join('interaction_0.body'),
+        tmpdir.join('interaction_0.yaml'),
+    ]
+    assert tmpdir.join('interaction_0.body').read_binary() == interaction.response.body
+    assert 'PDF' not in tmpdir.join('interaction_0.yaml').read()
+
+    result = Interaction.from_file(Path(tmpdir.join('interaction_0.yaml').strpath))
+
+    assert result.response.body_path == Path(tmpdir.join('interaction_0.body').strpath)
+    assert interaction == result
+
+
+def test_save_in_dir_small_body_inline(tmpdir):
+    interaction = Interaction(
+        name='interaction_0',
+        request=TEST_REQUEST,
+        response=TEST_RESPONSE,
+    )
+
+    with patch.dict(environ, {'MITM_PROXY_BODY_FILE_THRESHOLD': '100'}):
+        interaction.save_in_dir(Path(tmpdir.strpath))
+
+    assert tmpdir.listdir() == [tmpdir.join('interaction_0.yaml')]
+
+
 @mark.parametrize(
     'interaction_dir_files, expected_next_sequence_number',
     [
@@ -274,6 +378,24 @@ def test_interaction_get_next_sequence_number_in_dir(
     assert expected_next_sequence_number == result
 
 
+def test_interaction_get_next_sequence_number_in_dir_with_pending_names(tmpdir):
+    interaction_dir = tmpdir.mkdir('interactions')
+    interaction_dir.join('interaction_0.yaml').ensure()
+
+    result = Interaction.get_next_sequence_number_in_dir(
+        Path(interaction_dir.strpath),
+        pending_names=['interaction_1', 'interaction_2'],
+    )
+
+    assert result == 3
+
+
+def test_interaction_get_next_sequence_number_in_missing_dir(tmpdir):
+    result = Interaction.get_next_sequence_number_in_dir(Path(tmpdir.strpath) / 'missing')
+
+    assert result == 0
+
+
 @mark.parametrize(
     'interaction_dir_files, expected_next_interaction_name',
     [
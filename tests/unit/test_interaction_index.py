@@ -0,0 +1,126 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of INSPIRE-MITMPROXY.
+# Copyright (C) 2018 CERN.
+#
+# INSPIRE is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# INSPIRE is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with INSPIRE. If not, see <http://www.gnu.org/licenses/>.
+#
+# In applying this license, CERN does not waive the privileges and immunities
+# granted to it by virtue of its status as an Intergovernmental Organization
+# or submit itself to any jurisdiction.
+
+"""Test InteractionIndex"""
+
+from pytest import fixture
+
+from inspire_mitmproxy.http import MITMHeaders, MITMRequest, MITMResponse
+from inspire_mitmproxy.interaction import Interaction
+from inspire_mitmproxy.interaction_index import InteractionIndex
+
+
+def make_interaction(name: str, url: str, method: str = 'GET', **kwargs) -> Interaction:
+    return Interaction(
+        name=name,
+        request=MITMRequest(url=url, method=method),
+        response=MITMResponse(body=name),
+        **kwargs
+    )
+
+
+@fixture
+def interactions():
+    return [
+        make_interaction('exact_a', 'https://host.local/a'),
+        make_interaction('regex_any', 'https://host.local/x', match={'regex': {'url': '.*'}}),
+        make_interaction('exact_b', 'https://host.local/b'),
+        make_interaction('exact_a_again', 'https://host.local/a'),
+        make_interaction(
+            'method_only',
+            'https://host.local/whatever',
+            method='POST',
+            match={'exact': ['method']},
+        ),
+        make_interaction(
+            'headers',
+            'https://host.local/a',
+            match={'exact': ['headers']},
+        ),
+    ]
+
+
+def test_interaction_index_candidates_exact_and_ordered(interactions):
+    index = InteractionIndex(interactions)
+    request = MITMRequest(url='https://host.local/a', method='GET')
+
+    expected = ['exact_a', 'regex_any', 'exact_a_again', 'headers']
+    result = [interaction.name for interaction in index.candidates(request)]
+
+    assert expected == result
+
+
+def test_interaction_index_candidates_by_other_fields(interactions):
+    index = InteractionIndex(interactions)
+    request = MITMRequest(url='https://host.local/b', method='POST')
+
+    expected = ['regex_any', 'method_only', 'headers']
+    result = [interaction.name for interaction in index.candidates(request)]
+
+    assert expected == result
+
+
+def test_interaction_index_candidates_none_indexed(interactions):
+    index = InteractionIndex(interactions)
+    request = MITMRequest(
+        url='https://host.local/c',
+        method='GET',
+        headers=MITMHeaders({'Accept': ['text/plain']}),
+    )
+
+    expected = ['regex_any', 'headers']
+    result = [interaction.name for interaction in index.candidates(request)]
+
+    assert expected == result
+
+
+def test_interaction_index_candidates_exact_body():
+    interactions = [
+        Interaction(
+            name=f'body_{i}',
+            request=MITMRequest(url='https://host.local/a', method='POST', body=f'body {i}'),
+            response=MITMResponse(),
+        )
+        for i in range(3)
+    ]
+    index = InteractionIndex(interactions)
+    request = MITMRequest(url='https://host.local/a', method='POST', body='body 1')
+
+    expected = ['body_1']
+    result = [interaction.name for interaction in index.candidates(request)]
+
+    assert expected == result
+
+
+def test_interaction_index_unknown_exact_field_is_always_candidate():
+    interactions = [
+        make_interaction('exact_a', 'https://host.local/a'),
+        make_interaction('unknown_field', 'https://host.local/b', match={'exact': ['uri']}),
+    ]
+    index = InteractionIndex(interactions)
+    request = MITMRequest(url='https://host.local/a', method='GET')
+
+    expected = ['exact_a', 'unknown_field']
+    result = [interaction.name for interaction in index.candidates(request)]
+
+    assert expected == result
+    assert interactions[0].matches_request(request)
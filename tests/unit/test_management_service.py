@@ -28,7 +28,13 @@ from os import environ
 from mock import patch
 from pytest import fixture, mark, raises
 
-from inspire_mitmproxy.errors import InvalidRequest, InvalidServiceParams, InvalidServiceType
+from inspire_mitmproxy.callbacks import get_callback_engine
+from inspire_mitmproxy.errors import (
+    InvalidMatchRule,
+    InvalidRequest,
+    InvalidServiceParams,
+    InvalidServiceType
+)
 from inspire_mitmproxy.http import MITMHeaders, MITMRequest, MITMResponse
 from inspire_mitmproxy.service_list import ServiceList
 from inspire_mitmproxy.services.base_service import BaseService
@@ -37,11 +43,15 @@ from inspire_mitmproxy.services.management_service import ManagementService
 
 @fixture(scope='function')
 def management_service() -> ManagementService:
-    mgmt_service = ManagementService(
-        ServiceList([
-            BaseService(name='TestService', hosts_list=['test-service.local']),
-        ])
-    )
+    with patch(
+        'inspire_mitmproxy.services.management_service.get_current_version',
+        return_value='0.0.1',
+    ):
+        mgmt_service = ManagementService(
+            ServiceList([
+                BaseService(name='TestService', hosts_list=['test-service.local']),
+            ])
+        )
 
     mgmt_service.config = {
         'active_scenario': None,
@@ -201,6 +211,135 @@ def test_management_service_get_scenarios(fake_scenarios_dir, management_service
     assert expected == result
 
 
+def test_management_service_get_scenarios_with_query(fake_scenarios_dir, management_service):
+    response = management_service.process_request(
+        MITMRequest(
+            url='http://mitm-manager.local/scenarios?prefix=scenario&service=B&limit=1',
+            method='GET',
+        )
+    )
+    expected = {
+        'scenario2': {
+            'responses': {
+                'B': ['1.yaml', '2.yaml', '3.yaml'],
+            }
+        },
+    }
+
+    assert response.status_code == 200
+    assert json.loads(response.body) == expected
+
+
+@mark.parametrize('query', ['limit=ten', 'offset=-1'])
+def test_management_service_get_scenarios_invalid_query_raises(
+    fake_scenarios_dir,
+    management_service,
+    query,
+):
+    with raises(InvalidRequest):
+        management_service.process_request(
+            MITMRequest(url='http://mitm-manager.local/scenarios?' + query, method='GET')
+        )
+
+
+@fixture
+def fixture_scenarios_dir(request):
+    with patch.dict(environ, {
+        'SCENARIOS_PATH': str(request.fspath.join('../fixtures/scenarios'))
+    }):
+        yield
+
+
+@mark.parametrize('processes', [0, 2])
+def test_management_service_preload_scenarios(
+    fixture_scenarios_dir,
+    management_service,
+    processes,
+):
+    response = management_service.process_request(
+        MITMRequest(
+            url='http://mitm-manager.local/scenarios/preload',
+            method='POST',
+            body=json.dumps({'scenarios': ['test_scenario', 'unknown'], 'processes': processes}),
+        )
+    )
+    result = json.loads(response.body)
+
+    assert response.status_code == 201
+    assert result['scenarios']['test_scenario']['interactions'] == {'TestService': 2}
+    assert result['scenarios']['unknown']['interactions'] == {}
+    assert result['seconds'] >= result['scenarios']['test_scenario']['seconds'] >= 0
+    assert 'memory' in result['scenarios']['test_scenario']
+
+    service = management_service.services.find_service_for_request(
+        MITMRequest(url='http://test-service.local', headers=MITMHeaders({
+            'Host': ['test-service.local'],
+        }))
+    )
+    service.set_active_scenario('test_scenario')
+
+    with patch('inspire_mitmproxy.interaction.Interaction.from_file') as from_file, \
+            patch('inspire_mitmproxy.services.base_service.InteractionIndex') as index:
+        assert len(service.get_interactions_for_active_scenario()) == 2
+        service.get_cached_active_scenario().index
+
+        from_file.assert_not_called()
+        index.assert_not_called()
+
+
+def test_management_service_preload_scenarios_reports_errors(
+    fixture_scenarios_dir,
+    management_service,
+):
+    def preload_scenario(scenario, loader=None):
+        if scenario == 'broken':
+            raise InvalidMatchRule('interaction_0', 'url', '(', 'unterminated subpattern')
+        return 1
+
+    with patch(
+        'inspire_mitmproxy.services.base_service.BaseService.preload_scenario',
+        side_effect=preload_scenario,
+    ):
+        result = management_service.preload_scenarios(scenarios=['broken', 'test_scenario'])
+
+    assert result['scenarios']['broken']['error'].startswith('InvalidMatchRule: ')
+    assert 'interactions' not in result['scenarios']['broken']
+    assert result['scenarios']['test_scenario']['interactions'] == {'TestService': 1}
+
+
+def test_management_service_preload_all_scenarios(fixture_scenarios_dir, management_service):
+    result = management_service.preload_scenarios()
+
+    assert 'test_scenario' in result['scenarios']
+
+
+@mark.parametrize(
+    'request_body',
+    [
+        'definitely not valid JSON',
+        '["parses as valid json, but is not a dict"]',
+        '{"scenarios": "test_scenario"}',
+        '{"processes": "many"}',
+    ],
+)
+def test_management_service_preload_scenarios_malformed_raises(management_service, request_body):
+    with raises(InvalidRequest):
+        management_service.post_preload(MITMRequest(
+            method='POST',
+            url='http://mitm-manager.local/scenarios/preload',
+            body=request_body,
+        ))
+
+
+def test_management_service_preloads_scenarios_on_startup(fixture_scenarios_dir):
+    with patch.dict(environ, {'SCENARIOS_PRELOAD': 'test_scenario, unknown'}), \
+            patch.object(ManagementService, 'preload_scenarios') as preload_scenarios:
+        preload_scenarios.return_value = {'scenarios': {}, 'seconds': 0, 'memory': 0}
+        ManagementService(ServiceList([]))
+
+    preload_scenarios.assert_called_once_with(scenarios=['test_scenario', 'unknown'], processes=0)
+
+
 def test_management_service_get_config(management_service):
     result = management_service.get_config()
     expected = {
@@ -211,6 +350,30 @@ def test_management_service_get_config(management_service):
     assert expected == result
 
 
+@patch('inspire_mitmproxy.services.management_service.get_session_pool')
+@patch('inspire_mitmproxy.services.management_service.get_callback_engine')
+def test_management_service_get_callbacks(
+    get_callback_engine,
+    get_session_pool,
+    management_service,
+):
+    get_callback_engine.return_value.stats.return_value = {'pending': 2, 'completed': 5}
+    get_session_pool.return_value.stats.return_value = {'pool_size': 8, 'hosts': {}}
+
+    response = management_service.process_request(
+        MITMRequest(url='http://mitm-manager.local/callbacks', method='GET')
+    )
+
+    expected = {
+        'pending': 2,
+        'completed': 5,
+        'sessions': {'pool_size': 8, 'hosts': {}},
+    }
+
+    assert response.status_code == 200
+    assert json.loads(response.body) == expected
+
+
 def test_management_service_put_config(management_service):
     management_service.put_config(
         MITMRequest(
@@ -231,11 +394,24 @@ def test_management_service_put_config(management_service):
         assert service.active_scenario == 'a scenario'
 
 
+@patch('inspire_mitmproxy.callbacks._engine_name', 'threads')
+def test_management_service_put_config_selects_callback_engine(management_service):
+    management_service.put_config(
+        MITMRequest(
+            url='http://mitm-manager.local/config',
+            body='{"callback_engine": "asyncio"}'
+        )
+    )
+
+    assert get_callback_engine().name == 'asyncio'
+
+
 @mark.parametrize(
     'request_body',
     [
         'definitely not valid JSON',
         '["parses as valid json, but is not a dict update"]',
+        '{"callback_engine": "carrier pigeons"}',
     ],
 )
 def test_management_service_put_config_malformed_raises(management_service, request_body):
@@ -361,12 +537,41 @@ def test_management_service_set_recording_malformed_raises(management_service, r
         management_service.set_recording(request)
 
 
-def test_management_service_build_response(management_service):
+def test_management_service_get_version(management_service):
+    response = management_service.process_request(
+        MITMRequest(url='http://mitm-manager.local/version', method='GET')
+    )
+
+    assert response.status_code == 200
+    assert json.loads(response.body) == {'version': '0.0.1'}
+
+
+def test_management_service_computes_version_once(management_service):
     with patch(
         'inspire_mitmproxy.services.management_service.get_current_version',
-        return_value='0.0.1',
-    ):
-        result = management_service.build_response(201, json_message={'test': 'message'})
+    ) as get_current_version:
+        management_service.build_response(200, json_message={})
+        management_service.build_response(200, json_message={})
+
+    get_current_version.assert_not_called()
+
+
+@patch('inspire_mitmproxy.services.management_service.get_recording_writer')
+def test_management_service_flush_recordings(get_recording_writer, management_service):
+    get_recording_writer.return_value.pending = 0
+    get_recording_writer.return_value.failed = 2
+
+    response = management_service.process_request(
+        MITMRequest(url='http://mitm-manager.local/record/flush', method='POST')
+    )
+
+    assert response.status_code == 201
+    assert json.loads(response.body) == {'pending': 0, 'failed': 2}
+    get_recording_writer.return_value.flush.assert_called_once_with()
+
+
+def test_management_service_build_response(management_service):
+    result = management_service.build_response(201, json_message={'test': 'message'})
 
     expected = MITMResponse(
         body='{\n  "test": "message"\n}',
@@ -381,11 +586,7 @@ def test_management_service_build_response(management_service):
 
 
 def test_management_service_build_response_empty_object_body(management_service):
-    with patch(
-        'inspire_mitmproxy.services.management_service.get_current_version',
-        return_value='0.0.1',
-    ):
-        result = management_service.build_response(200, json_message={})
+    result = management_service.build_response(200, json_message={})
 
     expected = MITMResponse(
         body='{}',
@@ -0,0 +1,178 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of INSPIRE-MITMPROXY.
+# Copyright (C) 2018 CERN.
+#
+# INSPIRE is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# INSPIRE is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with INSPIRE. If not, see <http://www.gnu.org/licenses/>.
+#
+# In applying this license, CERN does not waive the privileges and immunities
+# granted to it by virtue of its status as an Intergovernmental Organization
+# or submit itself to any jurisdiction.
+
+
+"""Test the parallel loader of interactions"""
+
+from concurrent.futures.process import BrokenProcessPool
+from pathlib import Path
+from pickle import dumps, loads
+
+from mock import Mock, patch
+from pytest import fixture, mark, raises
+
+from inspire_mitmproxy.errors import InvalidMatchRule
+from inspire_mitmproxy.interaction import Interaction
+from inspire_mitmproxy.parallel_loader import ParallelLoader, get_parallel_loader
+from inspire_mitmproxy.services.base_service import BaseService
+
+
+@fixture
+def interaction_paths(request, tmpdir):
+    fixtures_dir = request.fspath.join('../fixtures/scenarios/test_scenario')
+    scenario_dir = tmpdir.join('scenarios').join('test_scenario')
+    fixtures_dir.copy(scenario_dir)
+    service_dir = Path(scenario_dir.strpath) / 'TestService'
+
+    for number in range(2, 12):
+        (service_dir / f'interaction_{number}.yaml').write_text(
+            (service_dir / 'interaction_0.yaml').read_text()
+        )
+
+    return list(service_dir.iterdir())
+
+
+@mark.parametrize('use_processes', [False, True])
+def test_parallel_loader_load(interaction_paths, use_processes):
+    loader = ParallelLoader(workers=2, use_processes=use_processes, min_files=1)
+
+    try:
+        result = loader.load(reversed(interaction_paths))
+    finally:
+        loader.shutdown()
+
+    sorted_paths = sorted(interaction_paths)
+
+    assert list(result) == [path.name for path in sorted_paths]
+    for path in sorted_paths:
+        mtime, interaction = result[path.name]
+        assert mtime == path.stat().st_mtime_ns
+        assert interaction == Interaction.from_file(path)
+
+
+@mark.parametrize('use_processes', [False, True])
+def test_parallel_loader_load_body_file(interaction_paths, use_processes):
+    service_dir = interaction_paths[0].parent
+    (service_dir / 'interaction_0.body').write_bytes(b'%PDF-1.4 large body')
+    (service_dir / 'interaction_0.yaml').write_text(
+        (service_dir / 'interaction_0.yaml').read_text().replace(
+            'body: !!python/unicode \'{"value": "response1"}\'',
+            'body_file: interaction_0.body',
+        )
+    )
+    loader = ParallelLoader(workers=2, use_processes=use_processes, min_files=1)
+
+    try:
+        result = loader.load(interaction_paths)
+    finally:
+        loader.shutdown()
+
+    _, interaction = result['interaction_0.yaml']
+    assert interaction.response.body_path == (service_dir / 'interaction_0.body').resolve()
+    assert interaction.response.body == b'%PDF-1.4 large body'
+
+
+def test_parallel_loader_load_few_files_in_process(interaction_paths):
+    loader = ParallelLoader(workers=2)
+
+    result = loader.load(interaction_paths)
+
+    assert len(result) == len(interaction_paths)
+    assert loader._executor is None
+
+
+def test_parallel_loader_worker_error_keeps_pool(interaction_paths):
+    invalid_path = interaction_paths[0].parent / 'interaction_1.yaml'
+    invalid_path.write_text(
+        interaction_paths[0].read_text() + "match:\n  regex:\n    url: '('\n"
+    )
+    loader = ParallelLoader(workers=2, use_processes=True, min_files=1)
+
+    try:
+        with raises(InvalidMatchRule):
+            loader.load(interaction_paths)
+
+        invalid_path.unlink()
+        result = loader.load(path for path in interaction_paths if path != invalid_path)
+    finally:
+        loader.shutdown()
+
+    assert len(result) == len(interaction_paths) - 1
+
+
+def test_parallel_loader_replaces_broken_pool(interaction_paths):
+    loader = ParallelLoader(workers=2, use_processes=True, min_files=1)
+    broken_executor = Mock()
+    broken_executor.map.side_effect = BrokenProcessPool()
+    loader._executor = broken_executor
+
+    result = loader.load(interaction_paths)
+
+    assert len(result) == len(interaction_paths)
+    assert loader._executor is None
+    broken_executor.shutdown.assert_called_once_with(wait=False)
+
+
+def test_errors_can_be_pickled():
+    error = InvalidMatchRule('interaction_0', 'url', '(', 'missing ), unterminated subpattern')
+
+    result = loads(dumps(error))
+
+    assert type(result) is InvalidMatchRule
+    assert str(result) == str(error)
+    assert result.http_status_code == error.http_status_code
+
+
+@patch.dict('os.environ', {})
+@patch('inspire_mitmproxy.parallel_loader._loader', None)
+def test_get_parallel_loader_defaults_to_in_process():
+    loader = get_parallel_loader()
+
+    assert loader.workers == 1
+    assert loader.use_processes is False
+
+
+@patch.dict('os.environ', {
+    'MITM_PROXY_LOADER_WORKERS': '3',
+    'MITM_PROXY_LOADER_POOL': 'thread',
+})
+@patch('inspire_mitmproxy.parallel_loader._loader', None)
+def test_get_parallel_loader_reads_environment():
+    loader = get_parallel_loader()
+
+    assert loader.workers == 3
+    assert loader.use_processes is False
+    assert get_parallel_loader() is loader
+
+
+def test_get_cached_scenario_with_loader(interaction_paths):
+    service = BaseService(name='TestService', hosts_list=['host_a.local'])
+    loader = ParallelLoader(workers=2, use_processes=False, min_files=1)
+
+    try:
+        cached = service.get_cached_scenario(interaction_paths[0].parent, loader=loader)
+    finally:
+        loader.shutdown()
+
+    assert [interaction.name for interaction in cached.interactions] == [
+        path.stem for path in sorted(interaction_paths)
+    ]
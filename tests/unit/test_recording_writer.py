@@ -0,0 +1,149 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of INSPIRE-MITMPROXY.
+# Copyright (C) 2018 CERN.
+#
+# INSPIRE is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# INSPIRE is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with INSPIRE. If not, see <http://www.gnu.org/licenses/>.
+#
+# In applying this license, CERN does not waive the privileges and immunities
+# granted to it by virtue of its status as an Intergovernmental Organization
+# or submit itself to any jurisdiction.
+
+
+"""Test the background writer of recordings"""
+
+from pathlib import Path
+from threading import Event
+
+from mock import Mock, patch
+
+from inspire_mitmproxy.http import MITMRequest, MITMResponse
+from inspire_mitmproxy.interaction import Interaction
+from inspire_mitmproxy.recording_writer import RecordingWriter, get_recording_writer
+
+
+def make_interaction(name: str) -> Interaction:
+    return Interaction(
+        name=name,
+        request=MITMRequest(url='http://test.local/', method='GET'),
+        response=MITMResponse(status_code=204),
+    )
+
+
+@patch('inspire_mitmproxy.recording_writer.fsync_path')
+def test_recording_writer_saves_interactions(fsync_path, tmpdir):
+    directory = Path(tmpdir.strpath) / 'scenario' / 'TestService'
+    writer = RecordingWriter()
+    on_saved = Mock()
+
+    writer.save(make_interaction('interaction_0'), directory, on_saved=on_saved)
+    writer.save(make_interaction('interaction_1'), directory)
+
+    assert writer.flush(timeout=5)
+    assert writer.pending == 0
+    assert sorted(path.name for path in directory.iterdir()) == [
+        'interaction_0.yaml',
+        'interaction_1.yaml',
+    ]
+    assert Interaction.from_file(directory / 'interaction_0.yaml') == \
+        make_interaction('interaction_0')
+    on_saved.assert_called_once_with()
+    synced = {call[0][0] for call in fsync_path.call_args_list}
+    assert synced == {
+        directory / 'interaction_0.yaml',
+        directory / 'interaction_1.yaml',
+        directory,
+        directory.parent,
+        directory.parent.parent,
+    }
+
+
+@patch('inspire_mitmproxy.recording_writer.fsync_path')
+def test_recording_writer_syncs_once_per_batch(fsync_path, tmpdir):
+    directory = Path(tmpdir.strpath)
+    writer = RecordingWriter(batch_size=10)
+    first_saved = Event()
+    release = Event()
+
+    def block_writer():
+        first_saved.set()
+        release.wait(5)
+
+    writer.save(make_interaction('interaction_0'), directory, on_saved=block_writer)
+    assert first_saved.wait(5)
+
+    for number in range(1, 11):
+        writer.save(make_interaction(f'interaction_{number}'), directory)
+
+    assert writer.pending == 11
+    assert writer.pending_names(directory) == [
+        'interaction_0',
+        *[f'interaction_{number}' for number in range(1, 11)],
+    ]
+    assert writer.pending_names(directory / 'other') == []
+
+    release.set()
+    assert writer.flush(timeout=5)
+    assert len(list(directory.iterdir())) == 11
+    # Each file once, and the directory once per batch
+    assert fsync_path.call_count == 11 + 2
+
+
+@patch('inspire_mitmproxy.recording_writer.fsync_path')
+def test_recording_writer_without_fsync(fsync_path, tmpdir):
+    writer = RecordingWriter(fsync=False)
+
+    writer.save(make_interaction('interaction_0'), Path(tmpdir.strpath))
+
+    assert writer.flush(timeout=5)
+    fsync_path.assert_not_called()
+
+
+def test_recording_writer_fsyncs_for_real(tmpdir):
+    directory = Path(tmpdir.strpath) / 'TestService'
+    writer = RecordingWriter()
+
+    writer.save(make_interaction('interaction_0'), directory)
+
+    assert writer.flush(timeout=5)
+    assert writer.failed == 0
+    assert (directory / 'interaction_0.yaml').exists()
+
+
+def test_recording_writer_continues_after_errors(tmpdir):
+    not_a_directory = Path(tmpdir.strpath) / 'file'
+    not_a_directory.touch()
+    writer = RecordingWriter(fsync=False)
+    on_saved = Mock()
+
+    writer.save(make_interaction('interaction_0'), not_a_directory, on_saved=on_saved)
+    writer.save(make_interaction('interaction_0'), Path(tmpdir.strpath))
+
+    assert writer.flush(timeout=5)
+    assert (Path(tmpdir.strpath) / 'interaction_0.yaml').exists()
+    assert writer.failed == 1
+    on_saved.assert_not_called()
+
+
+@patch.dict('os.environ', {
+    'MITM_PROXY_RECORDING_BATCH': '5',
+    'MITM_PROXY_RECORDING_FSYNC': '0',
+})
+@patch('inspire_mitmproxy.recording_writer._writer', None)
+def test_get_recording_writer_reads_environment():
+    writer = get_recording_writer()
+
+    assert writer.batch_size == 5
+    assert writer.fsync is False
+    assert get_recording_writer() is writer
@@ -0,0 +1,206 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of INSPIRE-MITMPROXY.
+# Copyright (C) 2018 CERN.
+#
+# INSPIRE is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# INSPIRE is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with INSPIRE. If not, see <http://www.gnu.org/licenses/>.
+#
+# In applying this license, CERN does not waive the privileges and immunities
+# granted to it by virtue of its status as an Intergovernmental Organization
+# or submit itself to any jurisdiction.
+
+"""Test scenario bundles"""
+
+from os import environ, utime
+from pathlib import Path
+from shutil import move
+
+from mock import patch
+from pytest import fixture
+
+from inspire_mitmproxy.http import MITMHeaders, MITMRequest, MITMResponse
+from inspire_mitmproxy.interaction import Interaction
+from inspire_mitmproxy.scenario_bundle import (
+    BUNDLE_FILE_NAME,
+    BUNDLE_FORMAT_VERSION,
+    BUNDLE_HEADER,
+    BUNDLE_MAGIC,
+    build_bundle,
+    load_bundled_service
+)
+from inspire_mitmproxy.services.base_service import BaseService
+
+
+@fixture
+def scenario_dir(request, tmpdir) -> Path:
+    fixtures_dir = request.fspath.join('../fixtures/scenarios/test_scenario')
+    scenario_dir = tmpdir.join('scenarios').join('test_scenario')
+    fixtures_dir.copy(scenario_dir)
+    return Path(scenario_dir.strpath)
+
+
+def test_build_bundle(scenario_dir: Path):
+    result = build_bundle(scenario_dir)
+
+    assert result == scenario_dir / BUNDLE_FILE_NAME
+    assert sorted(path.name for path in scenario_dir.iterdir()) == [
+        'TestService',
+        BUNDLE_FILE_NAME,
+    ]
+
+
+def test_load_bundled_service(scenario_dir: Path):
+    service_dir = scenario_dir / 'TestService'
+    build_bundle(scenario_dir)
+
+    result = load_bundled_service(scenario_dir, 'TestService')
+
+    assert result is not None
+    assert list(result.keys()) == ['interaction_0.yaml', 'interaction_1.yaml']
+    for file_name, (mtime, interaction) in result.items():
+        assert mtime == (service_dir / file_name).stat().st_mtime_ns
+        assert interaction == Interaction.from_file(service_dir / file_name)
+
+
+def save_interaction_with_body_file(service_dir: Path) -> Interaction:
+    interaction = Interaction(
+        name='interaction_2',
+        request=MITMRequest(url='http://host_a.local/document.pdf'),
+        response=MITMResponse(
+            body=b'%PDF-1.4' + b'\x00' * 100,
+            headers=MITMHeaders({'Content-Type': ['application/pdf']}),
+        ),
+    )
+    with patch.dict(environ, {'MITM_PROXY_BODY_FILE_THRESHOLD': '100'}):
+        interaction.save_in_dir(service_dir)
+
+    return interaction
+
+
+def test_load_bundled_service_body_file_after_move(scenario_dir: Path):
+    interaction = save_interaction_with_body_file(scenario_dir / 'TestService')
+    build_bundle(scenario_dir)
+    moved_dir = scenario_dir.parent / 'moved_scenario'
+    move(str(scenario_dir), str(moved_dir))
+
+    result = load_bundled_service(moved_dir, 'TestService')
+
+    assert result is not None
+    _, bundled_interaction = result['interaction_2.yaml']
+    assert bundled_interaction.response.body_path == \
+        (moved_dir / 'TestService' / 'interaction_2.body').resolve()
+    assert bundled_interaction == interaction
+
+
+def test_load_bundled_service_missing_body_file(scenario_dir: Path):
+    save_interaction_with_body_file(scenario_dir / 'TestService')
+    build_bundle(scenario_dir)
+    (scenario_dir / 'TestService' / 'interaction_2.body').unlink()
+
+    with patch('inspire_mitmproxy.scenario_bundle.logger') as logger:
+        result = load_bundled_service(scenario_dir, 'TestService')
+
+        logger.warning.assert_called_once()
+
+    assert result is None
+
+
+def test_load_bundled_service_unknown_service(scenario_dir: Path):
+    build_bundle(scenario_dir)
+
+    assert load_bundled_service(scenario_dir, 'OtherService') is None
+
+
+def test_load_bundled_service_no_bundle(scenario_dir: Path):
+    assert load_bundled_service(scenario_dir, 'TestService') is None
+
+
+def test_load_bundled_service_not_a_bundle(scenario_dir: Path):
+    (scenario_dir / BUNDLE_FILE_NAME).write_bytes(b'garbage')
+
+    assert load_bundled_service(scenario_dir, 'TestService') is None
+
+
+def test_load_bundled_service_other_format_version(scenario_dir: Path):
+    bundle_path = build_bundle(scenario_dir)
+    bundle = bundle_path.read_bytes()
+    bundle_path.write_bytes(bundle.replace(BUNDLE_HEADER, BUNDLE_MAGIC + b'0\n', 1))
+
+    assert load_bundled_service(scenario_dir, 'TestService') is None
+
+
+def test_bundle_format_version_matches_pickled_attributes():
+    """Bump BUNDLE_FORMAT_VERSION, and update this test, when the pickled attributes change."""
+    interaction = Interaction(
+        name='interaction_0',
+        request=MITMRequest(url='http://host_a.local/api'),
+        response=MITMResponse(),
+    )
+
+    assert BUNDLE_FORMAT_VERSION == 4
+    assert sorted(vars(interaction)) == [
+        '_match',
+        '_regex_match_fields',
+        'callbacks',
+        'max_replays',
+        'name',
+        'request',
+        'response',
+    ]
+    assert MITMHeaders.__slots__ == ('headers', 'names', '_encoded_fields')
+    assert MITMRequest.__slots__ == (
+        'url',
+        'method',
+        'body',
+        'headers',
+        'original_encoding',
+        'http_version',
+    )
+    assert MITMResponse.__slots__ == (
+        'status_code',
+        'status_message',
+        '_body',
+        'headers',
+        'original_encoding',
+        'http_version',
+        'body_file',
+        'body_path',
+        '_mitmproxy_template',
+    )
+
+
+def test_base_service_loads_bundle_without_parsing(scenario_dir: Path):
+    build_bundle(scenario_dir)
+    service = BaseService(name='TestService', hosts_list=['host_a.local'])
+
+    with patch('inspire_mitmproxy.interaction.Interaction.from_file') as from_file:
+        result = service.get_interactions_in_scenario(scenario_dir / 'TestService')
+
+        from_file.assert_not_called()
+
+    assert [interaction.name for interaction in result] == ['interaction_0', 'interaction_1']
+
+
+def test_base_service_parses_files_changed_after_bundle(scenario_dir: Path):
+    build_bundle(scenario_dir)
+    service = BaseService(name='TestService', hosts_list=['host_a.local'])
+
+    changed_file = scenario_dir / 'TestService' / 'interaction_1.yaml'
+    changed_file.write_text(changed_file.read_text().replace('response2', 'changed'))
+    stat = changed_file.stat()
+    utime(str(changed_file), ns=(stat.st_atime_ns, stat.st_mtime_ns + 1000000000))
+
+    result = service.get_interactions_in_scenario(scenario_dir / 'TestService')
+
+    assert result[1].request.body == b'{"value": "changed"}'
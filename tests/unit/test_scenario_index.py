@@ -0,0 +1,170 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of INSPIRE-MITMPROXY.
+# Copyright (C) 2018 CERN.
+#
+# INSPIRE is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# INSPIRE is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with INSPIRE. If not, see <http://www.gnu.org/licenses/>.
+#
+# In applying this license, CERN does not waive the privileges and immunities
+# granted to it by virtue of its status as an Intergovernmental Organization
+# or submit itself to any jurisdiction.
+
+
+"""Test the scenario index"""
+
+from os import utime
+from pathlib import Path
+
+from mock import patch
+from pytest import fixture
+
+from inspire_mitmproxy import scenario_index
+from inspire_mitmproxy.scenario_index import (
+    ScenarioIndex,
+    get_scenario_index,
+    refresh_indexed_service
+)
+
+
+def make_old(*paths: Path):
+    for path in paths:
+        utime(str(path), ns=(10**18, 10**18))
+
+
+@fixture
+def scenarios_dir(tmpdir) -> Path:
+    scenarios = Path(tmpdir.mkdir('scenarios').strpath)
+
+    for scenario, service, file_name in [
+        ('scenario1', 'A', '1.yaml'),
+        ('scenario1', 'A', '2.yaml'),
+        ('scenario2', 'A', '1.yaml'),
+        ('scenario2', 'B', '1.yaml'),
+        ('scenario2', 'B', 'response_0.body'),
+        ('other', 'B', '1.yaml'),
+    ]:
+        (scenarios / scenario / service).mkdir(parents=True, exist_ok=True)
+        (scenarios / scenario / service / file_name).touch()
+
+    (scenarios / 'scenario2' / 'scenario.bundle').touch()
+
+    return scenarios
+
+
+def test_scenario_index_get_scenarios(scenarios_dir: Path):
+    index = ScenarioIndex(scenarios_dir)
+    index.refresh()
+
+    expected = {
+        'other': {'responses': {'B': ['1.yaml']}},
+        'scenario1': {'responses': {'A': ['1.yaml', '2.yaml']}},
+        'scenario2': {'responses': {'A': ['1.yaml'], 'B': ['1.yaml']}},
+    }
+
+    result = index.get_scenarios()
+
+    assert result == expected
+    assert list(result) == ['other', 'scenario1', 'scenario2']
+
+
+def test_scenario_index_get_scenarios_filters_and_pages(scenarios_dir: Path):
+    index = ScenarioIndex(scenarios_dir)
+    index.refresh()
+
+    assert list(index.get_scenarios(prefix='scen')) == ['scenario1', 'scenario2']
+    assert list(index.get_scenarios(prefix='scenario2')) == ['scenario2']
+    assert index.get_scenarios(prefix='unknown') == {}
+    assert index.get_scenarios(service='B') == {
+        'other': {'responses': {'B': ['1.yaml']}},
+        'scenario2': {'responses': {'B': ['1.yaml']}},
+    }
+    assert list(index.get_scenarios(offset=1)) == ['scenario1', 'scenario2']
+    assert list(index.get_scenarios(offset=1, limit=1)) == ['scenario1']
+    assert list(index.get_scenarios(prefix='scen', service='A', limit=1)) == ['scenario1']
+
+
+def test_scenario_index_refresh_picks_up_changes(scenarios_dir: Path):
+    index = ScenarioIndex(scenarios_dir)
+    index.refresh()
+
+    (scenarios_dir / 'scenario1' / 'A' / '3.yaml').touch()
+    (scenarios_dir / 'scenario3' / 'C').mkdir(parents=True)
+    (scenarios_dir / 'scenario3' / 'C' / '1.yaml').touch()
+    (scenarios_dir / 'other' / 'B' / '1.yaml').unlink()
+    index.refresh()
+
+    expected = {
+        'other': {'responses': {'B': []}},
+        'scenario1': {'responses': {'A': ['1.yaml', '2.yaml', '3.yaml']}},
+        'scenario2': {'responses': {'A': ['1.yaml'], 'B': ['1.yaml']}},
+        'scenario3': {'responses': {'C': ['1.yaml']}},
+    }
+
+    assert index.get_scenarios() == expected
+
+
+def test_scenario_index_refresh_lists_only_changed_dirs(scenarios_dir: Path):
+    make_old(*scenarios_dir.glob('*/*'), *scenarios_dir.glob('*'), scenarios_dir)
+    index = ScenarioIndex(scenarios_dir)
+    index.refresh()
+
+    (scenarios_dir / 'scenario1' / 'A' / '3.yaml').touch()
+
+    with patch.object(scenario_index, 'scandir', wraps=scenario_index.scandir) as scandir:
+        index.refresh()
+
+    scandir.assert_called_once_with(scenarios_dir / 'scenario1' / 'A')
+    assert index.get_scenarios(prefix='scenario1') == {
+        'scenario1': {'responses': {'A': ['1.yaml', '2.yaml', '3.yaml']}},
+    }
+
+
+def test_scenario_index_recently_changed_dirs_are_listed_again(scenarios_dir: Path):
+    index = ScenarioIndex(scenarios_dir)
+    index.refresh()
+    mtime = (scenarios_dir / 'scenario1' / 'A').stat().st_mtime_ns
+
+    (scenarios_dir / 'scenario1' / 'A' / '3.yaml').touch()
+    utime(str(scenarios_dir / 'scenario1' / 'A'), ns=(mtime, mtime))
+    index.refresh()
+
+    assert index.get_scenarios(prefix='scenario1') == {
+        'scenario1': {'responses': {'A': ['1.yaml', '2.yaml', '3.yaml']}},
+    }
+
+
+def test_scenario_index_missing_dir(tmpdir):
+    index = ScenarioIndex(Path(tmpdir.strpath) / 'missing')
+    index.refresh()
+
+    assert index.get_scenarios() == {}
+
+
+def test_refresh_indexed_service(scenarios_dir: Path):
+    make_old(*scenarios_dir.glob('*/*'), *scenarios_dir.glob('*'), scenarios_dir)
+
+    with patch.object(scenario_index, '_indexes', {}):
+        index = get_scenario_index(scenarios_dir)
+        index.refresh()
+
+        new_file = scenarios_dir / 'scenario1' / 'A' / '3.yaml'
+        new_file.touch()
+        make_old(new_file.parent)
+
+        refresh_indexed_service(scenarios_dir, 'scenario1', 'A')
+
+        assert get_scenario_index(scenarios_dir) is index
+        assert index.get_scenarios(prefix='scenario1') == {
+            'scenario1': {'responses': {'A': ['1.yaml', '2.yaml', '3.yaml']}},
+        }
@@ -26,6 +26,7 @@ from typing import Any, Dict
 
 from pytest import mark
 
+from inspire_mitmproxy.http import MITMHeaders, MITMRequest
 from inspire_mitmproxy.service_list import ServiceList
 from inspire_mitmproxy.services.base_service import BaseService
 from inspire_mitmproxy.services.whitelist_service import WhitelistService
@@ -138,3 +139,87 @@ def test_service_list_to_dict():
     result_service = service_list.to_list()
 
     assert expected_description == result_service
+
+
+class AllHostsService(BaseService):
+    def handles_request(self, request: MITMRequest) -> bool:
+        return request.url.endswith('/all')
+
+
+@mark.parametrize(
+    'url, host, expected_service_name',
+    [
+        ('http://host-a.local/', 'host-a.local', 'ServiceA'),
+        ('http://host-a.local/', 'host-a.local:8080', 'ServiceA'),
+        ('http://host-b.local/', 'host-b.local', 'ServiceB'),
+        ('http://host-b.local/', None, 'ServiceB'),
+        ('http://host-c.local/', 'host-c.local', 'ServiceC'),
+        ('http://host-c.local/all', 'host-c.local', 'AllHostsService'),
+        ('http://host-a.local/all', 'host-a.local', 'ServiceA'),
+        ('http://unknown.local/', 'unknown.local', None),
+    ],
+    ids=[
+        'by Host header',
+        'by Host header with port',
+        'first service with the host wins',
+        'by URL if no Host header',
+        'after service with custom routing',
+        'service with custom routing has priority',
+        'service with custom routing has lower priority',
+        'none',
+    ]
+)
+def test_service_list_find_service_for_request(url, host, expected_service_name):
+    service_list = ServiceList([
+        BaseService(name='ServiceA', hosts_list=['host-a.local']),
+        BaseService(name='ServiceB', hosts_list=['host-b.local']),
+        AllHostsService(name='AllHostsService', hosts_list=[]),
+        BaseService(name='ServiceC', hosts_list=['host-c.local', 'host-b.local']),
+    ])
+    request = MITMRequest(
+        url=url,
+        headers=MITMHeaders({'Host': [host]} if host else {}),
+    )
+
+    result = service_list.find_service_for_request(request)
+
+    assert expected_service_name == (result.name if result else None)
+
+
+def test_service_list_routing_follows_changes():
+    service_list = ServiceList([
+        BaseService(name='ServiceA', hosts_list=['host-a.local']),
+    ])
+    request = MITMRequest(url='http://host-b.local/')
+
+    assert service_list.find_service_for_request(request) is None
+
+    service_list.replace_from_descrition([
+        {'type': 'BaseService', 'name': 'ServiceB', 'hosts_list': ['host-b.local']},
+    ])
+    assert service_list.find_service_for_request(request).name == 'ServiceB'
+
+    service_list.prepend(BaseService(name='ServiceC', hosts_list=['host-b.local']))
+    assert service_list.find_service_for_request(request).name == 'ServiceC'
+
+
+@mark.parametrize(
+    'host, expected_service_name',
+    [
+        ('inspirevm13.cern.ch', 'RTService'),
+        ('home.cern.ch', 'CERNService'),
+        ('cern.ch', None),
+        ('labs.inspirehep.net', 'CERNService'),
+    ],
+)
+def test_service_list_find_service_for_request_wildcards(host, expected_service_name):
+    service_list = ServiceList([
+        BaseService(name='RTService', hosts_list=['inspirevm13.cern.ch']),
+        BaseService(name='CERNService', hosts_list=['*.cern.ch', '*.inspirehep.net']),
+        BaseService(name='OtherService', hosts_list=['home.cern.ch']),
+    ])
+    request = MITMRequest(url=f'http://{host}/', headers=MITMHeaders({'Host': [host]}))
+
+    result = service_list.find_service_for_request(request)
+
+    assert expected_service_name == (result.name if result else None)
@@ -0,0 +1,142 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of INSPIRE-MITMPROXY.
+# Copyright (C) 2018 CERN.
+#
+# INSPIRE is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# INSPIRE is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with INSPIRE. If not, see <http://www.gnu.org/licenses/>.
+#
+# In applying this license, CERN does not waive the privileges and immunities
+# granted to it by virtue of its status as an Intergovernmental Organization
+# or submit itself to any jurisdiction.
+
+
+"""Test the scenarios watchers"""
+
+from pathlib import Path
+from queue import Empty, Queue
+from typing import Set
+
+from mock import patch
+from pytest import fixture, mark, param, raises
+
+from inspire_mitmproxy import watcher
+from inspire_mitmproxy.dispatcher import Dispatcher
+from inspire_mitmproxy.watcher import (
+    InotifyWatcher,
+    PollingWatcher,
+    inotify_available,
+    is_watched,
+    start_watcher
+)
+
+
+def wait_for_paths(changes: Queue, expected: Set[Path], timeout: float = 5) -> Set[Path]:
+    seen: Set[Path] = set()
+    try:
+        while not expected <= seen:
+            seen.add(changes.get(timeout=timeout))
+    except Empty:
+        pass
+
+    return seen
+
+
+@fixture
+def scenarios_dir(tmpdir) -> Path:
+    scenarios = Path(tmpdir.mkdir('scenarios').strpath)
+    (scenarios / 'scenario1' / 'A').mkdir(parents=True)
+    (scenarios / 'scenario1' / 'A' / 'interaction_0.yaml').write_text('old')
+    return scenarios
+
+
+@fixture(params=[
+    'poll',
+    param('inotify', marks=mark.skipif(not inotify_available(), reason='inotify not available')),
+])
+def running_watcher(request, scenarios_dir):
+    changes: Queue = Queue()
+    running = start_watcher(scenarios_dir, changes.put, method=request.param, interval=0.05)
+
+    yield running, changes
+
+    running.stop()
+
+
+def test_watcher_reports_changed_files(running_watcher, scenarios_dir: Path):
+    running, changes = running_watcher
+    service_dir = scenarios_dir / 'scenario1' / 'A'
+
+    (service_dir / 'interaction_0.yaml').write_text('new, and with a different size')
+    (service_dir / 'interaction_1.yaml').write_text('created')
+    (scenarios_dir / 'scenario2' / 'B').mkdir(parents=True)
+    (scenarios_dir / 'scenario2' / 'B' / 'interaction_0.yaml').write_text('created')
+
+    expected = {
+        service_dir / 'interaction_0.yaml',
+        service_dir / 'interaction_1.yaml',
+        scenarios_dir / 'scenario2',
+        scenarios_dir / 'scenario2' / 'B' / 'interaction_0.yaml',
+    }
+
+    assert expected <= wait_for_paths(changes, expected)
+
+
+def test_watcher_reports_deleted_files(running_watcher, scenarios_dir: Path):
+    running, changes = running_watcher
+    deleted_file = scenarios_dir / 'scenario1' / 'A' / 'interaction_0.yaml'
+
+    deleted_file.unlink()
+
+    assert deleted_file in wait_for_paths(changes, {deleted_file})
+
+
+def test_is_watched(scenarios_dir: Path):
+    running = PollingWatcher(scenarios_dir, lambda path: None)
+    running.start()
+
+    assert is_watched(scenarios_dir / 'scenario1' / 'A')
+    assert not is_watched(scenarios_dir.parent / 'other')
+
+    running.stop()
+
+    assert not is_watched(scenarios_dir / 'scenario1' / 'A')
+
+
+def test_start_watcher_unknown_method(scenarios_dir: Path):
+    with raises(ValueError):
+        start_watcher(scenarios_dir, lambda path: None, method='carrier pigeons')
+
+
+@mark.skipif(not inotify_available(), reason='inotify not available')
+def test_inotify_watcher_missing_dir(scenarios_dir: Path):
+    with raises(FileNotFoundError):
+        InotifyWatcher(scenarios_dir / 'missing', lambda path: None)
+
+
+def test_dispatcher_starts_watcher(scenarios_dir: Path):
+    with patch.dict('os.environ', {
+        'SCENARIOS_PATH': str(scenarios_dir),
+        'MITM_PROXY_WATCH_SCENARIOS': 'poll',
+    }):
+        dispatcher = Dispatcher()
+
+    assert isinstance(dispatcher.watcher, PollingWatcher)
+    assert dispatcher.watcher.path == scenarios_dir
+    assert dispatcher.watcher in watcher._watchers
+
+    dispatcher.watcher.stop()
+
+
+def test_dispatcher_does_not_watch_by_default():
+    assert Dispatcher().watcher is None